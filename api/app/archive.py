@@ -0,0 +1,318 @@
+# api/app/archive.py
+#
+# Archivo de eventos en S3 (lo usa scripts/cleanup_and_archive.py). Los eventos se escriben en
+# streaming como NDJSON comprimido con gzip y se suben con multipart upload, así la memoria usada
+# es constante (un buffer de ARCHIVE_PART_SIZE_BYTES) sea cual sea el número de filas. Cada objeto
+# se describe en el manifest de su ejecución: filas, rango de fechas y bloques, watchers y tokens.
+# Con ARCHIVE_FORMAT=parquet (requiere pyarrow) se escribe Parquet columnar, un objeto por mes y
+# token, con columnas tipadas y estadísticas min/max por row group.
+# S3_ENDPOINT_URL permite apuntar a un S3 compatible (MinIO, moto) en local.
+
+import gzip
+import json
+import logging
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import boto3
+
+from .config import settings
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Solo hace falta para Parquet (está en requirements.txt); NDJSON funciona sin él
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = "archived_events"
+# S3 exige partes de al menos 5 MiB (salvo la última).
+_MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def get_s3_client():
+    return boto3.client("s3", region_name=settings.AWS_REGION, endpoint_url=settings.S3_ENDPOINT_URL or None)
+
+
+def _json_default(o):
+    if isinstance(o, datetime):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return str(o)
+    raise TypeError(f"Tipo no serializable: {type(o).__name__}")
+
+
+class MultipartUploadWriter:
+    """
+    Objeto tipo fichero (solo escritura) que sube a S3 por partes a medida que se llena el buffer.
+    close() completa la subida; abort() la cancela para no dejar partes huérfanas en el bucket.
+    """
+
+    def __init__(self, s3_client, bucket: str, key: str, content_type: str, content_encoding: Optional[str] = None):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(settings.ARCHIVE_PART_SIZE_BYTES, _MIN_PART_SIZE)
+        self.bytes_written = 0
+        self.closed = False
+        self._buffer = bytearray()
+        self._parts: List[Dict[str, Any]] = []
+        extra = {"ContentEncoding": content_encoding} if content_encoding else {}
+        self._upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type, **extra)["UploadId"]
+
+    def _upload_part(self) -> None:
+        part_number = len(self._parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+            PartNumber=part_number, Body=bytes(self._buffer),
+        )
+        self._parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+        self._buffer.clear()
+
+    def write(self, data: bytes) -> int:
+        self._buffer.extend(data)
+        self.bytes_written += len(data)
+        if len(self._buffer) >= self.part_size:
+            self._upload_part()
+        return len(data)
+
+    def tell(self) -> int:
+        return self.bytes_written
+
+    def flush(self) -> None:
+        # Las partes se suben al llenar el buffer; gzip llama a flush() y no hay nada que hacer.
+        pass
+
+    def close(self) -> None:
+        # Idempotente: pyarrow cierra el fichero al cerrar el ParquetWriter y después lo cerramos nosotros.
+        if self.closed:
+            return
+        self.closed = True
+        if self._buffer or not self._parts:
+            self._upload_part()
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+            MultipartUpload={"Parts": self._parts},
+        )
+
+    def abort(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        except Exception as e_abort:
+            logger.warning(f"⚠️ [ARCHIVE] No se pudo abortar el multipart upload de {self.key}: {e_abort!r}")
+
+
+class _ObjectStats:
+    """Lo que contiene un objeto archivado, acumulado fila a fila para el manifest."""
+
+    def __init__(self):
+        self.rows = 0
+        self.created_at_min: Optional[datetime] = None
+        self.created_at_max: Optional[datetime] = None
+        self.block_min: Optional[int] = None
+        self.block_max: Optional[int] = None
+        self.watcher_ids = set()
+        self.token_addresses = set()
+
+    def add(self, row: Dict[str, Any]) -> None:
+        self.rows += 1
+        created_at, block_number = row.get("created_at"), row.get("block_number")
+        if created_at is not None:
+            self.created_at_min = created_at if self.created_at_min is None else min(self.created_at_min, created_at)
+            self.created_at_max = created_at if self.created_at_max is None else max(self.created_at_max, created_at)
+        if block_number is not None:
+            self.block_min = block_number if self.block_min is None else min(self.block_min, block_number)
+            self.block_max = block_number if self.block_max is None else max(self.block_max, block_number)
+        if row.get("watcher_id") is not None:
+            self.watcher_ids.add(row["watcher_id"])
+        if row.get("token_address_observed"):
+            self.token_addresses.add(row["token_address_observed"])
+
+    def to_manifest(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "created_at_min": self.created_at_min.isoformat() if self.created_at_min else None,
+            "created_at_max": self.created_at_max.isoformat() if self.created_at_max else None,
+            "block_number_min": self.block_min,
+            "block_number_max": self.block_max,
+            "watcher_ids": sorted(self.watcher_ids),
+            "token_addresses": sorted(self.token_addresses),
+        }
+
+
+def write_ndjson_archive(s3_client, bucket: str, key: str, rows: Iterable[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Escribe `rows` (un iterable, p. ej. un cursor de servidor) como NDJSON gzip en s3://bucket/key.
+    Devuelve la entrada de manifest del objeto, o None si no había filas (no se crea el objeto).
+    """
+    iterator: Iterator[Dict[str, Any]] = iter(rows)
+    first_row = next(iterator, None)
+    if first_row is None:
+        return None
+
+    stats = _ObjectStats()
+    writer = MultipartUploadWriter(s3_client, bucket, key, content_type="application/x-ndjson", content_encoding="gzip")
+    try:
+        with gzip.GzipFile(fileobj=writer, mode="wb") as gz:
+            for row in _chain_first(first_row, iterator):
+                gz.write(json.dumps(row, default=_json_default, separators=(",", ":")).encode())
+                gz.write(b"\n")
+                stats.add(row)
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+    entry = {"key": key, "format": "ndjson.gz", "bytes": writer.bytes_written, **stats.to_manifest()}
+    logger.info(f"📦 [ARCHIVE] s3://{bucket}/{key}: {stats.rows} eventos, {writer.bytes_written} bytes comprimidos.")
+    return entry
+
+
+def _chain_first(first_row: Dict[str, Any], iterator: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    yield first_row
+    yield from iterator
+
+
+def effective_format() -> str:
+    """ARCHIVE_FORMAT configurado. Falla si se pidió Parquet y pyarrow no está instalado, en vez de cambiar de formato."""
+    if settings.ARCHIVE_FORMAT == "parquet" and pq is None:
+        raise RuntimeError("ARCHIVE_FORMAT=parquet requiere pyarrow (ver requirements.txt).")
+    return settings.ARCHIVE_FORMAT
+
+
+def archive_order_by(fmt: str) -> str:
+    """ORDER BY con el que hay que leer las filas: Parquet las necesita agrupadas por mes y token."""
+    if fmt == "parquet":
+        return "date_trunc('month', created_at AT TIME ZONE 'UTC'), lower(token_address_observed), created_at, id"
+    return "created_at, id"
+
+
+def _parquet_schema():
+    # token_address_lc no se archiva: es una columna generada a partir de token_address_observed.
+    return pa.schema([
+        ("id", pa.int64()),
+        ("watcher_id", pa.int64()),
+        ("token_address_observed", pa.string()),
+        ("from_address", pa.string()),
+        ("to_address", pa.string()),
+        # Numeric(78, 18) en Postgres: decimal256 llega a 76 dígitos (58 enteros), de sobra para cantidades reales.
+        ("amount", pa.decimal256(76, 18)),
+        ("transaction_hash", pa.string()),
+        ("log_index", pa.int32()),
+        ("block_number", pa.int64()),
+        ("usd_value", pa.decimal128(20, 4)),
+        ("token_name", pa.string()),
+        ("token_symbol", pa.string()),
+        ("created_at", pa.timestamp("us", tz="UTC")),
+    ])
+
+
+def _parquet_group(row: Dict[str, Any]) -> Tuple[str, str]:
+    """(mes, token) del objeto Parquet al que va la fila."""
+    created_at = row["created_at"]
+    month = created_at.astimezone(timezone.utc).strftime("%Y-%m") if created_at.tzinfo else created_at.strftime("%Y-%m")
+    return month, (row.get("token_address_observed") or "unknown").lower()
+
+
+class _ParquetObject:
+    """Un objeto Parquet en curso: acumula filas y escribe un row group cada ARCHIVE_PARQUET_ROW_GROUP_ROWS."""
+
+    def __init__(self, s3_client, bucket: str, key: str, month: str, token_address: str):
+        self.key = key
+        self.month = month
+        self.token_address = token_address
+        self.schema = _parquet_schema()
+        self.stats = _ObjectStats()
+        self._rows: List[Dict[str, Any]] = []
+        self._upload = MultipartUploadWriter(s3_client, bucket, key, content_type="application/vnd.apache.parquet")
+        self._writer = pq.ParquetWriter(self._upload, self.schema, compression="zstd", write_statistics=True)
+
+    def add(self, row: Dict[str, Any]) -> None:
+        self._rows.append(row)
+        self.stats.add(row)
+        if len(self._rows) >= settings.ARCHIVE_PARQUET_ROW_GROUP_ROWS:
+            self._write_row_group()
+
+    def _write_row_group(self) -> None:
+        table = pa.Table.from_pylist(self._rows, schema=self.schema)
+        self._writer.write_table(table, row_group_size=len(self._rows))
+        self._rows.clear()
+
+    def close(self) -> Dict[str, Any]:
+        if self._rows:
+            self._write_row_group()
+        self._writer.close()
+        self._upload.close()
+        return {
+            "key": self.key, "format": "parquet", "month": self.month, "token_address": self.token_address,
+            "bytes": self._upload.bytes_written, **self.stats.to_manifest(),
+        }
+
+    def abort(self) -> None:
+        self._upload.abort()
+
+
+def write_parquet_archive(s3_client, bucket: str, prefix: str, name: str, rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Escribe `rows` (ordenadas con archive_order_by("parquet")) como un objeto Parquet por mes y token:
+    {prefix}/month=YYYY-MM/token=0x.../{name}.parquet. Solo hay un objeto abierto a la vez, así la
+    memoria queda acotada a un row group. Devuelve las entradas de manifest de los objetos escritos.
+    """
+    entries: List[Dict[str, Any]] = []
+    current: Optional[_ParquetObject] = None
+    current_group = None
+    try:
+        for row in rows:
+            group = _parquet_group(row)
+            if group != current_group:
+                if current is not None:
+                    entries.append(current.close())
+                current_group = group
+                month, token_address = group
+                current = _ParquetObject(
+                    s3_client, bucket, f"{prefix}/month={month}/token={token_address}/{name}.parquet", month, token_address,
+                )
+            current.add(row)
+        if current is not None:
+            entries.append(current.close())
+    except BaseException:
+        if current is not None:
+            current.abort()
+        raise
+
+    if entries:
+        rows_total = sum(entry["rows"] for entry in entries)
+        bytes_total = sum(entry["bytes"] for entry in entries)
+        logger.info(f"📦 [ARCHIVE] {name}: {rows_total} eventos en {len(entries)} objeto(s) Parquet, {bytes_total} bytes.")
+    return entries
+
+
+def write_archive(s3_client, bucket: str, run_id: str, name: str, rows: Iterable[Dict[str, Any]], fmt: str) -> List[Dict[str, Any]]:
+    """Archiva las filas de la tabla/partición `name` en el formato `fmt`. Devuelve las entradas de manifest."""
+    prefix = f"{ARCHIVE_PREFIX}/{run_id}"
+    if fmt == "parquet":
+        return write_parquet_archive(s3_client, bucket, prefix, name, rows)
+    entry = write_ndjson_archive(s3_client, bucket, f"{prefix}/{name}.ndjson.gz", rows)
+    return [entry] if entry else []
+
+
+def write_manifest(s3_client, bucket: str, run_id: str, entries: List[Dict[str, Any]], cutoff: datetime) -> str:
+    """Sube el manifest de una ejecución: qué objetos se escribieron y qué contiene cada uno."""
+    key = f"{ARCHIVE_PREFIX}/{run_id}/manifest.json"
+    manifest = {
+        "run_id": run_id,
+        "cutoff": cutoff.isoformat(),
+        "objects": entries,
+    }
+    s3_client.put_object(
+        Bucket=bucket, Key=key,
+        Body=json.dumps(manifest, default=_json_default, indent=2).encode(),
+        ContentType="application/json",
+    )
+    logger.info(f"🧾 [ARCHIVE] Manifest s3://{bucket}/{key} con {len(entries)} objeto(s).")
+    return key
@@ -1,6 +1,7 @@
 # api/app/auth.py
 
 import re
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Optional, List
 
@@ -11,6 +12,7 @@ from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
 from . import crud, models, schemas
+from .cache import TTLCache
 from .database import get_db
 from .config import settings
 from .email_utils import send_reset_email, send_verification_email
@@ -20,6 +22,34 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 router = APIRouter()
 
+
+@dataclass(frozen=True)
+class Principal:
+    """Lo mínimo de un usuario que hace falta para autorizar una petición."""
+    id: int
+    email: str
+    is_active: bool
+
+    @property
+    def is_admin(self) -> bool:
+        return self.email == settings.ADMIN_EMAIL
+
+
+# Principals por subject del token. Los usuarios inexistentes no se guardan (negative_ttl=0),
+# así un registro nuevo se ve al instante; los cambios de plan, estado o contraseña invalidan su entrada.
+_principal_cache = TTLCache(
+    maxsize=settings.AUTH_PRINCIPAL_CACHE_MAX_ENTRIES,
+    ttl=settings.AUTH_PRINCIPAL_CACHE_TTL_SECONDS,
+    negative_ttl=0,
+)
+
+def invalidate_principal(email: Optional[str]) -> None:
+    if email:
+        _principal_cache.invalidate(email)
+
+def get_principal_cache_stats():
+    return _principal_cache.stats()
+
 def validate_password_strength(password: str) -> Optional[str]:
     if len(password) < 8:
         return "Password must be at least 8 characters long."
@@ -45,31 +75,44 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
-async def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+async def get_current_principal(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> Principal:
+    """
+    Resuelve el usuario del token sin cargar watchers ni suscripción. Para endpoints que
+    solo necesitan id / is_admin; los que necesitan el usuario completo usan get_current_user.
+    """
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         email: Optional[str] = payload.get("sub")
         # Ensure the token is an access token
         if payload.get("type") not in (None, "access") or email is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
-        
-    user = crud.get_user_by_email(db, email=email)
-    if not user:
-        raise credentials_exception
+        raise _credentials_exception()
+
+    principal = _principal_cache.get_or_load(email, lambda: crud.get_principal_by_email(db, email=email))
+    if not principal:
+        raise _credentials_exception()
 
     # Check if user is active *after* getting the user, for login purposes
-    if not user.is_active:
+    if not principal.is_active:
          raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, 
             detail="Your account has been paused by an administrator. Please contact support."
         )
+    return principal
+
+async def get_current_user(db: Session = Depends(get_db), principal: Principal = Depends(get_current_principal)):
+    user = crud.get_user(db, user_id=principal.id)
+    if not user:
+        invalidate_principal(principal.email)
+        raise _credentials_exception()
     return user
 
 @router.post("/register", response_model=schemas.UserRead, status_code=status.HTTP_201_CREATED, tags=["Authentication"])
@@ -115,6 +158,7 @@ async def verify_email(token: str, db: Session = Depends(get_db)):
         
     user.is_active = True
     db.commit()
+    invalidate_principal(user.email)
     return {"msg": "Email verified successfully."}
 
 
@@ -170,7 +214,7 @@ def delete_current_user_account(
     crud.delete_user_by_id(db, user_id=current_user.id)
     return
 
-def get_current_admin_user(current_user: models.User = Depends(get_current_user)):
+def get_current_admin_user(current_user: Principal = Depends(get_current_principal)) -> Principal:
     if not current_user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -215,4 +259,5 @@ async def reset_password(payload: schemas.ResetPasswordRequest = Body(...), db:
     hashed = get_password_hash(payload.new_password)
     user.hashed_password = hashed
     db.commit()
+    invalidate_principal(user.email)
     return {"msg": "Password has been reset successfully."}
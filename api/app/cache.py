@@ -0,0 +1,133 @@
+# api/app/cache.py
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _InFlight:
+    """Carga en curso para una clave: los demás hilos esperan su resultado."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class TTLCache:
+    """
+    Caché en memoria thread-safe con expiración por TTL, tamaño acotado (LRU)
+    y coalescencia de fallos: si varios hilos piden a la vez una clave que no
+    está en caché, solo uno ejecuta el loader y el resto reutiliza su resultado.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: Optional[float] = None):
+        self.maxsize = max(int(maxsize), 1)
+        self.ttl = float(ttl)
+        # Los resultados None (token desconocido, error del proveedor) se guardan menos tiempo.
+        self.negative_ttl = float(negative_ttl) if negative_ttl is not None else self.ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, _InFlight] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _get_fresh(self, key: Hashable, now: float) -> Tuple[bool, Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= now:
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def _store(self, key: Hashable, value: Any, now: float) -> None:
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (now + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            found, value = self._get_fresh(key, time.monotonic())
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._store(key, value, time.monotonic())
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Devuelve el valor en caché para `key` o lo obtiene con `loader()`.
+        Las llamadas concurrentes para la misma clave comparten una única carga.
+        """
+        with self._lock:
+            found, value = self._get_fresh(key, time.monotonic())
+            if found:
+                self.hits += 1
+                return value
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                self.misses += 1
+                inflight = _InFlight()
+                self._inflight[key] = inflight
+                is_leader = True
+            else:
+                self.coalesced += 1
+                is_leader = False
+
+        if not is_leader:
+            inflight.event.wait()
+            if inflight.error is not None:
+                raise inflight.error
+            return inflight.value
+
+        try:
+            value = loader()
+        except BaseException as e:
+            inflight.error = e
+            raise
+        else:
+            inflight.value = value
+            with self._lock:
+                self._store(key, value, time.monotonic())
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            inflight.event.set()
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
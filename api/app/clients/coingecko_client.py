@@ -2,50 +2,70 @@
 import requests
 import time
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable, List, Tuple
 from ..config import settings # Importamos la configuración para acceder a la API Key
+from ..rate_limiter import coingecko_budget
+from ..cache import TTLCache
+from . import http_client
 
 # Configuración del logger para este módulo
 logger = logging.getLogger(__name__)
 
 COINGECKO_API_URL = "https://api.coingecko.com/api/v3"
 
+# Caché de datos de mercado por (platform, contrato), compartida por la API y el poller.
+_market_data_cache = TTLCache(
+    maxsize=settings.COINGECKO_CACHE_MAX_ENTRIES,
+    ttl=settings.COINGECKO_CACHE_TTL_SECONDS,
+    negative_ttl=settings.COINGECKO_CACHE_NEGATIVE_TTL_SECONDS,
+)
+
 def get_historical_price_usd(token_address: str, timestamp: int, platform: str = "ethereum") -> Optional[float]:
     """
     Obtiene el precio histórico en USD de un token para un timestamp dado usando CoinGecko.
     """
+    series = get_price_series_usd(token_address, timestamp - 300, timestamp + 300, platform=platform)
+    if not series:
+        logger.info(f"  ℹ️ [COINGECKO_CLIENT_INFO] No se encontró precio histórico para {token_address.lower()}.")
+        return None
+    return min(series, key=lambda point: abs(point[0] - timestamp))[1]
+
+def get_price_series_usd(token_address: str, from_timestamp: int, to_timestamp: int, platform: str = "ethereum") -> Optional[List[Tuple[int, float]]]:
+    """
+    Obtiene la serie de precios USD de un token entre dos timestamps (una sola petición a
+    market_chart/range). Devuelve [(timestamp_unix_segundos, precio), ...] ordenada, o None si hay un error.
+    La granularidad la decide CoinGecko según el rango (5 min, horaria o diaria).
+    """
     contract_address_lower = token_address.lower()
-    from_timestamp = timestamp - 300
-    to_timestamp = timestamp + 300
 
     url = f"{COINGECKO_API_URL}/coins/{platform}/contract/{contract_address_lower}/market_chart/range"
     params = {
         "vs_currency": "usd",
-        "from": str(from_timestamp),
-        "to": str(to_timestamp),
+        "from": str(int(from_timestamp)),
+        "to": str(int(to_timestamp)),
         "x_cg_demo_api_key": settings.COINGECKO_API_KEY # <-- AÑADIDO: Usamos la API Key
     }
 
-    logger.info(f"  📞 [COINGECKO_CLIENT] Consultando precio para {contract_address_lower} cerca de {timestamp}...")
+    logger.info(f"  📞 [COINGECKO_CLIENT] Consultando serie de precios para {contract_address_lower} entre {from_timestamp} y {to_timestamp}...")
 
     try:
-        response = requests.get(url, params=params, timeout=15)
+        response = http_client.get(url, params=params, timeout=15, budget=coingecko_budget)
         
         if response.status_code == 429:
             logger.warning("  ⚠️ [COINGECKO_CLIENT_WARN] Rate limited por CoinGecko. Esperando 10 segundos...")
             time.sleep(10)
-            response = requests.get(url, params=params, timeout=15)
+            response = http_client.get(url, params=params, timeout=15, budget=coingecko_budget)
 
         response.raise_for_status()
         data = response.json()
 
-        if data.get("prices") and len(data["prices"]) > 0:
-            price = data["prices"][0][1]
-            logger.info(f"  ✅ [COINGECKO_CLIENT] Precio encontrado: {price:.4f} USD")
-            return float(price)
-        else:
-            logger.info(f"  ℹ️ [COINGECKO_CLIENT_INFO] No se encontró precio histórico para {contract_address_lower}.")
-            return None
+        series = sorted(
+            (int(point[0] // 1000), float(point[1]))
+            for point in data.get("prices") or []
+            if point and len(point) >= 2 and point[1] is not None
+        )
+        logger.info(f"  ✅ [COINGECKO_CLIENT] {len(series)} punto(s) de precio para {contract_address_lower}.")
+        return series
 
     except requests.exceptions.RequestException as e:
         logger.error(f"  ❌ [COINGECKO_CLIENT_ERROR] Error de red al consultar precio para {contract_address_lower}: {e}")
@@ -58,7 +78,95 @@ def get_historical_price_usd(token_address: str, timestamp: int, platform: str =
 def get_token_market_data(contract_address: str, platform: str = "ethereum") -> Optional[Dict[str, Any]]:
     """
     Obtiene el precio, market cap y volumen de 24h para un token en la red especificada.
+    Los resultados se cachean durante COINGECKO_CACHE_TTL_SECONDS y las peticiones
+    concurrentes para el mismo token comparten una única llamada a CoinGecko.
+    """
+    key = (platform, contract_address.lower())
+    return _market_data_cache.get_or_load(key, lambda: _fetch_token_market_data(key[1], platform))
+
+
+def get_token_prices(contract_addresses: Iterable[str], platform: str = "ethereum") -> Dict[str, Dict[str, Any]]:
     """
+    Obtiene en bloque precio, market cap y volumen de 24h de varios tokens usando
+    /simple/token_price, en trozos de COINGECKO_BATCH_SIZE contratos por petición.
+    Devuelve {contrato_en_minúsculas: datos}; los tokens que CoinGecko no devuelve se omiten
+    (el llamador puede recurrir a get_token_market_data). Los resultados alimentan la misma
+    caché que get_token_market_data.
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    pending: List[str] = []
+    for address in dict.fromkeys(a.lower() for a in contract_addresses if a):
+        cached = _market_data_cache.get((platform, address))
+        if cached is not None:
+            results[address] = cached
+        else:
+            pending.append(address)
+
+    batch_size = max(1, settings.COINGECKO_BATCH_SIZE)
+    for i in range(0, len(pending), batch_size):
+        chunk = pending[i:i + batch_size]
+        for address, market_data in _fetch_token_prices_chunk(chunk, platform).items():
+            _market_data_cache.set((platform, address), market_data)
+            results[address] = market_data
+
+    if pending:
+        resolved = sum(1 for address in pending if address in results)
+        logger.info(f"  ✅ [COINGECKO_CLIENT] Precios en bloque: {resolved} de {len(pending)} token(s) consultados resueltos.")
+    return results
+
+
+def _fetch_token_prices_chunk(contract_addresses: List[str], platform: str) -> Dict[str, Dict[str, Any]]:
+    url = f"{COINGECKO_API_URL}/simple/token_price/{platform}"
+    params = {
+        "contract_addresses": ",".join(contract_addresses),
+        "vs_currencies": "usd",
+        "include_market_cap": "true",
+        "include_24hr_vol": "true",
+        "x_cg_demo_api_key": settings.COINGECKO_API_KEY,
+    }
+
+    logger.info(f"  📞 [COINGECKO_CLIENT] Consultando precios en bloque para {len(contract_addresses)} token(s)...")
+
+    try:
+        response = http_client.get(url, params=params, timeout=10, budget=coingecko_budget)
+
+        if response.status_code == 429:
+            logger.warning("  ⚠️ [COINGECKO_CLIENT_WARN] Rate limited por CoinGecko. Esperando 10 segundos...")
+            time.sleep(10)
+            response = http_client.get(url, params=params, timeout=10, budget=coingecko_budget)
+
+        response.raise_for_status()
+        data = response.json()
+    except requests.exceptions.RequestException as e:
+        logger.error(f"  ❌ [COINGECKO_CLIENT_ERROR] Error al consultar precios en bloque: {e}")
+        return {}
+    except Exception as e:
+        logger.error(f"  ❌ [COINGECKO_CLIENT_ERROR] Error inesperado al procesar precios en bloque: {e}")
+        return {}
+
+    prices: Dict[str, Dict[str, Any]] = {}
+    for address, token_data in (data or {}).items():
+        if not isinstance(token_data, dict):
+            continue
+        price = token_data.get("usd")
+        market_cap = token_data.get("usd_market_cap")
+        total_volume_24h = token_data.get("usd_24h_vol")
+        if price is None or market_cap is None or total_volume_24h is None:
+            continue
+        prices[address.lower()] = {
+            "price": float(price),
+            "market_cap": float(market_cap),
+            "total_volume_24h": float(total_volume_24h),
+        }
+    return prices
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Contadores de la caché de datos de mercado (hits, misses, coalescidas...)."""
+    return _market_data_cache.stats()
+
+
+def _fetch_token_market_data(contract_address: str, platform: str = "ethereum") -> Optional[Dict[str, Any]]:
     contract_address_lower = contract_address.lower()
     url = f"{COINGECKO_API_URL}/coins/{platform}/contract/{contract_address_lower}"
     
@@ -70,12 +178,12 @@ def get_token_market_data(contract_address: str, platform: str = "ethereum") ->
     logger.info(f"  📞 [COINGECKO_CLIENT] Consultando datos de mercado para {contract_address_lower}...")
 
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = http_client.get(url, params=params, timeout=10, budget=coingecko_budget)
         
         if response.status_code == 429:
             logger.warning("  ⚠️ [COINGECKO_CLIENT_WARN] Rate limited por CoinGecko. Esperando 10 segundos...")
             time.sleep(10)
-            response = requests.get(url, params=params, timeout=10)
+            response = http_client.get(url, params=params, timeout=10, budget=coingecko_budget)
 
         response.raise_for_status()
         data = response.json()
@@ -4,6 +4,8 @@ import time
 from typing import Optional
 
 from ..config import settings # Importamos la configuración
+from ..rate_limiter import etherscan_budget
+from . import http_client
 
 ETHERSCAN_API_URL = "https://api.etherscan.io/api"
 API_KEY = settings.ETHERSCAN_API_KEY
@@ -30,7 +32,7 @@ def get_block_timestamp(block_number: int) -> Optional[int]:
     print(f"  📞 [ETHERSCAN_CLIENT] Consultando timestamp para bloque {block_number} ({hex_block_number})...")
 
     try:
-        response = requests.get(ETHERSCAN_API_URL, params=params, timeout=15)
+        response = http_client.get(ETHERSCAN_API_URL, params=params, timeout=15, budget=etherscan_budget)
         response.raise_for_status()  # Lanza una excepción para errores HTTP (4xx o 5xx)
         data = response.json()
 
@@ -52,4 +54,36 @@ def get_block_timestamp(block_number: int) -> Optional[int]:
         return None
     except Exception as e:
         print(f"  ❌ [ETHERSCAN_CLIENT_ERROR] Error inesperado al consultar timestamp para bloque {block_number}: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def get_latest_block_number() -> Optional[int]:
+    """
+    Obtiene el número del último bloque minado usando Etherscan.
+
+    Returns:
+        El número de bloque o None si hay un error.
+    """
+    params = {
+        "module": "proxy",
+        "action": "eth_blockNumber",
+        "apikey": API_KEY,
+    }
+
+    try:
+        response = http_client.get(ETHERSCAN_API_URL, params=params, timeout=15, budget=etherscan_budget)
+        response.raise_for_status()
+        data = response.json()
+
+        result = data.get("result")
+        if isinstance(result, str) and result.startswith("0x"):
+            return int(result, 16)
+        print(f"  ❌ [ETHERSCAN_CLIENT_ERROR] No se pudo obtener el último bloque. Respuesta: {data}")
+        return None
+
+    except requests.exceptions.RequestException as e:
+        print(f"  ❌ [ETHERSCAN_CLIENT_ERROR] Error de red al consultar el último bloque: {e}")
+        return None
+    except Exception as e:
+        print(f"  ❌ [ETHERSCAN_CLIENT_ERROR] Error inesperado al consultar el último bloque: {e}")
+        return None
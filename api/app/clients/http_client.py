@@ -0,0 +1,162 @@
+# api/app/clients/http_client.py
+#
+# Sesión HTTP compartida por todos los clientes salientes (Etherscan, CoinGecko, Telegram,
+# Slack/Discord). Reutiliza conexiones keep-alive por host, aplica timeouts y política de
+# reintentos comunes y mide la latencia de cada petición por host.
+# Las peticiones con `budget` (Etherscan, CoinGecko) se reintentan aquí y no en urllib3, para
+# consumir un token del presupuesto del proveedor en cada intento.
+
+import bisect
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ..config import settings
+
+# Límites superiores (segundos) de los buckets del histograma de latencia.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RETRY_STATUSES = (502, 503, 504)
+RETRY_BACKOFF_FACTOR = 0.5
+
+
+def _build_session(max_retries: int) -> requests.Session:
+    # Los errores de conexión se reintentan siempre (la petición no llegó a enviarse); los de lectura
+    # y los 502/503/504 solo en GET, que es idempotente. Los 429 los gestiona cada cliente con su presupuesto.
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET"}),
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=settings.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"User-Agent": "TokenWatcher/1.0"})
+    return session
+
+
+_session = _build_session(settings.HTTP_MAX_RETRIES)
+# Sin reintentos en urllib3: request() los hace pasando por el presupuesto del proveedor.
+_budgeted_session = _build_session(0)
+
+
+class _LatencyHistogram:
+    def __init__(self):
+        self.bucket_counts: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total_seconds = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float) -> None:
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total_seconds += seconds
+
+
+_histograms: Dict[str, _LatencyHistogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def _record(host: str, seconds: float, error: bool) -> None:
+    with _histograms_lock:
+        histogram = _histograms.get(host)
+        if histogram is None:
+            histogram = _histograms[host] = _LatencyHistogram()
+        histogram.observe(seconds)
+        if error:
+            histogram.errors += 1
+
+
+def _send(session: requests.Session, method: str, url: str, host: str, **kwargs: Any) -> requests.Response:
+    started = time.perf_counter()
+    try:
+        response = session.request(method, url, **kwargs)
+    except requests.exceptions.RequestException:
+        _record(host, time.perf_counter() - started, error=True)
+        raise
+    _record(host, time.perf_counter() - started, error=response.status_code >= 500)
+    return response
+
+
+def _retry_delay(attempt: int, response: Optional[requests.Response] = None) -> float:
+    """Espera antes del reintento `attempt` (1, 2, ...): Retry-After si lo hay, si no backoff exponencial."""
+    if response is not None:
+        try:
+            return max(0.0, float(response.headers.get("Retry-After", "")))
+        except ValueError:
+            pass
+    return RETRY_BACKOFF_FACTOR * (2 ** (attempt - 1))
+
+
+def request(method: str, url: str, budget: Any = None, **kwargs: Any) -> requests.Response:
+    """
+    Igual que requests.request, pero sobre la sesión compartida. Lanza las mismas excepciones
+    de requests, así que los llamadores no cambian su manejo de errores.
+    Con `budget` (un rate_limiter.TokenBucket) se consume un token antes de cada intento,
+    también en los reintentos, así que nunca se supera el presupuesto del proveedor.
+    """
+    kwargs.setdefault("timeout", (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT))
+    host = urlsplit(url).hostname or "unknown"
+    if budget is None:
+        return _send(_session, method, url, host, **kwargs)
+
+    idempotent = method.upper() == "GET"
+    attempt = 0
+    while True:
+        budget.acquire()
+        try:
+            response = _send(_budgeted_session, method, url, host, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e_request:
+            retryable = idempotent or isinstance(e_request, requests.exceptions.ConnectTimeout)
+            if not retryable or attempt >= settings.HTTP_MAX_RETRIES:
+                raise
+            attempt += 1
+            time.sleep(_retry_delay(attempt))
+            continue
+        if idempotent and response.status_code in RETRY_STATUSES and attempt < settings.HTTP_MAX_RETRIES:
+            attempt += 1
+            time.sleep(_retry_delay(attempt, response))
+            continue
+        return response
+
+
+def get(url: str, **kwargs: Any) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs: Any) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def get_latency_stats() -> Dict[str, Dict[str, Any]]:
+    """Histograma acumulado de latencia por host (buckets acumulativos, estilo Prometheus)."""
+    with _histograms_lock:
+        stats = {}
+        for host, histogram in _histograms.items():
+            cumulative, buckets = 0, {}
+            for upper_bound, bucket_count in zip(LATENCY_BUCKETS, histogram.bucket_counts):
+                cumulative += bucket_count
+                buckets[str(upper_bound)] = cumulative
+            buckets["+Inf"] = histogram.count
+            stats[host] = {
+                "count": histogram.count,
+                "sum_seconds": round(histogram.total_seconds, 6),
+                "errors": histogram.errors,
+                "buckets": buckets,
+            }
+        return stats
@@ -4,13 +4,27 @@ import requests
 import logging
 from typing import Dict, Any
 
+from ..config import settings
+from ..rate_limiter import DestinationThrottled, notification_limiter
+from . import http_client
+
 # Configuración del logger para este módulo
 logger = logging.getLogger(__name__)
 
 # URL base de la API de Bots de Telegram
 TELEGRAM_API_BASE_URL = "https://api.telegram.org/bot"
 
-def send_telegram_message(bot_token: str, chat_id: str, text: str) -> bool:
+def _retry_after_seconds(response: requests.Response, default: float) -> float:
+    """Telegram indica la espera de un 429 en parameters.retry_after (y a veces en la cabecera Retry-After)."""
+    try:
+        retry_after = (response.json().get("parameters") or {}).get("retry_after")
+        if retry_after is None:
+            retry_after = response.headers.get("Retry-After")
+        return float(retry_after) if retry_after is not None else default
+    except (ValueError, TypeError, AttributeError):
+        return default
+
+def send_telegram_message(bot_token: str, chat_id: str, text: str, wait: bool = True) -> bool:
     """
     Envía un mensaje de texto a un chat de Telegram a través de un bot específico.
 
@@ -18,6 +32,8 @@ def send_telegram_message(bot_token: str, chat_id: str, text: str) -> bool:
         bot_token (str): El token de autenticación del bot de Telegram.
         chat_id (str): El ID único del chat de destino.
         text (str): El mensaje a enviar (soporta formato MarkdownV2 de Telegram).
+        wait (bool): Si es False no se duerme el hilo: un chat o bot limitado (bucket vacío o 429)
+            lanza DestinationThrottled con la espera indicada.
 
     Returns:
         bool: True si el mensaje se envió con éxito, False en caso contrario.
@@ -37,9 +53,29 @@ def send_telegram_message(bot_token: str, chat_id: str, text: str) -> bool:
         "disable_web_page_preview": True, # Desactivamos la previsualización de enlaces para un mensaje más limpio
     }
 
+    # Grupos y canales (chat_id negativo) tienen un límite por minuto más bajo que los chats privados.
+    chat_kind = "telegram_group" if str(chat_id).startswith("-") else "telegram_chat"
+    chat_key = f"{bot_token}:{chat_id}"
+
     try:
-        # Hacemos la petición POST a la API de Telegram
-        response = requests.post(url, json=payload, timeout=10)
+        for attempt in range(1, settings.NOTIFY_MAX_RETRIES + 1):
+            if wait:
+                notification_limiter.acquire(chat_kind, chat_key)
+                notification_limiter.acquire("telegram_bot", bot_token)
+            else:
+                for kind, key in ((chat_kind, chat_key), ("telegram_bot", bot_token)):
+                    retry_after = notification_limiter.try_acquire(kind, key)
+                    if retry_after > 0:
+                        raise DestinationThrottled(kind, retry_after)
+            # Hacemos la petición POST a la API de Telegram
+            response = http_client.post(url, json=payload, timeout=10)
+            if response.status_code != 429:
+                break
+            retry_after = _retry_after_seconds(response, default=settings.NOTIFY_BACKOFF_BASE * (2 ** (attempt - 1)))
+            logger.warning(f"⚠️ Telegram rate limited para el chat ID {chat_id} (intento {attempt}). Chat en pausa {retry_after:.0f}s.")
+            notification_limiter.penalize(chat_kind, chat_key, retry_after)
+            if not wait:
+                raise DestinationThrottled(chat_kind, retry_after)
         
         # raise_for_status() lanzará una excepción para respuestas de error (4xx o 5xx)
         response.raise_for_status()
@@ -55,6 +91,8 @@ def send_telegram_message(bot_token: str, chat_id: str, text: str) -> bool:
             logger.error(f"❌ La API de Telegram devolvió un error para el chat ID {chat_id}: {error_description}")
             return False
 
+    except DestinationThrottled:
+        raise
     except requests.exceptions.RequestException as e:
         # Capturamos errores de red, timeouts, etc.
         logger.error(f"❌ Fallo en la solicitud a la API de Telegram para el chat ID {chat_id}: {e}")
@@ -0,0 +1,396 @@
+# api/app/cold_storage.py
+#
+# Lectura de eventos archivados (cold tier). cleanup_and_archive borra de Postgres los eventos más
+# antiguos que EVENT_RETENTION_DAYS y los deja en S3 (ver archive.py); aquí se indexan los objetos
+# de cada manifest en archived_event_objects (por watcher y rango de fechas) y se leen los eventos
+# de los objetos relevantes para una consulta. Los objetos descargados se guardan en una caché en
+# disco (COLD_STORAGE_CACHE_DIR, LRU por fecha de acceso, hasta COLD_STORAGE_CACHE_MAX_BYTES).
+#
+# Indexar los manifests que falten (p. ej. si falló el indexado al archivar):
+#   python -m api.app.cold_storage
+
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import distinct, or_
+from sqlalchemy.orm import Session
+
+from . import archive, models
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_MANIFEST_NAME = "manifest.json"
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_s3_client = None
+
+
+def _get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = archive.get_s3_client()
+    return _s3_client
+
+
+def _parse_datetime(value: Any) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(value)
+    if parsed is not None and parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+# --- Índice de objetos archivados ---
+
+def index_archive_entries(db: Session, run_id: str, entries: Iterable[Dict[str, Any]]) -> int:
+    """Registra los objetos de un manifest (los ya indexados se ignoran). Devuelve cuántos se añadieron."""
+    added = 0
+    for entry in entries:
+        if not entry.get("rows") or not entry.get("created_at_min"):
+            continue
+        if db.query(models.ArchivedEventObject.id).filter(models.ArchivedEventObject.key == entry["key"]).first():
+            continue
+        archived_object = models.ArchivedEventObject(
+            key=entry["key"], run_id=run_id, format=entry["format"],
+            token_address=entry.get("token_address"), rows=entry["rows"], bytes=entry.get("bytes"),
+            created_at_min=_parse_datetime(entry["created_at_min"]),
+            created_at_max=_parse_datetime(entry["created_at_max"]),
+            block_number_min=entry.get("block_number_min"), block_number_max=entry.get("block_number_max"),
+        )
+        archived_object.watchers = [
+            models.ArchivedEventObjectWatcher(watcher_id=watcher_id) for watcher_id in entry.get("watcher_ids", [])
+        ]
+        db.add(archived_object)
+        added += 1
+    db.commit()
+    return added
+
+
+def sync_manifests(db: Session, s3_client=None, bucket: Optional[str] = None) -> int:
+    """Indexa los manifests de las ejecuciones de cleanup_and_archive que aún no están en la base de datos."""
+    s3_client = s3_client or _get_s3_client()
+    bucket = bucket or settings.S3_BUCKET
+    indexed_runs: Set[str] = {run_id for (run_id,) in db.query(distinct(models.ArchivedEventObject.run_id))}
+
+    added = 0
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{archive.ARCHIVE_PREFIX}/", Delimiter="/"):
+        for common_prefix in page.get("CommonPrefixes", []):
+            run_id = common_prefix["Prefix"][len(archive.ARCHIVE_PREFIX) + 1:].rstrip("/")
+            if run_id in indexed_runs:
+                continue
+            try:
+                body = s3_client.get_object(Bucket=bucket, Key=f"{common_prefix['Prefix']}{_MANIFEST_NAME}")["Body"].read()
+            except s3_client.exceptions.NoSuchKey:
+                logger.warning(f"⚠️ [COLD_STORAGE] La ejecución {run_id} no tiene manifest; se ignora.")
+                continue
+            manifest = json.loads(body)
+            run_added = index_archive_entries(db, manifest.get("run_id", run_id), manifest.get("objects", []))
+            logger.info(f"🧾 [COLD_STORAGE] Manifest de {run_id} indexado ({run_added} objeto(s)).")
+            added += run_added
+    return added
+
+
+# --- Caché local de objetos ---
+
+def _cache_path(key: str) -> str:
+    suffix = ".parquet" if key.endswith(".parquet") else ".ndjson.gz"
+    return os.path.join(settings.COLD_STORAGE_CACHE_DIR, hashlib.sha256(key.encode()).hexdigest() + suffix)
+
+
+def _evict(keep: str) -> None:
+    """Borra los ficheros usados hace más tiempo hasta quedar por debajo de COLD_STORAGE_CACHE_MAX_BYTES."""
+    with _cache_lock:
+        files = []
+        for entry in os.scandir(settings.COLD_STORAGE_CACHE_DIR):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= settings.COLD_STORAGE_CACHE_MAX_BYTES:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            _cache_stats["evictions"] += 1
+
+
+def _local_copy(key: str) -> str:
+    """Ruta local del objeto `key`: de la caché si ya se leyó, si no se descarga de S3."""
+    path = _cache_path(key)
+    if os.path.exists(path):
+        os.utime(path)  # LRU por mtime
+        with _cache_lock:
+            _cache_stats["hits"] += 1
+        return path
+
+    os.makedirs(settings.COLD_STORAGE_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        _get_s3_client().download_file(settings.S3_BUCKET, key, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    with _cache_lock:
+        _cache_stats["misses"] += 1
+    _evict(keep=path)
+    return path
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    files, size = 0, 0
+    if os.path.isdir(settings.COLD_STORAGE_CACHE_DIR):
+        for entry in os.scandir(settings.COLD_STORAGE_CACHE_DIR):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                files += 1
+                size += entry.stat().st_size
+    with _cache_lock:
+        stats = dict(_cache_stats)
+    return {**stats, "files": files, "bytes": size, "max_bytes": settings.COLD_STORAGE_CACHE_MAX_BYTES}
+
+
+# --- Lectura de eventos ---
+
+def _row_to_event(row: Dict[str, Any]) -> models.TokenEvent:
+    """Evento archivado como TokenEvent transitorio (no se añade a la sesión)."""
+    return models.TokenEvent(
+        id=int(row["id"]),
+        watcher_id=int(row["watcher_id"]),
+        token_address_observed=row["token_address_observed"],
+        from_address=row["from_address"],
+        to_address=row["to_address"],
+        amount=Decimal(str(row["amount"])),
+        transaction_hash=row["transaction_hash"],
+        log_index=int(row.get("log_index") or 0),
+        block_number=int(row["block_number"]),
+        usd_value=Decimal(str(row["usd_value"])) if row.get("usd_value") is not None else None,
+        token_name=row.get("token_name"),
+        token_symbol=row.get("token_symbol"),
+        created_at=_parse_datetime(row["created_at"]),
+    )
+
+
+def _iter_object_rows(archived_object: models.ArchivedEventObject, watcher_ids: Set[int],
+                      start: Optional[datetime], end: Optional[datetime]) -> Iterator[Dict[str, Any]]:
+    if archived_object.format == "parquet":
+        if archive.pq is None:
+            # Omitirlo devolvería un histórico incompleto sin avisar: mejor un error explícito.
+            logger.error(f"❌ [COLD_STORAGE] {archived_object.key} es Parquet y pyarrow no está instalado.")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Archived events are stored as Parquet and this server cannot read them (pyarrow missing).",
+            )
+        # Los filtros usan las estadísticas min/max de cada row group para saltarse los que no aplican.
+        filters = [("watcher_id", "in", sorted(watcher_ids))]
+        if start:
+            filters.append(("created_at", ">=", start))
+        if end:
+            filters.append(("created_at", "<", end))
+        yield from archive.pq.read_table(_local_copy(archived_object.key), filters=filters).to_pylist()
+        return
+
+    with gzip.open(_local_copy(archived_object.key), "rt", encoding="utf-8") as archived_file:
+        for line in archived_file:
+            row = json.loads(line)
+            if row.get("watcher_id") in watcher_ids:
+                yield row
+
+
+def _event_filter(
+    token_address: Optional[str], token_symbol: Optional[str], start: Optional[datetime], end: Optional[datetime],
+    from_address: Optional[str], to_address: Optional[str],
+    min_usd_value: Optional[float], max_usd_value: Optional[float],
+) -> Callable[[models.TokenEvent], bool]:
+    """Mismos filtros que crud.build_owner_events_query, aplicados en Python a los eventos archivados."""
+    token_address_lc = token_address.strip().lower() if token_address else None
+    token_symbol_lc = token_symbol.lower() if token_symbol else None
+    from_address_lc = from_address.strip().lower() if from_address else None
+    to_address_lc = to_address.strip().lower() if to_address else None
+
+    def matches(event: models.TokenEvent) -> bool:
+        if token_address_lc:
+            observed = (event.token_address_observed or "").lower()
+            if len(token_address_lc) == 42 and observed != token_address_lc:
+                return False
+            if len(token_address_lc) != 42 and token_address_lc not in observed:
+                return False
+        if token_symbol_lc and token_symbol_lc not in (event.token_symbol or "").lower():
+            return False
+        if start and event.created_at < start:
+            return False
+        if end and event.created_at >= end:
+            return False
+        if from_address_lc and event.from_address != from_address_lc:
+            return False
+        if to_address_lc and event.to_address != to_address_lc:
+            return False
+        if min_usd_value is not None and (event.usd_value is None or event.usd_value < min_usd_value):
+            return False
+        if max_usd_value is not None and (event.usd_value is None or event.usd_value > max_usd_value):
+            return False
+        return True
+
+    return matches
+
+
+def find_archived_objects(
+    db: Session, watcher_ids: Set[int], start: Optional[datetime] = None,
+    end: Optional[datetime] = None, token_address: Optional[str] = None, newest_first: bool = True
+) -> List[models.ArchivedEventObject]:
+    """
+    Objetos archivados con eventos de `watcher_ids` que se solapan con [start, end), del más reciente
+    al más antiguo por created_at_max (o del más antiguo al más reciente por created_at_min).
+    """
+    watcher_objects = db.query(models.ArchivedEventObjectWatcher.object_id)\
+                        .filter(models.ArchivedEventObjectWatcher.watcher_id.in_(watcher_ids))
+    query = db.query(models.ArchivedEventObject).filter(models.ArchivedEventObject.id.in_(watcher_objects))
+    if start:
+        query = query.filter(models.ArchivedEventObject.created_at_max >= start)
+    if end:
+        query = query.filter(models.ArchivedEventObject.created_at_min < end)
+    if token_address:
+        # Los objetos Parquet son de un solo token: se descartan los de otros tokens sin descargarlos.
+        token_address_lc = token_address.strip().lower()
+        token_match = models.ArchivedEventObject.token_address == token_address_lc if len(token_address_lc) == 42 \
+            else models.ArchivedEventObject.token_address.contains(token_address_lc, autoescape=True)
+        query = query.filter(or_(models.ArchivedEventObject.token_address.is_(None), token_match))
+    if newest_first:
+        return query.order_by(models.ArchivedEventObject.created_at_max.desc()).all()
+    return query.order_by(models.ArchivedEventObject.created_at_min.asc()).all()
+
+
+def _archive_scope(
+    db: Session, owner_id: int, watcher_id: Optional[int], start_date: Optional[datetime],
+    end_date: Optional[datetime], active_watchers_only: Optional[bool]
+) -> Tuple[Set[int], Optional[datetime], Optional[datetime]]:
+    """Watchers del usuario y rango [start, end) en UTC, con los mismos límites por día que build_owner_events_query."""
+    watcher_query = db.query(models.Watcher.id).filter(models.Watcher.owner_id == owner_id)
+    if active_watchers_only:
+        watcher_query = watcher_query.filter(models.Watcher.is_active == True)
+    if watcher_id is not None:
+        watcher_query = watcher_query.filter(models.Watcher.id == watcher_id)
+    watcher_ids = {row.id for row in watcher_query}
+
+    start = datetime(start_date.year, start_date.month, start_date.day, tzinfo=timezone.utc) if start_date else None
+    end = datetime(end_date.year, end_date.month, end_date.day, tzinfo=timezone.utc) + timedelta(days=1) if end_date else None
+    return watcher_ids, start, end
+
+
+def _too_many_objects(count: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"The query spans {count} archived objects; narrow it with start_date/end_date or watcher_id.",
+    )
+
+
+def iter_archived_events(
+    db: Session, owner_id: int, watcher_id: Optional[int] = None, token_address: Optional[str] = None,
+    token_symbol: Optional[str] = None, start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None, from_address: Optional[str] = None,
+    to_address: Optional[str] = None, min_usd_value: Optional[float] = None,
+    max_usd_value: Optional[float] = None, active_watchers_only: Optional[bool] = False
+) -> Iterator[models.TokenEvent]:
+    """
+    Eventos archivados de un usuario que cumplen los filtros de /events/, sin orden definido.
+    Solo se leen los objetos indexados con alguno de sus watchers y rango de fechas.
+    """
+    watcher_ids, start, end = _archive_scope(db, owner_id, watcher_id, start_date, end_date, active_watchers_only)
+    if not watcher_ids:
+        return
+
+    archived_objects = find_archived_objects(db, watcher_ids, start, end, token_address)
+    if len(archived_objects) > settings.COLD_STORAGE_MAX_OBJECTS_PER_QUERY:
+        raise _too_many_objects(len(archived_objects))
+
+    matches = _event_filter(token_address, token_symbol, start, end, from_address, to_address, min_usd_value, max_usd_value)
+    for archived_object in archived_objects:
+        for row in _iter_object_rows(archived_object, watcher_ids, start, end):
+            event = _row_to_event(row)
+            if matches(event):
+                yield event
+
+
+def seek_archived_events(
+    db: Session, owner_id: int, count: int, descending: bool = True,
+    after: Optional[Tuple[datetime, int]] = None, watcher_id: Optional[int] = None,
+    token_address: Optional[str] = None, token_symbol: Optional[str] = None,
+    start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+    from_address: Optional[str] = None, to_address: Optional[str] = None,
+    min_usd_value: Optional[float] = None, max_usd_value: Optional[float] = None,
+    active_watchers_only: Optional[bool] = False
+) -> List[models.TokenEvent]:
+    """
+    Los `count` primeros eventos archivados en orden (created_at, id), tras la posición `after` de un
+    cursor de /events/. Los objetos se recorren por su created_at_min/max empezando en esa posición y
+    se dejan de leer en cuanto ninguno de los siguientes puede entrar en el resultado: cada página
+    descarga solo los objetos que le tocan, no todo el histórico.
+    """
+    watcher_ids, start, end = _archive_scope(db, owner_id, watcher_id, start_date, end_date, active_watchers_only)
+    if not watcher_ids or count <= 0:
+        return []
+
+    seek_start, seek_end = start, end
+    if after is not None:
+        if descending:
+            after_end = after[0] + timedelta(microseconds=1)  # el evento del cursor comparte objeto con los siguientes
+            seek_end = min(seek_end, after_end) if seek_end else after_end
+        else:
+            seek_start = max(seek_start, after[0]) if seek_start else after[0]
+    archived_objects = find_archived_objects(db, watcher_ids, seek_start, seek_end, token_address, newest_first=descending)
+
+    matches = _event_filter(token_address, token_symbol, start, end, from_address, to_address, min_usd_value, max_usd_value)
+    sort_key = lambda event: (event.created_at, event.id)
+    pick = heapq.nlargest if descending else heapq.nsmallest
+    selected: List[models.TokenEvent] = []
+    objects_read = 0
+    for archived_object in archived_objects:
+        if len(selected) >= count:
+            # Los objetos siguientes acaban (o empiezan) más allá del último evento seleccionado.
+            last_created_at = selected[-1].created_at
+            if descending and archived_object.created_at_max < last_created_at:
+                break
+            if not descending and archived_object.created_at_min > last_created_at:
+                break
+        objects_read += 1
+        if objects_read > settings.COLD_STORAGE_MAX_OBJECTS_PER_QUERY:
+            raise _too_many_objects(objects_read)
+
+        candidates = []
+        for row in _iter_object_rows(archived_object, watcher_ids, start, end):
+            event = _row_to_event(row)
+            if not matches(event):
+                continue
+            if after is not None and (sort_key(event) >= after if descending else sort_key(event) <= after):
+                continue
+            candidates.append(event)
+        selected = pick(count, selected + candidates, key=sort_key)
+    return selected
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    with SessionLocal() as db:
+        logger.info(f"✅ [COLD_STORAGE] {sync_manifests(db)} objeto(s) archivado(s) indexado(s).")
@@ -3,7 +3,7 @@
 import os
 from pydantic_settings import BaseSettings
 # Se añade EmailStr para validar el formato del correo
-from typing import Literal
+from typing import Literal, Optional
 from pydantic import EmailStr
 
 class Settings(BaseSettings):
@@ -18,20 +18,75 @@ class Settings(BaseSettings):
     DISCORD_WEBHOOK_URL: str
     DISCORD_BATCH_SIZE: int = 5
     POLL_INTERVAL: int = 30
+    POLL_SCHEDULER_TICK_SECONDS: float = 5.0
+    POLL_JITTER_RATIO: float = 0.1
+    POLL_BACKOFF_MAX_SECONDS: int = 900
+    POLLER_HEALTH_PORT: int = 8001
+    SCAN_JOB_MAX_WORKERS: int = 2
+    SCAN_JOB_STALE_SECONDS: int = 900
     MAX_BLOCK_RANGE: int = 10000
+    ETHERSCAN_PAGE_SIZE: int = 1000
     START_BLOCK: int = 0
     NOTIFY_MAX_RETRIES: int = 3
     NOTIFY_BACKOFF_BASE: float = 1.0
+    # --- Outbox de notificaciones (notification_worker.py) ---
+    NOTIFY_OUTBOX_BATCH_SIZE: int = 20
+    NOTIFY_OUTBOX_MAX_ATTEMPTS: int = 8
+    NOTIFY_OUTBOX_BACKOFF_MAX_SECONDS: int = 3600
+    NOTIFY_OUTBOX_LEASE_SECONDS: int = 300
+    NOTIFY_OUTBOX_POLL_SECONDS: float = 2.0
+    NOTIFY_OUTBOX_RETENTION_DAYS: int = 7
+    NOTIFY_DIGEST_MAX_WINDOW_SECONDS: int = 3600
     AWS_ACCESS_KEY_ID: str
     AWS_SECRET_ACCESS_KEY: str
     S3_BUCKET: str
     AWS_REGION: str
+    # --- Archivo de eventos en S3 (archive.py) ---
+    S3_ENDPOINT_URL: Optional[str] = None  # MinIO / moto en local; vacío = AWS
+    ARCHIVE_PART_SIZE_BYTES: int = 8 * 1024 * 1024
+    ARCHIVE_FETCH_SIZE: int = 5000
+    ARCHIVE_FORMAT: Literal["ndjson", "parquet"] = "ndjson"  # parquet requiere pyarrow
+    ARCHIVE_PARQUET_ROW_GROUP_ROWS: int = 50000
+    EVENT_RETENTION_DAYS: int = 7  # cleanup_and_archive; lo anterior solo está en el archivo
+    # --- Lectura de eventos archivados (cold_storage.py) ---
+    COLD_STORAGE_CACHE_DIR: str = "/tmp/tokenwatcher_archive_cache"
+    COLD_STORAGE_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    COLD_STORAGE_MAX_OBJECTS_PER_QUERY: int = 200
     MONTHS_AHEAD: int = 2
+    # --- Particiones de events (partitions.py) ---
+    EVENTS_PARTITION_MONTHS: int = 1
+    EVENTS_PARTITION_CHECK_SECONDS: int = 21600
+
+    # --- Concurrencia del poller y presupuesto de peticiones por proveedor ---
+    POLL_MAX_WORKERS: int = 8
+    ETHERSCAN_REQUESTS_PER_SECOND: float = 5.0
+    COINGECKO_REQUESTS_PER_MINUTE: int = 30
+
+    # --- Cliente HTTP compartido (clients/http_client.py) ---
+    HTTP_POOL_CONNECTIONS: int = 16
+    HTTP_POOL_MAXSIZE: int = 16
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_READ_TIMEOUT: float = 20.0
+    HTTP_MAX_RETRIES: int = 2
+    COINGECKO_CACHE_TTL_SECONDS: int = 60
+    COINGECKO_CACHE_NEGATIVE_TTL_SECONDS: int = 15
+    COINGECKO_CACHE_MAX_ENTRIES: int = 2048
+    # Contratos por petición a /simple/token_price (el plan demo admite menos que los de pago).
+    COINGECKO_BATCH_SIZE: int = 50
+    # Transferencias más antiguas que esto se valoran con la serie histórica (token_price_points)
+    PRICE_SPOT_MAX_AGE_SECONDS: int = 900
+    PRICE_SERIES_PADDING_SECONDS: int = 3600
+    # Conteos de /events/ (total_events) cacheados por usuario y filtros
+    EVENT_COUNT_CACHE_TTL_SECONDS: int = 30
+    EVENT_COUNT_CACHE_MAX_ENTRIES: int = 4096
 
     # --- Variables para Autenticación JWT ---
     SECRET_KEY: str
     ALGORITHM: Literal["HS256"] = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Caché de usuarios autenticados (auth.get_current_principal)
+    AUTH_PRINCIPAL_CACHE_TTL_SECONDS: int = 30
+    AUTH_PRINCIPAL_CACHE_MAX_ENTRIES: int = 10000
 
     # --- Variables para envíos de correo con Resend ---
     RESEND_API_KEY: str
@@ -48,6 +103,7 @@ class Settings(BaseSettings):
     
     # --- LÍMITE DE WATCHERS POR DEFECTO ---
     DEFAULT_WATCHER_LIMIT: int = 5
+    PLAN_CACHE_TTL_SECONDS: int = 300
 
     # --- NUEVAS VARIABLES PARA UMBRAL INTELIGENTE Y COINGECKO ---
     COINGECKO_API_KEY: str
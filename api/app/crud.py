@@ -1,16 +1,23 @@
 # api/app/crud.py
 
 from sqlalchemy.orm import Session, selectinload
-from sqlalchemy import desc, asc, func as sql_func, distinct
+from sqlalchemy import desc, asc, func as sql_func, distinct, or_, and_, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException, status
 from pydantic import HttpUrl, EmailStr, ValidationError, parse_obj_as
+import base64
+import heapq
 import json
-from typing import Optional, List, Dict, Any
-from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Optional, List, Dict, Any, Tuple
+from datetime import datetime, timedelta, timezone
 from web3 import Web3
 from web3.exceptions import InvalidAddress
 
-from . import models, schemas, auth, email_utils
+from . import models, schemas, auth, email_utils, plan_cache, cold_storage
+from .cache import TTLCache
+from .config import settings
 
 # --- User CRUD ---
 def get_user(db: Session, user_id: int) -> models.User | None:
@@ -19,6 +26,17 @@ def get_user(db: Session, user_id: int) -> models.User | None:
 def get_user_by_email(db: Session, email: str) -> models.User | None:
     return db.query(models.User).options(selectinload(models.User.watchers), selectinload(models.User.subscription).selectinload(models.Subscription.plan)).filter(models.User.email == email).first()
 
+def get_principal_by_email(db: Session, email: str) -> Optional["auth.Principal"]:
+    """Carga solo las columnas que necesita la autorización (una consulta, sin relaciones)."""
+    row = (
+        db.query(models.User.id, models.User.email, models.User.is_active)
+          .filter(models.User.email == email)
+          .first()
+    )
+    if row is None:
+        return None
+    return auth.Principal(id=row.id, email=row.email, is_active=row.is_active)
+
 def get_users(db: Session, skip: int = 0, limit: int = 100) -> List[models.User]:
     return db.query(models.User).options(selectinload(models.User.watchers), selectinload(models.User.subscription).selectinload(models.Subscription.plan)).order_by(models.User.id).offset(skip).limit(limit).all()
 
@@ -50,6 +68,7 @@ def set_user_password(db: Session, user: models.User, new_password: str) -> mode
     user.hashed_password = hashed
     db.add(user)
     db.commit()
+    auth.invalidate_principal(user.email)
     db.refresh(user)
     return user
 
@@ -59,6 +78,7 @@ def delete_user_by_id(db: Session, user_id: int) -> Optional[models.User]:
         return None
     db.delete(user_to_delete)
     db.commit()
+    auth.invalidate_principal(user_to_delete.email)
     return user_to_delete
 
 def update_user_admin(db: Session, user_id: int, user_update_data: schemas.UserUpdateAdmin) -> Optional[models.User]:
@@ -98,6 +118,7 @@ def update_user_admin(db: Session, user_id: int, user_update_data: schemas.UserU
         db_user.is_active = update_data['is_active']
 
     db.commit()
+    auth.invalidate_principal(db_user.email)
     
     db.refresh(db_user)
     if db_user.subscription:
@@ -131,6 +152,7 @@ def update_user_plan(db: Session, user: models.User, new_plan_id: int) -> models
         email_utils.send_plan_change_email(user.email, new_plan.name)
     
     db.commit()
+    auth.invalidate_principal(user.email)
     db.refresh(user)
     if user.subscription:
         db.refresh(user.subscription)
@@ -165,6 +187,33 @@ def get_active_watchers(db: Session, skip: int = 0, limit: int = 100) -> List[mo
         .offset(skip).limit(limit).all()
     )
 
+def get_active_watcher_ids_by_token(db: Session) -> Dict[str, List[int]]:
+    """
+    Ids de los watchers activos agrupados por contrato (dirección en minúsculas), el mismo grupo
+    que poll_and_notify descarga una sola vez: el planificador del poller programa por contrato.
+    """
+    groups: Dict[str, List[int]] = {}
+    rows = (
+        db.query(models.Watcher.id, models.Watcher.token_address)
+        .filter(models.Watcher.is_active == True)
+        .order_by(models.Watcher.id)
+    )
+    for watcher_id, token_address in rows:
+        groups.setdefault((token_address or "").lower(), []).append(watcher_id)
+    return groups
+
+def get_active_watchers_by_ids(db: Session, watcher_ids: List[int]) -> List[models.Watcher]:
+    if not watcher_ids:
+        return []
+    return (
+        db.query(models.Watcher)
+        .filter(models.Watcher.id.in_(watcher_ids))
+        .filter(models.Watcher.is_active == True)
+        .order_by(models.Watcher.id)
+        .options(selectinload(models.Watcher.transports))
+        .all()
+    )
+
 def get_active_watchers_for_user(db: Session, user_id: int) -> List[models.Watcher]:
     return (
         db.query(models.Watcher)
@@ -183,6 +232,21 @@ def get_watchers_for_owner(db: Session, owner_id: int, skip: int = 0, limit: int
         .offset(skip).limit(limit).all()
     )
 
+def _apply_digest_window(transport_config: Dict[str, Any], digest_window_seconds: Optional[int]) -> Dict[str, Any]:
+    """
+    Guarda en la config del transporte la ventana de digest (segundos). 0 o None = envío inmediato.
+    Devuelve un dict nuevo para que SQLAlchemy detecte el cambio en la columna JSONB.
+    """
+    transport_config = {k: v for k, v in transport_config.items() if k != "digest_window_seconds"}
+    if digest_window_seconds:
+        if digest_window_seconds < 0 or digest_window_seconds > settings.NOTIFY_DIGEST_MAX_WINDOW_SECONDS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"digest_window_seconds must be between 0 and {settings.NOTIFY_DIGEST_MAX_WINDOW_SECONDS}.",
+            )
+        transport_config["digest_window_seconds"] = int(digest_window_seconds)
+    return transport_config
+
 def get_transport_config_from_target(transport_type: str, target: str) -> Dict[str, Any]:
     transport_config = {}
     transport_type_lower = transport_type.lower()
@@ -230,6 +294,7 @@ def create_watcher(db: Session, watcher_data: schemas.WatcherCreate, owner_id: i
         watcher_data.transport_type,
         watcher_data.transport_target
     )
+    transport_config = _apply_digest_window(transport_config, watcher_data.digest_window_seconds)
 
     db_transport = models.Transport(
         watcher_id=db_watcher.id,
@@ -247,7 +312,7 @@ def update_watcher(db: Session, watcher_id: int, watcher_update_data: schemas.Wa
     update_data = watcher_update_data.model_dump(exclude_unset=True)
 
     for field, value in update_data.items():
-        if field in ["transport_type", "transport_target", "send_test_notification", "token_address"]:
+        if field in ["transport_type", "transport_target", "digest_window_seconds", "send_test_notification", "token_address"]:
             continue
         if hasattr(db_watcher, field) and value is not None:
             setattr(db_watcher, field, value)
@@ -260,6 +325,7 @@ def update_watcher(db: Session, watcher_id: int, watcher_update_data: schemas.Wa
             watcher_update_data.transport_type,
             watcher_update_data.transport_target
         )
+        transport_config = _apply_digest_window(transport_config, watcher_update_data.digest_window_seconds)
         
         new_transport = models.Transport(
             watcher_id=db_watcher.id,
@@ -267,6 +333,9 @@ def update_watcher(db: Session, watcher_id: int, watcher_update_data: schemas.Wa
             config=transport_config
         )
         db.add(new_transport)
+    elif "digest_window_seconds" in update_data:
+        for transport in db_watcher.transports:
+            transport.config = _apply_digest_window(dict(transport.config or {}), watcher_update_data.digest_window_seconds)
 
     db.commit()
     db.refresh(db_watcher, attribute_names=['transports'])
@@ -277,15 +346,63 @@ def delete_watcher(db: Session, watcher_id: int, owner_id: int) -> None:
     db.delete(db_watcher)
     db.commit()
 
+# --- Watcher cursor CRUD ---
+def get_watcher_start_blocks(db: Session, watcher_ids: List[int]) -> Dict[int, int]:
+    """
+    Devuelve {watcher_id: primer bloque pendiente de escanear}. Los watchers sin cursor
+    (anteriores a la tabla watcher_cursors) se inicializan desde su último evento; los que
+    no tienen ninguno de los dos no aparecen en el resultado.
+    """
+    if not watcher_ids:
+        return {}
+    start_blocks = {
+        watcher_id: last_scanned_block + 1
+        for watcher_id, last_scanned_block in db.query(
+            models.WatcherCursor.watcher_id, models.WatcherCursor.last_scanned_block
+        ).filter(models.WatcherCursor.watcher_id.in_(watcher_ids))
+    }
+    missing_ids = [watcher_id for watcher_id in watcher_ids if watcher_id not in start_blocks]
+    if missing_ids:
+        legacy_rows = (
+            db.query(models.TokenEvent.watcher_id, sql_func.max(models.TokenEvent.block_number))
+              .filter(models.TokenEvent.watcher_id.in_(missing_ids))
+              .group_by(models.TokenEvent.watcher_id)
+              .all()
+        )
+        for watcher_id, max_block in legacy_rows:
+            if max_block is not None:
+                start_blocks[watcher_id] = max_block + 1
+    return start_blocks
+
+def advance_watcher_cursor(db: Session, watcher_id: int, last_scanned_block: int) -> None:
+    """
+    Upsert del cursor (nunca retrocede). No hace commit: el llamador lo confirma
+    junto con los eventos del mismo escaneo.
+    """
+    stmt = pg_insert(models.WatcherCursor).values(
+        watcher_id=watcher_id, last_scanned_block=last_scanned_block
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.WatcherCursor.watcher_id],
+        set_={
+            "last_scanned_block": sql_func.greatest(
+                models.WatcherCursor.last_scanned_block, stmt.excluded.last_scanned_block
+            ),
+            "updated_at": sql_func.now(),
+        },
+    )
+    db.execute(stmt)
+
 # --- Event (TokenEvent) CRUD ---
 def create_event(db: Session, event_data: schemas.TokenEventCreate) -> Optional[models.TokenEvent]:
     existing_event = db.query(models.TokenEvent).filter(
         models.TokenEvent.transaction_hash == event_data.transaction_hash,
-        models.TokenEvent.watcher_id == event_data.watcher_id
+        models.TokenEvent.watcher_id == event_data.watcher_id,
+        models.TokenEvent.log_index == event_data.log_index
     ).first()
     if existing_event:
         return existing_event
-    db_event = models.TokenEvent(**event_data.model_dump())
+    db_event = models.TokenEvent(**event_data.model_dump(exclude_none=True))
     try:
         db.add(db_event)
         db.commit()
@@ -295,9 +412,373 @@ def create_event(db: Session, event_data: schemas.TokenEventCreate) -> Optional[
         db.rollback()
         raise
 
+def create_events_bulk(db: Session, events_data: List[schemas.TokenEventCreate], commit: bool = True) -> List[models.TokenEvent]:
+    """
+    Inserta todos los eventos en un único INSERT ... ON CONFLICT DO NOTHING RETURNING.
+    Devuelve solo los eventos realmente nuevos; los que ya existían (misma watcher_id,
+    transaction_hash, log_index y created_at) se ignoran.
+    created_at es obligatorio (timestamp del bloque): forma parte de la clave de deduplicación y
+    con la hora actual una misma transferencia leída dos veces se insertaría dos veces.
+    Con commit=False el llamador confirma la transacción (p. ej. junto con el cursor del watcher).
+    """
+    if not events_data:
+        return []
+    rows = []
+    for event_data in events_data:
+        row = event_data.model_dump()
+        if row.get("created_at") is None:
+            raise ValueError(f"El evento de la tx {row.get('transaction_hash')} no tiene created_at (timestamp del bloque).")
+        rows.append(row)
+
+    stmt = (
+        pg_insert(models.TokenEvent)
+        .values(rows)
+        .on_conflict_do_nothing(constraint="uq_events_watcher_tx_log")
+        .returning(models.TokenEvent)
+    )
+    try:
+        created_events = list(db.scalars(stmt, execution_options={"populate_existing": True}))
+        if commit:
+            db.commit()
+        return created_events
+    except Exception:
+        db.rollback()
+        raise
+
+# --- Token price series CRUD ---
+def get_price_points(db: Session, token_address: str, from_ts: int, to_ts: int, platform: str = "ethereum") -> List[Tuple[int, float]]:
+    rows = (
+        db.query(models.TokenPricePoint.timestamp, models.TokenPricePoint.price_usd)
+          .filter(
+              models.TokenPricePoint.platform == platform,
+              models.TokenPricePoint.token_address == token_address.lower(),
+              models.TokenPricePoint.timestamp >= from_ts,
+              models.TokenPricePoint.timestamp <= to_ts,
+          )
+          .order_by(models.TokenPricePoint.timestamp)
+          .all()
+    )
+    return [(int(ts), float(price)) for ts, price in rows]
+
+def save_price_points(db: Session, token_address: str, points: List[Tuple[int, float]], platform: str = "ethereum") -> None:
+    if not points:
+        return
+    rows = [
+        {"platform": platform, "token_address": token_address.lower(), "timestamp": int(ts), "price_usd": float(price)}
+        for ts, price in points
+    ]
+    stmt = pg_insert(models.TokenPricePoint).values(rows).on_conflict_do_nothing()
+    try:
+        db.execute(stmt)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+# --- Notification outbox CRUD ---
+def enqueue_notifications(db: Session, watcher_obj: Any, events_list: List[schemas.TokenEventRead]) -> int:
+    """
+    Inserta una fila de outbox por transporte del watcher con los eventos serializados.
+    No hace commit: el llamador la confirma junto con los eventos.
+    """
+    if not events_list or not watcher_obj.transports:
+        return 0
+    payload = {
+        "watcher": {
+            "id": watcher_obj.id,
+            "name": watcher_obj.name,
+            "token_address": watcher_obj.token_address,
+            "owner_id": getattr(watcher_obj, "owner_id", None),
+        },
+        "events": [event.model_dump(mode="json") for event in events_list],
+    }
+    now = datetime.now(timezone.utc)
+    rows = []
+    for transport in watcher_obj.transports:
+        transport_config = transport.config
+        if isinstance(transport_config, str):
+            try:
+                transport_config = json.loads(transport_config)
+            except json.JSONDecodeError:
+                transport_config = {}
+        row = models.NotificationOutbox(
+            watcher_id=watcher_obj.id,
+            transport_id=transport.id,
+            transport_type=transport.type.lower(),
+            transport_config=transport_config or {},
+            payload=payload,
+        )
+        digest_window = (transport_config or {}).get("digest_window_seconds") or 0
+        if digest_window > 0:
+            row.next_attempt_at = _digest_flush_at(db, payload["watcher"]["owner_id"], row.transport_type, row.transport_config, now, digest_window)
+        db.add(row)
+        rows.append(row)
+    return len(rows)
+
+def _digest_flush_at(db: Session, owner_id: Optional[int], transport_type: str, transport_config: Dict[str, Any], now: datetime, window_seconds: int) -> datetime:
+    """
+    Momento de envío de una notificación en modo digest: si el usuario ya tiene un digest abierto
+    (pendiente y sin intentos) hacia ese destino se une a él; si no, abre uno nuevo que se envía
+    dentro de window_seconds. Nunca se une al digest de otro usuario aunque comparta el destino.
+    """
+    if owner_id is None:
+        return now + timedelta(seconds=window_seconds)
+    open_flush_at = (
+        db.query(sql_func.min(models.NotificationOutbox.next_attempt_at))
+          .filter(
+              models.NotificationOutbox.transport_type == transport_type,
+              models.NotificationOutbox.transport_config == transport_config,
+              models.NotificationOutbox.payload["watcher"]["owner_id"].astext == str(owner_id),
+              models.NotificationOutbox.status == "pending",
+              models.NotificationOutbox.attempts == 0,
+              models.NotificationOutbox.next_attempt_at > now,
+          )
+          .scalar()
+    )
+    return open_flush_at or now + timedelta(seconds=window_seconds)
+
+def claim_outbox_batch(db: Session, transport_type: str, limit: int, lease_seconds: int) -> List[Dict[str, Any]]:
+    """
+    Reserva (FOR UPDATE SKIP LOCKED) hasta `limit` notificaciones pendientes de un transporte y las
+    marca como 'sending'. Las que llevan más de lease_seconds en 'sending' (worker caído) se vuelven
+    a reservar. Devuelve copias en dict para poder usarlas fuera de la transacción.
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        rows = (
+            db.query(models.NotificationOutbox)
+              .filter(models.NotificationOutbox.transport_type == transport_type)
+              .filter(or_(
+                  and_(models.NotificationOutbox.status == "pending", models.NotificationOutbox.next_attempt_at <= now),
+                  and_(models.NotificationOutbox.status == "sending", models.NotificationOutbox.locked_at < now - timedelta(seconds=lease_seconds)),
+              ))
+              .order_by(models.NotificationOutbox.id)
+              .limit(limit)
+              .with_for_update(skip_locked=True)
+              .all()
+        )
+        claimed = []
+        for row in rows:
+            row.status = "sending"
+            row.locked_at = now
+            row.attempts += 1
+            claimed.append({
+                "id": row.id,
+                "watcher_id": row.watcher_id,
+                "transport_type": row.transport_type,
+                "transport_config": row.transport_config,
+                "payload": row.payload,
+                "attempts": row.attempts,
+            })
+        db.commit()
+        return claimed
+    except Exception:
+        db.rollback()
+        raise
+
+def mark_outbox_sent(db: Session, outbox_id: int) -> None:
+    db.query(models.NotificationOutbox).filter(models.NotificationOutbox.id == outbox_id).update(
+        {"status": "sent", "sent_at": datetime.now(timezone.utc), "locked_at": None, "last_error": None},
+        synchronize_session=False,
+    )
+    db.commit()
+
+def mark_outbox_failed(db: Session, outbox_id: int, error: str, retry_in_seconds: Optional[float]) -> None:
+    """Reprograma la notificación dentro de retry_in_seconds o, si es None, la pasa a dead-letter."""
+    values: Dict[str, Any] = {"locked_at": None, "last_error": error[:1000]}
+    if retry_in_seconds is None:
+        values["status"] = "dead"
+    else:
+        values["status"] = "pending"
+        values["next_attempt_at"] = datetime.now(timezone.utc) + timedelta(seconds=retry_in_seconds)
+    db.query(models.NotificationOutbox).filter(models.NotificationOutbox.id == outbox_id).update(values, synchronize_session=False)
+    db.commit()
+
+def defer_outbox(db: Session, outbox_id: int, retry_in_seconds: float, payload: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Devuelve a 'pending' una notificación cuyo destino está limitado (Retry-After o bucket vacío)
+    para dentro de retry_in_seconds, sin gastar el intento que sumó claim_outbox_batch. Con `payload`
+    se guardan solo los eventos que aún no se entregaron.
+    """
+    values: Dict[str, Any] = {
+        "status": "pending",
+        "locked_at": None,
+        "next_attempt_at": datetime.now(timezone.utc) + timedelta(seconds=retry_in_seconds),
+        "attempts": sql_func.greatest(models.NotificationOutbox.attempts - 1, 0),
+    }
+    if payload is not None:
+        values["payload"] = payload
+    db.query(models.NotificationOutbox).filter(models.NotificationOutbox.id == outbox_id).update(values, synchronize_session=False)
+    db.commit()
+
+def purge_sent_notifications(db: Session, older_than_days: int) -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    deleted = (
+        db.query(models.NotificationOutbox)
+          .filter(models.NotificationOutbox.status == "sent", models.NotificationOutbox.sent_at < cutoff)
+          .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
+
+def get_outbox_stats(db: Session) -> List[Dict[str, Any]]:
+    rows = (
+        db.query(models.NotificationOutbox.transport_type, models.NotificationOutbox.status, sql_func.count())
+          .group_by(models.NotificationOutbox.transport_type, models.NotificationOutbox.status)
+          .all()
+    )
+    return [{"transport_type": t, "status": s, "count": c} for t, s, c in rows]
+
 def get_event_by_id(db: Session, event_id: int) -> models.TokenEvent | None:
     return db.query(models.TokenEvent).filter(models.TokenEvent.id == event_id).first()
 
+# Conteos exactos por (usuario, filtros): evita repetir el COUNT(*) en cada página.
+_event_count_cache = TTLCache(
+    maxsize=settings.EVENT_COUNT_CACHE_MAX_ENTRIES,
+    ttl=settings.EVENT_COUNT_CACHE_TTL_SECONDS,
+)
+
+def _event_sort_key(sort_by: str):
+    # usd_value puede ser NULL y un NULL no es comparable en el keyset: se ordena como -1 (al final en desc).
+    sort_map = {
+        "created_at": models.TokenEvent.created_at,
+        "amount": models.TokenEvent.amount,
+        "usd_value": sql_func.coalesce(models.TokenEvent.usd_value, -1),
+        "block_number": models.TokenEvent.block_number,
+    }
+    return sort_map.get(sort_by, models.TokenEvent.created_at)
+
+def _event_sort_value(event: models.TokenEvent, sort_by: str) -> Any:
+    if sort_by == "usd_value":
+        return str(event.usd_value) if event.usd_value is not None else "-1"
+    if sort_by == "amount":
+        return str(event.amount)
+    if sort_by == "block_number":
+        return event.block_number
+    return event.created_at.isoformat()
+
+def encode_event_cursor(event: models.TokenEvent, sort_by: str, sort_order: str) -> str:
+    payload = {
+        "s": sort_by, "o": sort_order,
+        "v": _event_sort_value(event, sort_by),
+        "t": event.created_at.isoformat(), "i": event.id,
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_event_cursor(cursor: str, sort_by: str, sort_order: str) -> Tuple[Any, datetime, int]:
+    """Devuelve (valor de orden, created_at, id) del último evento de la página anterior."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if payload["s"] != sort_by or payload["o"] != sort_order:
+            raise ValueError("cursor was issued for a different sort")
+        created_at = datetime.fromisoformat(payload["t"])
+        if sort_by in ("amount", "usd_value"):
+            sort_value = Decimal(payload["v"])
+        elif sort_by == "block_number":
+            sort_value = int(payload["v"])
+        else:
+            sort_value = created_at
+        return sort_value, created_at, int(payload["i"])
+    except (ValueError, KeyError, TypeError, InvalidOperation, json.JSONDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor.")
+
+def _paginate_events(
+    base_query, sort_by: str, sort_order: str, skip: int, limit: int, cursor: Optional[str]
+) -> Tuple[List[models.TokenEvent], Optional[str]]:
+    """
+    Ordena por (columna de orden, created_at, id) y pagina por keyset cuando hay cursor,
+    de modo que el coste de una página no depende de lo profunda que sea. Sin cursor
+    se respeta `skip` (OFFSET) por compatibilidad con los clientes actuales.
+    """
+    sort_by, sort_order = _normalize_event_sort(sort_by, sort_order)
+    direction = asc if sort_order == "asc" else desc
+
+    keys = [models.TokenEvent.created_at, models.TokenEvent.id]
+    if sort_by != "created_at":
+        keys.insert(0, _event_sort_key(sort_by))
+
+    query = base_query
+    if cursor:
+        sort_value, created_at, event_id = decode_event_cursor(cursor, sort_by, sort_order)
+        values = [created_at, event_id] if sort_by == "created_at" else [sort_value, created_at, event_id]
+        if sort_order == "asc":
+            query = query.filter(tuple_(*keys) > tuple_(*values))
+        else:
+            query = query.filter(tuple_(*keys) < tuple_(*values))
+    elif skip:
+        query = query.offset(skip)
+
+    rows = query.order_by(*[direction(key) for key in keys]).limit(limit + 1).all()
+    events = rows[:limit]
+    next_cursor = encode_event_cursor(events[-1], sort_by, sort_order) if len(rows) > limit else None
+    return events, next_cursor
+
+def _normalize_event_sort(sort_by: Optional[str], sort_order: Optional[str]) -> Tuple[str, str]:
+    sort_by = sort_by if sort_by in ("created_at", "amount", "usd_value", "block_number") else "created_at"
+    sort_order = "asc" if (sort_order or "").lower() == "asc" else "desc"
+    return sort_by, sort_order
+
+def _event_python_sort_key(event: models.TokenEvent, sort_by: str) -> Tuple:
+    """Misma clave que _paginate_events, para ordenar en Python eventos de Postgres y del archivo."""
+    if sort_by == "created_at":
+        return event.created_at, event.id
+    if sort_by == "usd_value":
+        value = event.usd_value if event.usd_value is not None else Decimal(-1)
+    elif sort_by == "amount":
+        value = event.amount
+    else:
+        value = event.block_number
+    return value, event.created_at, event.id
+
+def _merge_archived_events(
+    db: Session, base_query, owner_id: int, filters: Dict[str, Any], sort_by: str, sort_order: str,
+    skip: int, limit: int, cursor: Optional[str]
+) -> Tuple[List[models.TokenEvent], Optional[str]]:
+    """
+    Página de eventos mezclando Postgres con el archivo (cold_storage). Se piden a cada lado las
+    primeras skip+limit filas tras el cursor, se mezclan con la misma clave de orden y el cursor
+    resultante sirve para ambos. Ordenando por created_at, el archivo se lee desde la posición del
+    cursor (cold_storage.seek_archived_events); con otro orden hay que recorrerlo entero.
+    """
+    sort_by, sort_order = _normalize_event_sort(sort_by, sort_order)
+    window = limit if cursor else skip + limit
+    hot_events, hot_next_cursor = _paginate_events(base_query, sort_by, sort_order, 0, window, cursor)
+
+    cursor_key = None
+    if cursor:
+        sort_value, created_at, event_id = decode_event_cursor(cursor, sort_by, sort_order)
+        cursor_key = (created_at, event_id) if sort_by == "created_at" else (sort_value, created_at, event_id)
+
+    sort_key = lambda event: _event_python_sort_key(event, sort_by)
+    if sort_by == "created_at":
+        archived_events = cold_storage.seek_archived_events(
+            db, owner_id, window + 1, descending=sort_order == "desc", after=cursor_key, **filters
+        )
+    else:
+        def archived_candidates():
+            for event in cold_storage.iter_archived_events(db, owner_id, **filters):
+                key = _event_python_sort_key(event, sort_by)
+                if cursor_key is None or (key > cursor_key if sort_order == "asc" else key < cursor_key):
+                    yield event
+
+        pick = heapq.nsmallest if sort_order == "asc" else heapq.nlargest
+        archived_events = pick(window + 1, archived_candidates(), key=sort_key)
+
+    # Un evento puede seguir en Postgres y estar ya archivado si el borrado posterior falló.
+    hot_keys = {(event.created_at, event.id) for event in hot_events}
+    merged = hot_events + [event for event in archived_events if (event.created_at, event.id) not in hot_keys]
+    merged.sort(key=sort_key, reverse=sort_order == "desc")
+
+    events = merged[:limit] if cursor else merged[skip:skip + limit]
+    has_more = hot_next_cursor is not None or len(merged) > window
+    next_cursor = encode_event_cursor(events[-1], sort_by, sort_order) if has_more and events else None
+    return events, next_cursor
+
+def _count_events(base_query, cache_key: Tuple) -> int:
+    return _event_count_cache.get_or_load(
+        cache_key, lambda: base_query.with_entities(sql_func.count(models.TokenEvent.id)).scalar() or 0
+    )
+
 def get_all_events_for_owner(
     db: Session, owner_id: int, skip: int = 0, limit: int = 100,
     watcher_id: Optional[int] = None, token_address: Optional[str] = None,
@@ -305,8 +786,61 @@ def get_all_events_for_owner(
     end_date: Optional[datetime] = None, from_address: Optional[str] = None,
     to_address: Optional[str] = None, min_usd_value: Optional[float] = None,
     max_usd_value: Optional[float] = None, sort_by: Optional[str] = "created_at",
-    sort_order: Optional[str] = "desc", active_watchers_only: Optional[bool] = False
+    sort_order: Optional[str] = "desc", active_watchers_only: Optional[bool] = False,
+    cursor: Optional[str] = None, include_total: bool = True, include_archived: bool = False
 ) -> Dict[str, Any]:
+    filters = dict(
+        watcher_id=watcher_id, token_address=token_address, token_symbol=token_symbol,
+        start_date=start_date, end_date=end_date, from_address=from_address, to_address=to_address,
+        min_usd_value=min_usd_value, max_usd_value=max_usd_value, active_watchers_only=active_watchers_only,
+    )
+    base_query = build_owner_events_query(db, owner_id, **filters)
+
+    # Un rango que empieza antes de la retención solo puede responderse completo con el archivo.
+    if start_date is not None:
+        retention_start = datetime.now(timezone.utc) - timedelta(days=settings.EVENT_RETENTION_DAYS)
+        start_date_aware = start_date if start_date.tzinfo else start_date.replace(tzinfo=timezone.utc)
+        include_archived = include_archived or start_date_aware < retention_start
+
+    count_key = (
+        owner_id, watcher_id, token_address, token_symbol, start_date, end_date,
+        from_address, to_address, min_usd_value, max_usd_value, bool(active_watchers_only),
+    )
+    total_events = None
+    if include_total:
+        total_events = _count_events(base_query, ("owner",) + count_key)
+        if include_archived:
+            # Contar el archivo exige leerlo entero: se cachea igual que el COUNT(*), no se repite en cada página.
+            total_events += _event_count_cache.get_or_load(
+                ("archived",) + count_key,
+                lambda: sum(1 for _ in cold_storage.iter_archived_events(db, owner_id, **filters)),
+            )
+
+    if include_archived:
+        events, next_cursor = _merge_archived_events(
+            db, base_query, owner_id, filters, sort_by, sort_order, skip, limit, cursor
+        )
+    else:
+        events, next_cursor = _paginate_events(base_query, sort_by, sort_order, skip, limit, cursor)
+        if next_cursor is None and len(events) < limit and _normalize_event_sort(sort_by, sort_order) == ("created_at", "desc"):
+            # Postgres se ha quedado sin eventos: en orden cronológico descendente lo que sigue está en el
+            # archivo, así que la página se completa con él y next_cursor continúa por el histórico.
+            events, next_cursor = _merge_archived_events(
+                db, base_query, owner_id, filters, sort_by, sort_order, skip, limit, cursor
+            )
+    return {"total_events": total_events, "events": events, "next_cursor": next_cursor}
+
+def build_owner_events_query(
+    db: Session, owner_id: int, watcher_id: Optional[int] = None, token_address: Optional[str] = None,
+    token_symbol: Optional[str] = None, start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None, from_address: Optional[str] = None,
+    to_address: Optional[str] = None, min_usd_value: Optional[float] = None,
+    max_usd_value: Optional[float] = None, active_watchers_only: Optional[bool] = False
+):
+    """
+    Consulta filtrada de los eventos de un usuario, escrita para que cada filtro use un índice
+    (ver TokenEvent.__table_args__ y scripts/check_event_query_plans.py).
+    """
     base_query = db.query(models.TokenEvent)\
                    .join(models.Watcher, models.TokenEvent.watcher_id == models.Watcher.id)\
                    .filter(models.Watcher.owner_id == owner_id)
@@ -316,7 +850,13 @@ def get_all_events_for_owner(
     if watcher_id is not None:
         base_query = base_query.filter(models.TokenEvent.watcher_id == watcher_id)
     if token_address:
-        base_query = base_query.filter(models.TokenEvent.token_address_observed.ilike(f"%{token_address}%"))
+        # Dirección completa: igualdad (btree); fragmento: subcadena, como el ILIKE '%...%' de antes,
+        # con el índice trigram. Ambos sobre la columna en minúsculas.
+        token_address_lc = token_address.strip().lower()
+        if len(token_address_lc) == 42:
+            base_query = base_query.filter(models.TokenEvent.token_address_lc == token_address_lc)
+        else:
+            base_query = base_query.filter(models.TokenEvent.token_address_lc.contains(token_address_lc, autoescape=True))
     if token_symbol:
         base_query = base_query.filter(models.TokenEvent.token_symbol.ilike(f"%{token_symbol}%"))
     if start_date:
@@ -326,33 +866,24 @@ def get_all_events_for_owner(
         end_date_utc_exclusive = datetime(end_date.year, end_date.month, end_date.day) + timedelta(days=1)
         base_query = base_query.filter(models.TokenEvent.created_at < end_date_utc_exclusive)
     if from_address:
-        base_query = base_query.filter(models.TokenEvent.from_address.ilike(from_address))
+        base_query = base_query.filter(models.TokenEvent.from_address == from_address.strip().lower())
     if to_address:
-        base_query = base_query.filter(models.TokenEvent.to_address.ilike(to_address))
+        base_query = base_query.filter(models.TokenEvent.to_address == to_address.strip().lower())
     if min_usd_value is not None:
         base_query = base_query.filter(models.TokenEvent.usd_value >= min_usd_value)
     if max_usd_value is not None:
         base_query = base_query.filter(models.TokenEvent.usd_value <= max_usd_value)
-    
-    total_events = base_query.with_entities(sql_func.count(models.TokenEvent.id)).scalar() or 0
-    
-    sort_map = { "created_at": models.TokenEvent.created_at, "amount": models.TokenEvent.amount, "usd_value": models.TokenEvent.usd_value, "block_number": models.TokenEvent.block_number }
-    sort_column = sort_map.get(sort_by, models.TokenEvent.created_at)
-    
-    if sort_order.lower() == "asc":
-        ordered_query = base_query.order_by(asc(sort_column))
-    else:
-        ordered_query = base_query.order_by(desc(sort_column))
-    
-    events = ordered_query.offset(skip).limit(limit).all()
-    return {"total_events": total_events, "events": events}
+    return base_query
 
-def get_events_for_watcher(db: Session, watcher_id: int, owner_id: int, skip: int = 0, limit: int = 100) -> Dict[str, Any]:
+def get_events_for_watcher(
+    db: Session, watcher_id: int, owner_id: int, skip: int = 0, limit: int = 100,
+    cursor: Optional[str] = None, include_total: bool = True
+) -> Dict[str, Any]:
     db_watcher = get_watcher_db(db, watcher_id=watcher_id, owner_id=owner_id)
     base_query = db.query(models.TokenEvent).filter(models.TokenEvent.watcher_id == watcher_id)
-    total_events = base_query.with_entities(sql_func.count(models.TokenEvent.id)).scalar() or 0
-    events = base_query.order_by(desc(models.TokenEvent.created_at)).offset(skip).limit(limit).all()
-    return {"total_events": total_events, "events": events}
+    total_events = _count_events(base_query, ("watcher", watcher_id)) if include_total else None
+    events, next_cursor = _paginate_events(base_query, "created_at", "desc", skip, limit, cursor)
+    return {"total_events": total_events, "events": events, "next_cursor": next_cursor}
 
 def get_distinct_token_symbols_for_owner(db: Session, owner_id: int) -> List[str]:
     query = (
@@ -435,6 +966,7 @@ def create_plan(db: Session, plan: schemas.PlanCreate) -> models.Plan:
     db.add(db_plan)
     db.commit()
     db.refresh(db_plan)
+    plan_cache.refresh(db)
     return db_plan
 
 def update_plan(db: Session, plan_id: int, plan_data: schemas.PlanUpdatePayload) -> Optional[models.Plan]:
@@ -448,6 +980,7 @@ def update_plan(db: Session, plan_id: int, plan_data: schemas.PlanUpdatePayload)
         
     db.commit()
     db.refresh(db_plan)
+    plan_cache.refresh(db)
     return db_plan
 
 def delete_plan(db: Session, plan_id: int) -> Optional[models.Plan]:
@@ -467,4 +1000,62 @@ def delete_plan(db: Session, plan_id: int) -> Optional[models.Plan]:
 
     db.delete(db_plan)
     db.commit()
+    plan_cache.refresh(db)
     return db_plan
+
+# --- Scan job CRUD ---
+ACTIVE_SCAN_JOB_STATUSES = ("queued", "running")
+
+def get_scan_job(db: Session, job_id: int, owner_id: int) -> Optional[models.ScanJob]:
+    return (
+        db.query(models.ScanJob)
+          .filter(models.ScanJob.id == job_id, models.ScanJob.user_id == owner_id)
+          .first()
+    )
+
+def get_active_scan_job_for_user(db: Session, user_id: int) -> Optional[models.ScanJob]:
+    return (
+        db.query(models.ScanJob)
+          .filter(models.ScanJob.user_id == user_id, models.ScanJob.status.in_(ACTIVE_SCAN_JOB_STATUSES))
+          .first()
+    )
+
+def get_or_create_scan_job(db: Session, user_id: int, stale_after_seconds: int) -> Tuple[models.ScanJob, bool]:
+    """
+    Devuelve el job en cola/en curso del usuario o crea uno nuevo; el booleano indica si se creó.
+    Un job activo que no se actualiza desde hace stale_after_seconds (p. ej. el proceso se reinició
+    a mitad del escaneo) se marca como fallido para no bloquear nuevos escaneos.
+    """
+    existing = get_active_scan_job_for_user(db, user_id)
+    if existing:
+        last_update = existing.updated_at or existing.created_at
+        if last_update and datetime.now(timezone.utc) - last_update < timedelta(seconds=stale_after_seconds):
+            return existing, False
+        existing.status = "failed"
+        existing.error_message = "Scan interrupted before completion."
+        existing.finished_at = datetime.now(timezone.utc)
+        db.commit()
+
+    db_job = models.ScanJob(user_id=user_id, status="queued")
+    try:
+        db.add(db_job)
+        db.commit()
+        db.refresh(db_job)
+        return db_job, True
+    except IntegrityError:
+        # Otra petición creó el job a la vez: el índice único parcial garantiza que solo hay uno.
+        db.rollback()
+        existing = get_active_scan_job_for_user(db, user_id)
+        if existing is None:
+            raise
+        return existing, False
+
+def update_scan_job(db: Session, job_id: int, **fields: Any) -> None:
+    try:
+        db.query(models.ScanJob).filter(models.ScanJob.id == job_id).update(
+            {**fields, "updated_at": datetime.now(timezone.utc)}, synchronize_session=False
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
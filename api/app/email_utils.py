@@ -1,11 +1,18 @@
 # api/app/email_utils.py
 
 import os
-from typing import List
+from typing import Any, Dict, List
 from datetime import datetime
 import resend
 from .config import settings
 from . import schemas
+from .rate_limiter import notification_limiter
+
+# La API key se configura una sola vez al importar el módulo.
+resend.api_key = settings.RESEND_API_KEY
+
+# Máximo de emails por llamada a resend.Batch.send (límite del proveedor).
+RESEND_BATCH_LIMIT = 100
 
 def _create_styled_html_content(title: str, body_html: str) -> str:
     """
@@ -47,20 +54,53 @@ def _create_styled_html_content(title: str, body_html: str) -> str:
     </html>
     """
 
+def _build_email_params(to_email: str, subject: str, html_content: str) -> Dict[str, Any]:
+    return {
+        "from": settings.MAIL_FROM,
+        "to": [to_email],
+        "subject": subject,
+        "html": html_content,
+    }
+
+def send_email_batch(emails: List[Dict[str, Any]]) -> List[bool]:
+    """
+    Sends many emails through Resend's batch endpoint, in chunks of RESEND_BATCH_LIMIT.
+    `emails` are params dicts (see build_token_alert_email). Returns one flag per email,
+    in the same order, telling whether Resend accepted it.
+    Each batch call spends a single token of the Resend API key; the per-domain pacing
+    only applies to single sends (send_email).
+    """
+    results: List[bool] = []
+    for i in range(0, len(emails), RESEND_BATCH_LIMIT):
+        chunk = emails[i:i + RESEND_BATCH_LIMIT]
+        notification_limiter.acquire("resend_api", settings.RESEND_API_KEY)
+        try:
+            response = resend.Batch.send(chunk)
+        except Exception as e:
+            print(f"Error sending batch of {len(chunk)} email(s): {e}")
+            results.extend([False] * len(chunk))
+            continue
+
+        # Resend devuelve un id por email en el mismo orden que se enviaron; un email sin id
+        # (o más allá de la respuesta) se considera no entregado.
+        data = (response or {}).get("data") or []
+        chunk_results = [
+            index < len(data) and bool((data[index] or {}).get("id"))
+            for index in range(len(chunk))
+        ]
+        print(f"Batch of {len(chunk)} email(s) sent, {sum(chunk_results)} accepted.")
+        results.extend(chunk_results)
+    return results
+
 def send_email(to_email: str, subject: str, html_content: str) -> bool:
     """
     Generic function to send an email using Resend.
     """
     try:
-        resend.api_key = settings.RESEND_API_KEY
-        
-        params = {
-            "from": settings.MAIL_FROM,
-            "to": [to_email],
-            "subject": subject,
-            "html": html_content,
-        }
+        params = _build_email_params(to_email, subject, html_content)
         
+        notification_limiter.acquire("resend_api", settings.RESEND_API_KEY)
+        notification_limiter.acquire("email_domain", to_email.rsplit("@", 1)[-1].lower())
         response = resend.Emails.send(params)
         print(f"Email sent to {to_email}, response: {response}")
         return True
@@ -153,6 +193,14 @@ def send_token_alert_email_batch(to_email: str, watcher_name: str, events: List[
     """
     Sends a single summary email for a batch of token events.
     """
+    params = build_token_alert_email(to_email, watcher_name, events)
+    return send_email(to_email, params["subject"], params["html"])
+
+def build_token_alert_email(to_email: str, watcher_name: str, events: List[schemas.TokenEventRead]) -> Dict[str, Any]:
+    """
+    Builds the Resend params of the summary email for a batch of token events,
+    ready for send_email_batch.
+    """
     event_count = len(events)
     subject = f"🚨 {event_count} New Alert(s) for '{watcher_name}'"
     
@@ -186,4 +234,4 @@ def send_token_alert_email_batch(to_email: str, watcher_name: str, events: List[
     </table>
     """
     styled_html = _create_styled_html_content("Token Transfer Alert", body_html)
-    return send_email(to_email, subject, styled_html)
+    return _build_email_params(to_email, subject, styled_html)
@@ -15,10 +15,9 @@ from .rate_limiter import limiter
 from fastapi.middleware.cors import CORSMiddleware
 
 from .database import engine, get_db
-from . import models, schemas, crud, auth, email_utils, notifier
-from .auth import get_current_user
+from . import models, schemas, crud, auth, email_utils, notifier, scan_jobs, plan_cache, partitions, cold_storage
 from .config import settings
-from .clients import coingecko_client
+from .clients import coingecko_client, http_client
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +28,16 @@ try:
 except Exception as e:
     print(f"❌ [DB_INIT_ERROR] No se pudieron crear/verificar las tablas: {e}")
 
+try:
+    partitions.ensure_partitions()
+except Exception as e:
+    print(f"❌ [DB_INIT_ERROR] No se pudieron crear/verificar las particiones de events: {e}")
+
+try:
+    plan_cache.refresh()
+except Exception as e:
+    print(f"⚠️ [DB_INIT] No se pudo precargar la tabla de planes: {e}")
+
 app = FastAPI(
     title="TokenWatcher API",
     version="0.9.9",
@@ -102,7 +111,7 @@ admin_router = APIRouter(prefix="/admin", tags=["Admin"])
 def create_new_plan(
     plan_data: schemas.PlanCreate,
     db: Session = Depends(get_db),
-    admin_user: models.User = Depends(auth.get_current_admin_user)
+    admin_user: auth.Principal = Depends(auth.get_current_admin_user)
 ):
     return crud.create_plan(db=db, plan=plan_data)
 
@@ -111,7 +120,7 @@ def get_all_plans_for_admin(
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db),
-    admin_user: models.User = Depends(auth.get_current_admin_user)
+    admin_user: auth.Principal = Depends(auth.get_current_admin_user)
 ):
     return crud.get_plans(db=db, skip=skip, limit=limit)
 
@@ -120,7 +129,7 @@ def update_existing_plan(
     plan_id: int,
     plan_data: schemas.PlanUpdatePayload,
     db: Session = Depends(get_db),
-    admin_user: models.User = Depends(auth.get_current_admin_user)
+    admin_user: auth.Principal = Depends(auth.get_current_admin_user)
 ):
     updated_plan = crud.update_plan(db, plan_id, plan_data)
     if not updated_plan:
@@ -131,7 +140,7 @@ def update_existing_plan(
 def delete_existing_plan(
     plan_id: int,
     db: Session = Depends(get_db),
-    admin_user: models.User = Depends(auth.get_current_admin_user)
+    admin_user: auth.Principal = Depends(auth.get_current_admin_user)
 ):
     deleted_plan = crud.delete_plan(db, plan_id)
     if not deleted_plan:
@@ -145,7 +154,7 @@ def read_all_users(
     skip: int = 0, 
     limit: int = 100, 
     db: Session = Depends(get_db), 
-    admin_user: models.User = Depends(auth.get_current_admin_user)
+    admin_user: auth.Principal = Depends(auth.get_current_admin_user)
 ):
     users = crud.get_users(db, skip=skip, limit=limit)
     return users
@@ -154,7 +163,7 @@ def read_all_users(
 def delete_user(
     user_id: int, 
     db: Session = Depends(get_db), 
-    admin_user: models.User = Depends(auth.get_current_admin_user)
+    admin_user: auth.Principal = Depends(auth.get_current_admin_user)
 ):
     deleted_user = crud.delete_user_by_id(db=db, user_id=user_id)
     if not deleted_user:
@@ -167,7 +176,7 @@ def update_user_as_admin(
     user_id: int, 
     user_update: schemas.UserUpdateAdmin, 
     db: Session = Depends(get_db), 
-    admin_user: models.User = Depends(auth.get_current_admin_user)
+    admin_user: auth.Principal = Depends(auth.get_current_admin_user)
 ):
     updated_user = crud.update_user_admin(db, user_id=user_id, user_update_data=user_update)
     if not updated_user:
@@ -175,6 +184,30 @@ def update_user_as_admin(
         
     return updated_user
 
+# --- Rutas de Diagnóstico ---
+@admin_router.get("/cache-stats")
+def get_cache_stats(admin_user: auth.Principal = Depends(auth.get_current_admin_user)):
+    return {
+        "coingecko_market_data": coingecko_client.get_cache_stats(),
+        "auth_principals": auth.get_principal_cache_stats(),
+        "cold_storage": cold_storage.get_cache_stats(),
+    }
+
+@admin_router.get("/http-stats")
+def get_http_stats(admin_user: auth.Principal = Depends(auth.get_current_admin_user)):
+    return http_client.get_latency_stats()
+
+@admin_router.get("/event-partitions")
+def get_event_partitions(admin_user: auth.Principal = Depends(auth.get_current_admin_user)):
+    return partitions.get_partition_layout()
+
+@admin_router.get("/notification-outbox")
+def get_notification_outbox_stats(
+    db: Session = Depends(get_db),
+    admin_user: auth.Principal = Depends(auth.get_current_admin_user)
+):
+    return crud.get_outbox_stats(db)
+
 app.include_router(admin_router)
 
 
@@ -193,7 +226,7 @@ def api_root_demo():
 
 @app.get("/tokens/info/{contract_address}", response_model=schemas.TokenInfo, tags=["Tokens"])
 @limiter.limit("30/minute")
-def get_token_info(request: Request, contract_address: str, current_user: models.User = Depends(auth.get_current_user)):
+def get_token_info(request: Request, contract_address: str, current_user: auth.Principal = Depends(auth.get_current_principal)):
     market_data = coingecko_client.get_token_market_data(contract_address)
     if not market_data:
         raise HTTPException(status_code=404, detail="Could not fetch market data for this token address.")
@@ -262,7 +295,7 @@ def create_new_watcher_for_current_user(
 def list_watchers_for_current_user(
     skip: int = 0, limit: int = 100, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
     db_watchers = crud.get_watchers_for_owner(db, owner_id=current_user.id, skip=skip, limit=limit)
     return [_populate_watcher_read_from_db_watcher(w) for w in db_watchers]
@@ -271,7 +304,7 @@ def list_watchers_for_current_user(
 def get_single_watcher_for_current_user(
     watcher_id: int, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
     db_watcher = crud.get_watcher_db(db, watcher_id=watcher_id, owner_id=current_user.id)
     return _populate_watcher_read_from_db_watcher(db_watcher)
@@ -281,7 +314,7 @@ def update_existing_watcher_for_current_user(
     watcher_id: int, 
     watcher_update_data: schemas.WatcherUpdatePayload,
     db: Session = Depends(get_db), 
-    current_user: models.User = Depends(auth.get_current_user)
+    current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
     if not current_user.is_admin and watcher_update_data.threshold is not None:
         existing_watcher = crud.get_watcher_db(db, watcher_id=watcher_id, owner_id=current_user.id)
@@ -327,7 +360,7 @@ def update_existing_watcher_for_current_user(
 def delete_existing_watcher_for_current_user(
     watcher_id: int, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
     crud.delete_watcher(db=db, watcher_id=watcher_id, owner_id=current_user.id)
     return
@@ -335,36 +368,40 @@ def delete_existing_watcher_for_current_user(
 @app.get("/events/", response_model=schemas.PaginatedTokenEventResponse, tags=["Events"])
 def list_all_events_for_current_user(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_principal),
     skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=500),
     watcher_id: Optional[int] = Query(None), token_address: Optional[str] = Query(None),
     token_symbol: Optional[str] = Query(None), start_date: Optional[datetime] = Query(None),
     end_date: Optional[datetime] = Query(None), from_address: Optional[str] = Query(None),
     to_address: Optional[str] = Query(None), min_usd_value: Optional[float] = Query(None, ge=0),
     max_usd_value: Optional[float] = Query(None, ge=0), sort_by: Optional[str] = Query("created_at"),
-    sort_order: Optional[str] = Query("desc"), active_watchers_only: Optional[bool] = Query(False)
+    sort_order: Optional[str] = Query("desc"), active_watchers_only: Optional[bool] = Query(False),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page; when given, skip is ignored."),
+    include_total: bool = Query(True, description="Include total_events (an exact count cached for a few seconds)."),
+    include_archived: bool = Query(False, description="Merge events older than the retention period from the S3 archive for any sort order and count them in total_events. Implied when start_date is older than the retention period. With the default sort (created_at desc) archived events follow once the recent ones run out, even without this flag.")
 ):
-    data = crud.get_all_events_for_owner(db=db, owner_id=current_user.id, skip=skip, limit=limit, watcher_id=watcher_id, token_address=token_address, token_symbol=token_symbol, start_date=start_date, end_date=end_date, from_address=from_address, to_address=to_address, min_usd_value=min_usd_value, max_usd_value=max_usd_value, sort_by=sort_by, sort_order=sort_order, active_watchers_only=active_watchers_only)
-    return schemas.PaginatedTokenEventResponse(total_events=data["total_events"], events=data["events"])
+    data = crud.get_all_events_for_owner(db=db, owner_id=current_user.id, skip=skip, limit=limit, watcher_id=watcher_id, token_address=token_address, token_symbol=token_symbol, start_date=start_date, end_date=end_date, from_address=from_address, to_address=to_address, min_usd_value=min_usd_value, max_usd_value=max_usd_value, sort_by=sort_by, sort_order=sort_order, active_watchers_only=active_watchers_only, cursor=cursor, include_total=include_total, include_archived=include_archived)
+    return schemas.PaginatedTokenEventResponse(total_events=data["total_events"], events=data["events"], next_cursor=data["next_cursor"])
 
 @app.get("/events/distinct-token-symbols/", response_model=List[str], tags=["Events"])
 def list_distinct_token_symbols_for_current_user(
-    db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)
+    db: Session = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
     symbols = crud.get_distinct_token_symbols_for_owner(db=db, owner_id=current_user.id)
     return symbols
 
 @app.get("/events/watcher/{watcher_id}", response_model=schemas.PaginatedTokenEventResponse, tags=["Events"])
 def list_events_for_a_specific_watcher_of_current_user(
-    watcher_id: int, skip: int = 0, limit: int = 100, 
-    db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)
+    watcher_id: int, skip: int = 0, limit: int = 100,
+    cursor: Optional[str] = None, include_total: bool = True,
+    db: Session = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
-    data = crud.get_events_for_watcher(db, watcher_id=watcher_id, owner_id=current_user.id, skip=skip, limit=limit)
-    return schemas.PaginatedTokenEventResponse(total_events=data["total_events"], events=data["events"])
+    data = crud.get_events_for_watcher(db, watcher_id=watcher_id, owner_id=current_user.id, skip=skip, limit=limit, cursor=cursor, include_total=include_total)
+    return schemas.PaginatedTokenEventResponse(total_events=data["total_events"], events=data["events"], next_cursor=data["next_cursor"])
 
 @app.get("/events/{event_id}", response_model=schemas.TokenEventRead, tags=["Events"])
 def get_single_event_for_current_user(
-    event_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)
+    event_id: int, db: Session = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
     db_event = crud.get_event_by_id(db, event_id=event_id)
     if not db_event:
@@ -375,7 +412,7 @@ def get_single_event_for_current_user(
 @app.post("/watchers/{watcher_id}/transports/", response_model=schemas.TransportRead, status_code=status.HTTP_201_CREATED, tags=["Transports"])
 def add_new_transport_to_watcher(
     watcher_id: int, transport_payload: schemas.TransportCreate,
-    db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)
+    db: Session = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
     if transport_payload.watcher_id != watcher_id:
         raise HTTPException(status_code=400, detail="Watcher ID in path does not match watcher ID in transport payload.")
@@ -384,7 +421,7 @@ def add_new_transport_to_watcher(
 @app.get("/watchers/{watcher_id}/transports/", response_model=List[schemas.TransportRead], tags=["Transports"])
 def list_all_transports_for_specific_watcher(
     watcher_id: int, skip: int = 0, limit: int = 100, 
-    db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)
+    db: Session = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
     crud.get_watcher_db(db, watcher_id=watcher_id, owner_id=current_user.id)
     return crud.get_transports_for_watcher_owner_checked(db, watcher_id=watcher_id, owner_id=current_user.id, skip=skip, limit=limit)
@@ -392,7 +429,7 @@ def list_all_transports_for_specific_watcher(
 @app.delete("/transports/{transport_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Transports"])
 def delete_specific_transport_by_id(
     transport_id: int, db: Session = Depends(get_db), 
-    current_user: models.User = Depends(auth.get_current_user)
+    current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
     crud.delete_transport_by_id(db=db, transport_id=transport_id, owner_id=current_user.id)
     return
@@ -401,7 +438,7 @@ def delete_specific_transport_by_id(
 def test_transport_notification(
     transport_test_payload: schemas.TransportTest,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
     db_watcher = crud.get_watcher_db(db, watcher_id=transport_test_payload.watcher_id, owner_id=current_user.id)
     
@@ -438,42 +475,39 @@ def test_transport_notification(
 
     return {"detail": "Test notification sent successfully."}
 
-@app.post("/watchers/trigger-scan", status_code=status.HTTP_200_OK, tags=["Watchers"])
+@app.post("/watchers/trigger-scan", response_model=schemas.ScanJobRead, status_code=status.HTTP_202_ACCEPTED, tags=["Watchers"])
 @limiter.limit("10/minute")
 def trigger_watcher_scan(
     request: Request, 
-    current_user: models.User = Depends(get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_principal),
     db: Session = Depends(get_db)
 ):
     """
-    Manually trigger the watcher scan process for the current user's active watchers.
-    This will scan the blockchain for new transactions and create events if any are found.
+    Queue a background scan of the current user's active watchers.
+    Returns the scan job immediately; poll GET /scan-jobs/{job_id} for progress.
+    If the user already has a queued or running scan, that job is returned instead.
     """
-    from . import watcher as watcher_module
-    
-    # Get user's active watchers
-    def get_user_active_watchers():
-        return crud.get_active_watchers_for_user(db, user_id=current_user.id)
-    
-    # Create event function
-    def create_event_wrapper(event_data: schemas.TokenEventCreate):
-        return crud.create_event(db, event_data)
-    
-    # Run the polling process
     try:
-        watcher_module.poll_and_notify(
-            db=db,
-            get_active_watchers_func=get_user_active_watchers,
-            create_event_func=create_event_wrapper
-        )
-        return {"detail": "Watcher scan completed successfully. Check events page for results."}
+        job, _ = scan_jobs.enqueue_scan_job(db, user_id=current_user.id)
+        return job
     except Exception as e:
-        logger.error(f"Error during manual watcher scan: {e}")
+        logger.error(f"Error queuing manual watcher scan: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error during watcher scan: {str(e)}"
+            detail=f"Error queuing watcher scan: {str(e)}"
         )
 
+@app.get("/scan-jobs/{job_id}", response_model=schemas.ScanJobRead, tags=["Watchers"])
+def read_scan_job(
+    job_id: int,
+    current_user: auth.Principal = Depends(auth.get_current_principal),
+    db: Session = Depends(get_db)
+):
+    job = crud.get_scan_job(db, job_id=job_id, owner_id=current_user.id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Scan job not found")
+    return job
+
 @app.get("/tokens/{contract_address}/volume", response_model=schemas.TokenRead, tags=["Tokens"])
 @limiter.limit("60/minute")
 def read_token_total_volume(request: Request, contract_address: str, db: Session = Depends(get_db)):
@@ -3,6 +3,7 @@
 from sqlalchemy import (
     Column,
     Integer,
+    BigInteger,
     String,
     Float,
     Numeric,
@@ -11,16 +12,22 @@ from sqlalchemy import (
     DateTime,
     UniqueConstraint,
     PrimaryKeyConstraint,
-    DECIMAL
+    Index,
+    Computed,
+    DDL,
+    DECIMAL,
+    event,
+    text
 )
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import relationship, Mapped, mapped_column, Session
+from sqlalchemy.orm import relationship, Mapped, mapped_column
 from sqlalchemy.sql import func
 from datetime import datetime, timezone
 from typing import List, Dict, Any, Optional
 
-from .database import Base, engine
+from .database import Base
 from .config import settings
+from . import plan_cache
 
 class Plan(Base):
     __tablename__ = "plans"
@@ -84,25 +91,20 @@ class User(Base):
         if self.subscription and self.subscription.status == 'active':
             if self.subscription.watcher_limit_override is not None:
                 return self.subscription.watcher_limit_override
+            cached_limit = plan_cache.get_watcher_limit(self.subscription.plan_id)
+            if cached_limit is not None:
+                return cached_limit
             return self.subscription.plan.watcher_limit
         
         # Fallback for Free plan or users without active subscription
-        free_plan_limit = settings.DEFAULT_WATCHER_LIMIT
-        try:
-            with Session(engine) as session:
-                free_plan = session.query(Plan).filter(Plan.name == "Free").first()
-                if free_plan:
-                    return free_plan.watcher_limit
-                return free_plan_limit
-        except Exception:
-             return free_plan_limit
+        return plan_cache.get_free_plan_watcher_limit()
 
 
 class Watcher(Base):
     __tablename__ = "watchers"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    owner_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"))
+    owner_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), index=True)
     name: Mapped[str] = mapped_column(String, index=True)
     token_address: Mapped[str] = mapped_column(String, index=True)
     threshold: Mapped[float] = mapped_column(Numeric(30, 18))
@@ -121,6 +123,26 @@ class Watcher(Base):
     events: Mapped[List["TokenEvent"]] = relationship(
         "TokenEvent", back_populates="watcher", cascade="all, delete-orphan"
     )
+    cursor: Mapped[Optional["WatcherCursor"]] = relationship(
+        "WatcherCursor", back_populates="watcher", cascade="all, delete-orphan", uselist=False
+    )
+
+class WatcherCursor(Base):
+    """
+    Último bloque escaneado por cada watcher, se haya creado un evento o no.
+    Permite obtener el start_block con una lectura por clave primaria.
+    """
+    __tablename__ = "watcher_cursors"
+
+    watcher_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("watchers.id", ondelete="CASCADE"), primary_key=True
+    )
+    last_scanned_block: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+    watcher: Mapped["Watcher"] = relationship("Watcher", back_populates="cursor")
 
 class Transport(Base):
     __tablename__ = "transports"
@@ -138,12 +160,19 @@ class TokenEvent(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True, autoincrement=True)
     watcher_id: Mapped[int] = mapped_column(Integer, ForeignKey("watchers.id"))
     token_address_observed: Mapped[str] = mapped_column(String, index=True)
+    # Copia en minúsculas (columna generada) para filtrar por dirección (igualdad o subcadena) usando índice
+    token_address_lc: Mapped[Optional[str]] = mapped_column(
+        String, Computed("lower(token_address_observed)", persisted=True)
+    )
+    # El poller guarda from/to siempre en minúsculas
     from_address: Mapped[str] = mapped_column(String, index=True)
     to_address: Mapped[str] = mapped_column(String, index=True)
     
     amount: Mapped[float] = mapped_column(Numeric(78, 18))
     
     transaction_hash: Mapped[str] = mapped_column(String, index=True)
+    # Posición de la transferencia dentro de la transacción (una tx puede mover el token varias veces)
+    log_index: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
     block_number: Mapped[int] = mapped_column(Integer)
     usd_value: Mapped[Optional[float]] = mapped_column(
         DECIMAL(20, 4), nullable=True
@@ -163,5 +192,134 @@ class TokenEvent(Base):
         UniqueConstraint(
             "transaction_hash", "id", "created_at", name="uq_tx_hash_id_created"
         ),
+        # Clave de deduplicación. En una tabla particionada la clave de partición debe formar
+        # parte de cualquier UNIQUE, por eso created_at es el timestamp del bloque (determinista).
+        UniqueConstraint(
+            "watcher_id", "transaction_hash", "log_index", "created_at", name="uq_events_watcher_tx_log"
+        ),
+        # Filtros de /events/ (crud.build_owner_events_query): eventos de un watcher por fecha y keyset,
+        # dirección de token por igualdad o subcadena y búsqueda de símbolo por subcadena (pg_trgm).
+        Index("ix_events_watcher_created", "watcher_id", "created_at", "id"),
+        Index("ix_events_token_address_lc", "token_address_lc", postgresql_ops={"token_address_lc": "varchar_pattern_ops"}),
+        Index(
+            "ix_events_token_address_lc_trgm", "token_address_lc",
+            postgresql_using="gin", postgresql_ops={"token_address_lc": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_events_token_symbol_trgm", "token_symbol",
+            postgresql_using="gin", postgresql_ops={"token_symbol": "gin_trgm_ops"},
+        ),
         {"postgresql_partition_by": "RANGE (created_at)"},
     )
+
+# El índice trigram de token_symbol necesita la extensión pg_trgm antes de crear las tablas.
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+class TokenPricePoint(Base):
+    """
+    Serie histórica de precios USD por token (caché local de CoinGecko market_chart/range).
+    Permite valorar cada transferencia al precio de su bloque sin una petición por punto.
+    """
+    __tablename__ = "token_price_points"
+
+    platform: Mapped[str] = mapped_column(String, primary_key=True)
+    token_address: Mapped[str] = mapped_column(String, primary_key=True)
+    timestamp: Mapped[int] = mapped_column(BigInteger, primary_key=True, comment="Unix (segundos)")
+    price_usd: Mapped[float] = mapped_column(Float, nullable=False)
+
+class ScanJob(Base):
+    """
+    Escaneo manual lanzado desde POST /watchers/trigger-scan y ejecutado en segundo plano.
+    Solo puede haber un job en cola o en curso por usuario (índice único parcial), así que
+    los disparos repetidos se agrupan en el job existente.
+    """
+    __tablename__ = "scan_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    status: Mapped[str] = mapped_column(String, nullable=False, default="queued")  # queued | running | succeeded | failed
+    watchers_total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    tokens_total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    tokens_done: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    events_found: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    errors: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    error_message: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index(
+            "uq_scan_jobs_user_active", "user_id", unique=True,
+            postgresql_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+class NotificationOutbox(Base):
+    """
+    Cola persistente de notificaciones: el poller inserta una fila por transporte en la misma
+    transacción que los eventos y notification_worker.py las entrega, con reintentos y dead-letter.
+    Guarda una copia del watcher, del transporte y de los eventos, así que la entrega no depende
+    de que esas filas sigan igual (o existan) cuando se envía.
+    """
+    __tablename__ = "notification_outbox"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    watcher_id: Mapped[int] = mapped_column(Integer, ForeignKey("watchers.id", ondelete="CASCADE"), nullable=False, index=True)
+    transport_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    transport_type: Mapped[str] = mapped_column(String, nullable=False)
+    transport_config: Mapped[Dict[str, Any]] = mapped_column(JSONB, nullable=False)
+    payload: Mapped[Dict[str, Any]] = mapped_column(JSONB, nullable=False)
+    status: Mapped[str] = mapped_column(String, nullable=False, default="pending")  # pending | sending | sent | dead
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_error: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    locked_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_notification_outbox_claim", "transport_type", "status", "next_attempt_at"),
+    )
+
+class ArchivedEventObject(Base):
+    """
+    Objeto de eventos archivado en S3 por scripts/cleanup_and_archive.py, indexado a partir de su
+    manifest. cold_storage.py lo usa para descargar solo los objetos con eventos de los watchers y
+    el rango de fechas de una consulta.
+    """
+    __tablename__ = "archived_event_objects"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    key: Mapped[str] = mapped_column(String, unique=True, nullable=False)
+    run_id: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    format: Mapped[str] = mapped_column(String, nullable=False)  # ndjson.gz | parquet
+    # Solo en Parquet, que guarda un objeto por mes y token
+    token_address: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    rows: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    bytes: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    created_at_min: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    created_at_max: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    block_number_min: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    block_number_max: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    indexed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    watchers: Mapped[List["ArchivedEventObjectWatcher"]] = relationship(
+        back_populates="archived_object", cascade="all, delete-orphan"
+    )
+
+    __table_args__ = (
+        Index("ix_archived_event_objects_range", "created_at_min", "created_at_max"),
+    )
+
+class ArchivedEventObjectWatcher(Base):
+    """Watchers con eventos en un objeto archivado. Sin FK a watchers: el archivo sobrevive al watcher."""
+    __tablename__ = "archived_event_object_watchers"
+
+    watcher_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    object_id: Mapped[int] = mapped_column(
+        BigInteger, ForeignKey("archived_event_objects.id", ondelete="CASCADE"), primary_key=True, index=True
+    )
+
+    archived_object: Mapped["ArchivedEventObject"] = relationship(back_populates="watchers")
@@ -0,0 +1,261 @@
+# api/app/notification_worker.py
+#
+# Entrega de notificaciones: python -m api.app.notification_worker [slack discord ...]
+# Vacía notification_outbox con un hilo por tipo de transporte, de modo que un webhook lento
+# (o un rate limit de Telegram) solo retrasa a su propio transporte y nunca al poller.
+# El hilo nunca duerme esperando a un destino limitado: la fila se reprograma para cuando el
+# destino vuelva a aceptar envíos y se sigue con las demás.
+
+import json
+import logging
+import random
+import signal
+import sys
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import crud, email_utils, notifier, schemas
+from .config import settings
+from .database import SessionLocal
+from .rate_limiter import DestinationThrottled
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+TRANSPORT_TYPES = ("slack", "discord", "email", "telegram")
+
+
+def _retry_delay(attempts: int) -> float:
+    delay = settings.NOTIFY_BACKOFF_BASE * 30 * (2 ** (min(attempts, 16) - 1))
+    return min(delay * random.uniform(1.0, 1.25), settings.NOTIFY_OUTBOX_BACKOFF_MAX_SECONDS)
+
+
+def deliver(item: Dict[str, Any]) -> bool:
+    """
+    Envía una fila reservada del outbox con el notificador de su transporte, sin esperar turno:
+    si el destino está limitado lanza DestinationThrottled.
+    """
+    payload = item["payload"]
+    watcher_obj = SimpleNamespace(**payload["watcher"])
+    events_list = [schemas.TokenEventRead.model_validate(event) for event in payload["events"]]
+    return notifier.send_via_transport(item["transport_type"], item["transport_config"], watcher_obj, events_list, wait=False)
+
+
+def _digest_name(watcher_names: List[str]) -> str:
+    unique_names = list(dict.fromkeys(watcher_names))
+    if len(unique_names) <= 3:
+        return ", ".join(unique_names)
+    return f"{', '.join(unique_names[:3])} +{len(unique_names) - 3} more"
+
+
+def coalesce_digests(claimed: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Une en una sola notificación las filas reservadas que van al mismo destino en modo digest
+    (digest_window_seconds en la config del transporte) y son del mismo usuario, aunque vengan
+    de watchers distintos. Las filas sin owner_id no se unen con ninguna otra: dos usuarios pueden
+    compartir destino. Cada elemento devuelto lleva en "ids" las filas del outbox que cubre.
+    Si el digest mezcla tokens, su watcher se queda sin token_address y los notificadores
+    muestran el token de cada evento (token_address_observed).
+    """
+    merged: List[Dict[str, Any]] = []
+    digests: Dict[Tuple[Any, str], Dict[str, Any]] = {}
+    for item in claimed:
+        config = item["transport_config"] or {}
+        owner_id = item["payload"]["watcher"].get("owner_id")
+        if not config.get("digest_window_seconds") or owner_id is None:
+            merged.append({**item, "ids": [item["id"]]})
+            continue
+        key = (owner_id, json.dumps(config, sort_keys=True))
+        digest = digests.get(key)
+        if digest is None:
+            digest = digests[key] = {**item, "ids": [], "watcher_names": [], "payload": {"watcher": dict(item["payload"]["watcher"]), "events": []}}
+            merged.append(digest)
+        digest_watcher = digest["payload"]["watcher"]
+        if (digest_watcher.get("token_address") or "").lower() != (item["payload"]["watcher"].get("token_address") or "").lower():
+            digest_watcher["token_address"] = None
+        digest["ids"].append(item["id"])
+        digest["attempts"] = max(digest["attempts"], item["attempts"])
+        digest["watcher_names"].append(item["payload"]["watcher"]["name"])
+        digest["payload"]["events"].extend(item["payload"]["events"])
+
+    for digest in digests.values():
+        digest["payload"]["watcher"]["name"] = _digest_name(digest.pop("watcher_names"))
+        digest["payload"]["events"].sort(key=lambda event: (event["block_number"], event.get("log_index") or 0))
+        if len(digest["ids"]) > 1:
+            logger.info(f"📦 [OUTBOX_DIGEST] {len(digest['ids'])} notificaciones ({len(digest['payload']['events'])} eventos) unidas en un envío de '{digest['transport_type']}'.")
+    return merged
+
+
+def _deliver_one(item: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
+    try:
+        delivered = deliver(item)
+        return delivered, None if delivered else "El transporte rechazó o no confirmó el envío."
+    except DestinationThrottled:
+        raise
+    except Exception as e_deliver:
+        logger.exception(f"❌ [OUTBOX] Error inesperado al entregar la notificación {item['id']}: {e_deliver!r}")
+        return False, repr(e_deliver)
+
+
+def deliver_email_batch(claimed: List[Dict[str, Any]]) -> List[Tuple[bool, Optional[str]]]:
+    """
+    Entrega todas las alertas de email reservadas con el endpoint batch de Resend
+    (una petición por cada RESEND_BATCH_LIMIT emails) y devuelve el resultado de cada fila.
+    """
+    results: List[Tuple[bool, Optional[str]]] = [(True, None)] * len(claimed)
+    pending_indexes, emails = [], []
+    for index, item in enumerate(claimed):
+        to_email = (item["transport_config"] or {}).get("email")
+        if not to_email:
+            logger.info(f"Configuración de email incompleta para Watcher ID={item['watcher_id']}. Saltando Email.")
+            continue
+        try:
+            payload = item["payload"]
+            events_list = [schemas.TokenEventRead.model_validate(event) for event in payload["events"]]
+            emails.append(email_utils.build_token_alert_email(to_email, payload["watcher"]["name"], events_list))
+            pending_indexes.append(index)
+        except Exception as e_build:
+            logger.exception(f"❌ [OUTBOX] No se pudo construir el email de la notificación {item['id']}: {e_build!r}")
+            results[index] = (False, repr(e_build))
+
+    if emails:
+        accepted = email_utils.send_email_batch(emails)
+        for index, ok in zip(pending_indexes, accepted):
+            results[index] = (True, None) if ok else (False, "Resend rechazó o no confirmó el email.")
+    return results
+
+
+def process_batch(db: Session, transport_type: str) -> int:
+    """Reserva y entrega un lote de un transporte. Devuelve cuántas filas procesó."""
+    claimed = crud.claim_outbox_batch(
+        db, transport_type, limit=_batch_size(transport_type), lease_seconds=settings.NOTIFY_OUTBOX_LEASE_SECONDS
+    )
+    items = coalesce_digests(claimed)
+    if transport_type == "email" and items:
+        try:
+            outcomes = deliver_email_batch(items)
+        except Exception as e_batch:
+            logger.exception(f"❌ [OUTBOX] Error inesperado al entregar el lote de emails: {e_batch!r}")
+            outcomes = [(False, repr(e_batch))] * len(items)
+        for item, (delivered, error) in zip(items, outcomes):
+            _record_outcome(db, transport_type, item, delivered, error)
+        return len(claimed)
+
+    rows_by_id = {row["id"]: row for row in claimed}
+    for item in items:
+        try:
+            delivered, error = _deliver_one(item)
+        except DestinationThrottled as e_throttled:
+            _defer_throttled(db, transport_type, item, rows_by_id, e_throttled)
+            continue
+        _record_outcome(db, transport_type, item, delivered, error)
+    return len(claimed)
+
+
+def _record_outcome(db: Session, transport_type: str, item: Dict[str, Any], delivered: bool, error: Optional[str]) -> None:
+    if delivered:
+        for outbox_id in item["ids"]:
+            crud.mark_outbox_sent(db, outbox_id)
+    elif item["attempts"] >= settings.NOTIFY_OUTBOX_MAX_ATTEMPTS:
+        logger.error(f"☠️ [OUTBOX_DEAD] Notificación(es) {item['ids']} ({transport_type}, Watcher ID={item['watcher_id']}) descartada(s) tras {item['attempts']} intentos.")
+        for outbox_id in item["ids"]:
+            crud.mark_outbox_failed(db, outbox_id, error, retry_in_seconds=None)
+    else:
+        delay = _retry_delay(item["attempts"])
+        logger.warning(f"⚠️ [OUTBOX_RETRY] Notificación(es) {item['ids']} ({transport_type}) falló (intento {item['attempts']}); reintento en {delay:.0f}s.")
+        for outbox_id in item["ids"]:
+            crud.mark_outbox_failed(db, outbox_id, error, retry_in_seconds=delay)
+
+
+def _defer_throttled(
+    db: Session, transport_type: str, item: Dict[str, Any], rows_by_id: Dict[int, Dict[str, Any]], throttled: DestinationThrottled
+) -> None:
+    """
+    Reprograma las filas de un envío cuyo destino está limitado para cuando vuelva a aceptar envíos,
+    sin contar un intento. Si parte del envío ya salió (delivered_events), cada fila guarda solo sus
+    eventos pendientes y la que ya no tiene ninguno se da por enviada.
+    """
+    delivered_ids = {event.get("id") for event in item["payload"]["events"][:throttled.delivered_events]}
+    logger.info(
+        f"⏳ [OUTBOX_THROTTLED] Destino '{throttled.kind}' limitado: notificación(es) {item['ids']} ({transport_type}) "
+        f"reprogramada(s) en {throttled.retry_after:.1f}s ({throttled.delivered_events} evento(s) ya entregado(s))."
+    )
+    for outbox_id in item["ids"]:
+        payload = rows_by_id[outbox_id]["payload"]
+        remaining = [event for event in payload["events"] if event.get("id") not in delivered_ids]
+        if not remaining:
+            crud.mark_outbox_sent(db, outbox_id)
+        elif len(remaining) < len(payload["events"]):
+            crud.defer_outbox(db, outbox_id, throttled.retry_after, payload={**payload, "events": remaining})
+        else:
+            crud.defer_outbox(db, outbox_id, throttled.retry_after)
+
+
+def _batch_size(transport_type: str) -> int:
+    # El email se entrega en bloque, así que se reserva un lote del tamaño del batch de Resend.
+    if transport_type == "email":
+        return max(settings.NOTIFY_OUTBOX_BATCH_SIZE, email_utils.RESEND_BATCH_LIMIT)
+    return settings.NOTIFY_OUTBOX_BATCH_SIZE
+
+
+def run_transport_worker(transport_type: str, stop_event: threading.Event) -> None:
+    logger.info(f"▶ [OUTBOX] Worker de '{transport_type}' iniciado.")
+    while not stop_event.is_set():
+        db = SessionLocal()
+        try:
+            processed = process_batch(db, transport_type)
+        except Exception as e_batch:
+            logger.exception(f"❌ [OUTBOX] Error en el worker de '{transport_type}': {e_batch!r}")
+            processed = 0
+        finally:
+            db.close()
+        if processed < _batch_size(transport_type):
+            stop_event.wait(settings.NOTIFY_OUTBOX_POLL_SECONDS)
+    logger.info(f"▶ [OUTBOX] Worker de '{transport_type}' detenido.")
+
+
+def _purge_sent(stop_event: threading.Event) -> None:
+    while not stop_event.is_set():
+        db = SessionLocal()
+        try:
+            deleted = crud.purge_sent_notifications(db, settings.NOTIFY_OUTBOX_RETENTION_DAYS)
+            if deleted:
+                logger.info(f"🧹 [OUTBOX] {deleted} notificación(es) enviada(s) eliminada(s) del outbox.")
+        except Exception as e_purge:
+            logger.exception(f"❌ [OUTBOX] Error al purgar notificaciones enviadas: {e_purge!r}")
+        finally:
+            db.close()
+        stop_event.wait(3600)
+
+
+def main(transport_types: List[str]) -> None:
+    stop_event = threading.Event()
+
+    def _request_stop(signum, frame):
+        logger.info(f"🛑 [OUTBOX] Señal {signum} recibida. Terminando tras el lote en curso...")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    threads = [
+        threading.Thread(target=run_transport_worker, args=(transport_type, stop_event), name=f"outbox-{transport_type}")
+        for transport_type in transport_types
+    ]
+    threads.append(threading.Thread(target=_purge_sent, args=(stop_event,), name="outbox-purge", daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        if not thread.daemon:
+            thread.join()
+
+
+if __name__ == "__main__":
+    requested = [arg.lower() for arg in sys.argv[1:]] or list(TRANSPORT_TYPES)
+    unknown = [t for t in requested if t not in TRANSPORT_TYPES]
+    if unknown:
+        sys.exit(f"Transportes desconocidos: {', '.join(unknown)}. Válidos: {', '.join(TRANSPORT_TYPES)}")
+    main(requested)
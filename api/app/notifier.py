@@ -1,23 +1,75 @@
 # api/app/notifier.py
-import time
 import requests 
 import json
 import re
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from .config import settings
 from . import email_utils
 from . import schemas
-from .clients import telegram_client
+from .clients import telegram_client, http_client
+from .rate_limiter import DestinationThrottled, notification_limiter
 import logging
 
 logger = logging.getLogger(__name__)
 
 MAX_FIELD_VALUE_LENGTH = 1024
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
 
-def _backoff_sleep(attempt: int, max_retries: int, base_delay: float) -> None:
-    delay = base_delay * (2 ** (attempt - 1))
-    logger.warning(f"Rate limited o error. Reintento {attempt}/{max_retries} después de {delay:.2f}s")
-    time.sleep(delay)
+def _retry_after_seconds(response: requests.Response, default: float) -> float:
+    """Segundos a esperar según un 429: cabecera Retry-After o campo retry_after del JSON (Discord)."""
+    header_value = response.headers.get("Retry-After")
+    try:
+        if header_value is not None:
+            return max(0.0, float(header_value))
+        body = response.json()
+        if isinstance(body, dict) and body.get("retry_after") is not None:
+            return max(0.0, float(body["retry_after"]))
+    except (ValueError, TypeError):
+        pass
+    return default
+
+def _take_turn(kind: str, key: Any, wait: bool) -> None:
+    """
+    Espera turno en el límite del destino o, con wait=False, lanza DestinationThrottled en lugar de
+    dormir el hilo: el worker del outbox reprograma la fila y sigue con los demás destinos.
+    """
+    if wait:
+        notification_limiter.acquire(kind, key)
+        return
+    retry_after = notification_limiter.try_acquire(kind, key)
+    if retry_after > 0:
+        raise DestinationThrottled(kind, retry_after)
+
+def _post_webhook(kind: str, webhook_url: str, payload: Dict[str, Any], label: str, watcher_id: Any, wait: bool = True) -> bool:
+    """
+    POST a un webhook respetando el límite compartido del destino (rate_limiter.notification_limiter).
+    Un 429 bloquea el destino durante su Retry-After para todos los watchers que lo usan; los demás
+    errores lo bloquean con backoff exponencial. Devuelve True si el envío se confirmó.
+    Con wait=False no duerme nunca: un destino limitado lanza DestinationThrottled y un error
+    devuelve False sin reintentar aquí (el outbox lo reintenta con su propio backoff).
+    """
+    for attempt in range(1, settings.NOTIFY_MAX_RETRIES + 1):
+        _take_turn(kind, webhook_url, wait)
+        backoff = settings.NOTIFY_BACKOFF_BASE * (2 ** (attempt - 1))
+        try:
+            resp = http_client.post(webhook_url, json=payload, timeout=10)
+            if resp.status_code == 429:
+                retry_after = _retry_after_seconds(resp, default=backoff)
+                logger.warning(f"{label} rate limited para Watcher ID='{watcher_id}' (intento {attempt}). Destino en pausa {retry_after:.2f}s.")
+                notification_limiter.penalize(kind, webhook_url, retry_after)
+                if not wait:
+                    raise DestinationThrottled(kind, retry_after)
+                continue
+            resp.raise_for_status()
+            return True
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Fallo en API {label} (intento {attempt}) para Watcher ID='{watcher_id}': {e}")
+            if attempt < settings.NOTIFY_MAX_RETRIES:
+                notification_limiter.penalize(kind, webhook_url, backoff)
+            if not wait:
+                return False
+    logger.error(f"Fallo notificación {label} para Watcher ID='{watcher_id}' después de {settings.NOTIFY_MAX_RETRIES} intentos.")
+    return False
 
 def _truncate_field(value: str, length: int = MAX_FIELD_VALUE_LENGTH) -> str:
     if len(str(value)) > length:
@@ -30,13 +82,22 @@ def escape_markdown_v2(text: str) -> str:
     escape_chars = r'_*[]()~`>#+-=|{}.!'
     return re.sub(f'([{re.escape(escape_chars)}])', r'\\\1', text)
 
-def notify_slack_blockkit(webhook_url: Optional[str], watcher_obj: Any, events_list: List[Any]) -> None:
+def _event_token(watcher_obj: Any, event_item: Any) -> Tuple[str, Any]:
+    """
+    Token que se muestra junto a cada evento: el del watcher o, en un digest que mezcla
+    varios tokens (watcher sin token_address), el observado en el propio evento.
+    """
+    if getattr(watcher_obj, "token_address", None):
+        return "Token Address (Watcher)", watcher_obj.token_address
+    return "Token Address", getattr(event_item, "token_address_observed", None) or "N/A"
+
+def notify_slack_blockkit(webhook_url: Optional[str], watcher_obj: Any, events_list: List[Any], wait: bool = True) -> bool:
     if not webhook_url or "example.com" in webhook_url:
         logger.info(f"Slack webhook URL no válida para Watcher ID={watcher_obj.id}. Saltando Slack.")
-        return
+        return True
     if not events_list:
         logger.info(f"Lista de eventos vacía para Watcher ID={watcher_obj.id}, no se enviará notificación a Slack.")
-        return
+        return True
 
     blocks: List[Dict[str, Any]] = []
     blocks.append({
@@ -56,14 +117,15 @@ def notify_slack_blockkit(webhook_url: Optional[str], watcher_obj: Any, events_l
         etherscan_url = f"{settings.ETHERSCAN_TX_URL}/{event_item.transaction_hash}"
         when_utc = event_item.created_at.strftime("%Y-%m-%d %H:%M:%S UTC") if hasattr(event_item, 'created_at') and event_item.created_at else "N/A"
         
+        token_label, token_address = _event_token(watcher_obj, event_item)
         fields = [
-            {"type": "mrkdwn", "text": f"*Token Address (Watcher):*\n`{watcher_obj.token_address}`"},
+            {"type": "mrkdwn", "text": f"*{token_label}:*\n`{token_address}`"},
             {"type": "mrkdwn", "text": f"*Amount:*\n{event_item.amount:.4f}"},
             {"type": "mrkdwn", "text": f"*Block:*\n{event_item.block_number}"},
             {"type": "mrkdwn", "text": f"*When (Detected UTC):*\n{when_utc}"},
             {"type": "mrkdwn", "text": f"*Transaction:*\n<{etherscan_url}|View on Etherscan>"},
         ]
-        if hasattr(event_item, 'token_address_observed') and event_item.token_address_observed != watcher_obj.token_address:
+        if watcher_obj.token_address and hasattr(event_item, 'token_address_observed') and event_item.token_address_observed != watcher_obj.token_address:
              fields.insert(1, {"type": "mrkdwn", "text": f"*Actual Token (Event):*\n`{event_item.token_address_observed}`"})
 
         blocks.append({"type": "section", "fields": fields})
@@ -71,33 +133,26 @@ def notify_slack_blockkit(webhook_url: Optional[str], watcher_obj: Any, events_l
             blocks.append({"type": "divider"})
     
     if not blocks:
-        return
+        return True
 
     payload = {"blocks": blocks}
     
-    for attempt in range(1, settings.NOTIFY_MAX_RETRIES + 1):
-        try:
-            resp = requests.post(webhook_url, json=payload, timeout=10)
-            resp.raise_for_status()
-            logger.info(f"Notificación Slack enviada para Watcher ID='{watcher_obj.id}'.")
-            return
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Fallo en API Slack (intento {attempt}) para Watcher ID='{watcher_obj.id}': {e}")
-            if attempt < settings.NOTIFY_MAX_RETRIES:
-                _backoff_sleep(attempt, settings.NOTIFY_MAX_RETRIES, settings.NOTIFY_BACKOFF_BASE)
-            else:
-                logger.error(f"Fallo notificación Slack para Watcher ID='{watcher_obj.id}' después de {settings.NOTIFY_MAX_RETRIES} intentos.")
+    if _post_webhook("slack_webhook", webhook_url, payload, "Slack", watcher_obj.id, wait=wait):
+        logger.info(f"Notificación Slack enviada para Watcher ID='{watcher_obj.id}'.")
+        return True
+    return False
 
-def notify_discord_embed(webhook_url: Optional[str], watcher_obj: Any, events_list: List[Any]) -> None:
+def notify_discord_embed(webhook_url: Optional[str], watcher_obj: Any, events_list: List[Any], wait: bool = True) -> bool:
     if not webhook_url or "example.com" in webhook_url:
         logger.info(f"Discord webhook URL no válida para Watcher ID={watcher_obj.id}. Saltando notificación Discord.")
-        return
+        return True
     if not events_list:
         logger.info(f"Lista de eventos vacía para Watcher ID={watcher_obj.id}, no se enviarán notificaciones a Discord.")
-        return
+        return True
 
     batch_size = min(settings.DISCORD_BATCH_SIZE, 10) 
     if batch_size <= 0: batch_size = 1
+    all_batches_sent = True
 
     for i in range(0, len(events_list), batch_size):
         current_batch_events = events_list[i:i + batch_size]
@@ -114,14 +169,15 @@ def notify_discord_embed(webhook_url: Optional[str], watcher_obj: Any, events_li
                 except AttributeError:
                     when_utc = str(event_item.created_at)
 
+            token_label, token_address = _event_token(watcher_obj, event_item)
             embed_fields = [
-                {"name": "Token Address (Watcher)", "value": _truncate_field(f"`{watcher_obj.token_address}`"), "inline": False},
+                {"name": token_label, "value": _truncate_field(f"`{token_address}`"), "inline": False},
                 {"name": "Amount",   "value": _truncate_field(f"{event_item.amount:.4f}"),    "inline": True},
                 {"name": "Block",    "value": _truncate_field(str(event_item.block_number)),      "inline": True},
                 {"name": "When (Detected UTC)",     "value": _truncate_field(when_utc),                       "inline": False},
                 {"name": "Transaction", "value": f"[View on Etherscan]({etherscan_url})", "inline": False},
             ]
-            if hasattr(event_item, 'token_address_observed') and event_item.token_address_observed != watcher_obj.token_address:
+            if watcher_obj.token_address and hasattr(event_item, 'token_address_observed') and event_item.token_address_observed != watcher_obj.token_address:
                 embed_fields.insert(1, {"name": "Actual Token (Event)", "value": _truncate_field(f"`{event_item.token_address_observed}`"), "inline": False})
 
             embed_title_suffix = ""
@@ -140,46 +196,23 @@ def notify_discord_embed(webhook_url: Optional[str], watcher_obj: Any, events_li
             continue
 
         payload = {"embeds": embeds}
-        success_this_batch = False
-        response_from_discord = None 
-        for attempt in range(1, settings.NOTIFY_MAX_RETRIES + 1):
-            try:
-                response_from_discord = requests.post(webhook_url, json=payload, timeout=10)
-                response_from_discord.raise_for_status()
-                logger.info(f"Lote de Discord enviado para Watcher ID='{watcher_obj.id}'.")
-                success_this_batch = True
-                break 
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Fallo en API Discord para lote (intento {attempt}) Watcher ID='{watcher_obj.id}': {e}")
-                status_code_for_rate_limit = response_from_discord.status_code if response_from_discord is not None else None
-                if status_code_for_rate_limit == 429:
-                    retry_after_str = response_from_discord.headers.get("Retry-After", str(settings.NOTIFY_BACKOFF_BASE * (2 ** (attempt - 1))))
-                    try:
-                        retry_after_seconds = float(retry_after_str)
-                        if retry_after_seconds > 1000:
-                             retry_after_seconds /= 1000.0
-                    except ValueError:
-                        retry_after_seconds = settings.NOTIFY_BACKOFF_BASE * (2 ** (attempt - 1))
-                    logger.warning(f"Discord sugiere esperar {retry_after_seconds:.2f}s. Aplicando delay.")
-                    time.sleep(max(0.1, retry_after_seconds) + 0.5)
-                    if attempt >= settings.NOTIFY_MAX_RETRIES:
-                        logger.error(f"Falló envío de lote de Discord para Watcher ID='{watcher_obj.id}' después de {settings.NOTIFY_MAX_RETRIES} intentos (con rate limit).")
-                        break 
-                    continue 
-                if attempt < settings.NOTIFY_MAX_RETRIES:
-                    _backoff_sleep(attempt, settings.NOTIFY_MAX_RETRIES, settings.NOTIFY_BACKOFF_BASE)
-                else:
-                    logger.error(f"Falló envío de lote de Discord para Watcher ID='{watcher_obj.id}' después de {settings.NOTIFY_MAX_RETRIES} intentos.")
-        
-        if success_this_batch and (i + batch_size) < len(events_list): 
-            logger.info("Esperando ~1-2s antes de enviar el siguiente lote de Discord...")
-            time.sleep(1.5)
+        try:
+            sent = _post_webhook("discord_webhook", webhook_url, payload, "Discord", watcher_obj.id, wait=wait)
+        except DestinationThrottled as e_throttled:
+            # Los lotes anteriores ya se enviaron: el reintento solo debe llevar los que faltan.
+            e_throttled.delivered_events = i if all_batches_sent else 0
+            raise
+        if sent:
+            logger.info(f"Lote de Discord enviado para Watcher ID='{watcher_obj.id}'.")
+        else:
+            all_batches_sent = False
+    return all_batches_sent
 
-def notify_email_batch(transport_config: Dict[str, Any], watcher_obj: Any, events_list: List[schemas.TokenEventRead]):
+def notify_email_batch(transport_config: Dict[str, Any], watcher_obj: Any, events_list: List[schemas.TokenEventRead]) -> bool:
     to_email = transport_config.get("email")
     if not to_email:
         logger.info(f"Configuración de email incompleta para Watcher ID={watcher_obj.id}. Saltando Email.")
-        return
+        return True
     logger.info(f"Procesando {len(events_list)} evento(s) para enviar un email de resumen a {to_email}...")
     try:
         success = email_utils.send_token_alert_email_batch(to_email=to_email, watcher_name=watcher_obj.name, events=events_list)
@@ -187,37 +220,135 @@ def notify_email_batch(transport_config: Dict[str, Any], watcher_obj: Any, event
             logger.info(f"Email de resumen enviado a {to_email} para {len(events_list)} evento(s).")
         else:
             logger.error(f"Fallo al enviar email de resumen a {to_email}.")
+        return bool(success)
     except Exception as e:
         logger.exception(f"Excepción al construir o enviar email de resumen: {e}")
+        return False
+
+def _telegram_length(text: str) -> int:
+    # Telegram mide el límite en unidades UTF-16 (los emoji cuentan doble).
+    return len(text.encode("utf-16-le")) // 2
+
+def _render_telegram_event(event: schemas.TokenEventRead) -> str:
+    amount_formatted = escape_markdown_v2(f"{event.amount:,.4f} {event.token_symbol or ''}".strip())
+    usd_value_formatted = escape_markdown_v2(f"${event.usd_value:,.2f} USD") if event.usd_value is not None else "N/A"
+    from_addr_escaped = escape_markdown_v2(event.from_address)
+    to_addr_escaped = escape_markdown_v2(event.to_address)
+    etherscan_link = f"{settings.ETHERSCAN_TX_URL}/{event.transaction_hash}"
+    return (
+        f"▪️ *Amount*: `{amount_formatted}`\n"
+        f"▪️ *USD Value*: `{usd_value_formatted}`\n"
+        f"▪️ *From*: `{from_addr_escaped}`\n"
+        f"▪️ *To*: `{to_addr_escaped}`\n"
+        f"[View Transaction on Etherscan]({etherscan_link})"
+    )
+
+def _telegram_header(watcher_name_escaped: str, event_count: int, first: int, last: int, part: int, total_parts: int) -> str:
+    # Con varias partes, cada cabecera indica qué eventos lleva (p. ej. "transfers 11–20 of 35").
+    if total_parts > 1:
+        summary = escape_markdown_v2(f"Significant transfers {first}–{last} of {event_count}:")
+    elif event_count == 1:
+        summary = "A significant transfer has been detected:"
+    else:
+        summary = f"{event_count} significant transfers have been detected:"
+    part_suffix = escape_markdown_v2(f" ({part}/{total_parts})") if total_parts > 1 else ""
+    return f"🚨 *{watcher_name_escaped}*{part_suffix}\n\n{summary}\n\n"
+
+def render_telegram_messages(watcher_name: str, events_list: List[schemas.TokenEventRead]) -> List[str]:
+    """
+    Agrupa los eventos en el menor número de mensajes MarkdownV2 que quepan en el límite de
+    Telegram (4096 caracteres), separando en varios mensajes solo cuando no caben en uno.
+    """
+    return [message for message, _ in _render_telegram_parts(watcher_name, events_list)]
+
+def _render_telegram_parts(watcher_name: str, events_list: List[schemas.TokenEventRead]) -> List[Tuple[str, int]]:
+    """Mensajes de render_telegram_messages junto con cuántos eventos lleva cada uno."""
+    watcher_name_escaped = escape_markdown_v2(watcher_name)
+    separator = "\n\n"
+    # Se reserva sitio para la cabecera más larga posible (con "(NN/NN)" y el rango de eventos).
+    event_count = len(events_list)
+    header_budget = max(
+        _telegram_length(_telegram_header(watcher_name_escaped, event_count, event_count, event_count, 99, 99)),
+        _telegram_length(_telegram_header(watcher_name_escaped, event_count, 1, event_count, 1, 1)),
+    )
+    budget = TELEGRAM_MAX_MESSAGE_LENGTH - header_budget
+
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    current_length = 0
+    for event in events_list:
+        entry = _render_telegram_event(event)
+        entry_length = _telegram_length(entry) + (_telegram_length(separator) if current else 0)
+        if current and current_length + entry_length > budget:
+            chunks.append(current)
+            current, current_length = [], 0
+            entry_length = _telegram_length(entry)
+        current.append(entry)
+        current_length += entry_length
+    if current:
+        chunks.append(current)
 
-def notify_telegram_batch(transport_config: Dict[str, Any], watcher_obj: Any, events_list: List[schemas.TokenEventRead]):
+    parts = []
+    first = 1
+    for part, chunk in enumerate(chunks, start=1):
+        last = first + len(chunk) - 1
+        parts.append((_telegram_header(watcher_name_escaped, event_count, first, last, part, len(chunks)) + separator.join(chunk), len(chunk)))
+        first = last + 1
+    return parts
+
+def notify_telegram_batch(transport_config: Dict[str, Any], watcher_obj: Any, events_list: List[schemas.TokenEventRead], wait: bool = True) -> bool:
     bot_token = transport_config.get("bot_token")
     chat_id = transport_config.get("chat_id")
     if not bot_token or not chat_id:
         logger.info(f"Configuración de Telegram incompleta para Watcher ID={watcher_obj.id}. Saltando Telegram.")
-        return
-    logger.info(f"Procesando {len(events_list)} evento(s) para enviar a Telegram Chat ID {chat_id}...")
-    for event in events_list:
+        return True
+    parts = _render_telegram_parts(watcher_obj.name, events_list)
+    logger.info(f"Procesando {len(events_list)} evento(s) en {len(parts)} mensaje(s) para Telegram Chat ID {chat_id}...")
+    all_sent = True
+    delivered_events = 0
+    for text_message, part_event_count in parts:
         try:
-            watcher_name_escaped = escape_markdown_v2(watcher_obj.name)
-            amount_formatted = escape_markdown_v2(f"{event.amount:,.4f} {event.token_symbol or ''}".strip())
-            usd_value_formatted = escape_markdown_v2(f"${event.usd_value:,.2f} USD") if event.usd_value is not None else "N/A"
-            from_addr_escaped = escape_markdown_v2(event.from_address)
-            to_addr_escaped = escape_markdown_v2(event.to_address)
-            etherscan_link = f"{settings.ETHERSCAN_TX_URL}/{event.transaction_hash}"
-            text_message = (
-                f"🚨 *{watcher_name_escaped}*\n\n"
-                f"A significant transfer has been detected:\n\n"
-                f"▪️ *Amount*: `{amount_formatted}`\n"
-                f"▪️ *USD Value*: `{usd_value_formatted}`\n"
-                f"▪️ *From*: `{from_addr_escaped}`\n"
-                f"▪️ *To*: `{to_addr_escaped}`\n\n"
-                f"[View Transaction on Etherscan]({etherscan_link})"
-            )
-            telegram_client.send_telegram_message(bot_token=bot_token, chat_id=chat_id, text=text_message)
-            time.sleep(1)
+            if telegram_client.send_telegram_message(bot_token=bot_token, chat_id=chat_id, text=text_message, wait=wait):
+                delivered_events += part_event_count
+            else:
+                all_sent = False
+        except DestinationThrottled as e_throttled:
+            # Las partes anteriores ya llegaron: el reintento solo debe llevar los eventos que faltan.
+            e_throttled.delivered_events = delivered_events if all_sent else 0
+            raise
         except Exception as e:
-            logger.error(f"Excepción al enviar mensaje de Telegram para evento ID {event.id}: {e}")
+            logger.error(f"Excepción al enviar mensaje de Telegram para Watcher ID {watcher_obj.id}: {e}")
+            all_sent = False
+    return all_sent
+
+def parse_transport_config(transport: Any) -> Optional[Dict[str, Any]]:
+    transport_config = transport.config
+    if isinstance(transport_config, dict):
+        return transport_config
+    try:
+        return json.loads(transport_config) if isinstance(transport_config, str) else {}
+    except json.JSONDecodeError:
+        logger.error(f"El config del transporte ID={transport.id} no es un JSON válido.")
+        return None
+
+def send_via_transport(transport_type: str, transport_config: Dict[str, Any], watcher_obj: Any, events_list: List[schemas.TokenEventRead], wait: bool = True) -> bool:
+    """
+    Envía los eventos por un único transporte. Devuelve True si se entregaron (o si no había
+    nada que enviar) y False si el envío falló y debe reintentarse.
+    Con wait=False (worker del outbox) un destino limitado lanza DestinationThrottled en vez de esperar.
+    """
+    transport_type = transport_type.lower()
+    logger.info(f"-> [DISPATCH] Procesando transporte tipo '{transport_type}' para Watcher ID={watcher_obj.id}")
+    if transport_type == "slack":
+        return notify_slack_blockkit(transport_config.get("url"), watcher_obj, events_list, wait=wait)
+    elif transport_type == "discord":
+        return notify_discord_embed(transport_config.get("url"), watcher_obj, events_list, wait=wait)
+    elif transport_type == "email":
+        return notify_email_batch(transport_config, watcher_obj, events_list)
+    elif transport_type == "telegram":
+        return notify_telegram_batch(transport_config, watcher_obj, events_list, wait=wait)
+    logger.warning(f"Tipo de transporte desconocido '{transport_type}' para Watcher ID={watcher_obj.id}.")
+    return True
 
 def send_notifications_for_event_batch(watcher_obj: Any, events_list: List[schemas.TokenEventRead]):
     if not events_list:
@@ -226,24 +357,7 @@ def send_notifications_for_event_batch(watcher_obj: Any, events_list: List[schem
         logger.warning(f"El Watcher ID={watcher_obj.id} no tiene transportes configurados.")
         return
     for transport in watcher_obj.transports:
-        transport_type = transport.type.lower()
-        transport_config = transport.config
-        if not isinstance(transport_config, dict):
-            try:
-                transport_config = json.loads(transport_config) if isinstance(transport_config, str) else {}
-            except json.JSONDecodeError:
-                logger.error(f"El config del transporte ID={transport.id} no es un JSON válido.")
-                continue
-        logger.info(f"-> [DISPATCH] Procesando transporte tipo '{transport_type}' para Watcher ID={watcher_obj.id}")
-        if transport_type == "slack":
-            webhook_url = transport_config.get("url")
-            notify_slack_blockkit(webhook_url, watcher_obj, events_list)
-        elif transport_type == "discord":
-            webhook_url = transport_config.get("url")
-            notify_discord_embed(webhook_url, watcher_obj, events_list)
-        elif transport_type == "email":
-            notify_email_batch(transport_config, watcher_obj, events_list)
-        elif transport_type == "telegram":
-            notify_telegram_batch(transport_config, watcher_obj, events_list)
-        else:
-            logger.warning(f"Tipo de transporte desconocido '{transport_type}' para Watcher ID={watcher_obj.id}.")
\ No newline at end of file
+        transport_config = parse_transport_config(transport)
+        if transport_config is None:
+            continue
+        send_via_transport(transport.type, transport_config, watcher_obj, events_list)
\ No newline at end of file
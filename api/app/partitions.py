@@ -0,0 +1,211 @@
+# api/app/partitions.py
+#
+# Particiones por rango de created_at de la tabla events (ver models.TokenEvent).
+# ensure_partitions crea por adelantado las particiones del periodo actual y de los MONTHS_AHEAD
+# meses siguientes, más una partición DEFAULT de respaldo para que ningún INSERT falle (p. ej. un
+# backfill de bloques antiguos). Los índices definidos en models.py sobre la tabla padre se crean
+# automáticamente en cada partición nueva. Se ejecuta al arrancar la API y periódicamente desde el poller.
+
+import logging
+import re
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from .config import settings
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+EVENTS_TABLE = "events"
+DEFAULT_PARTITION = f"{EVENTS_TABLE}_default"
+
+_RANGE_BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def _period_start(day: date) -> date:
+    """Inicio del periodo que contiene `day` (periodos de EVENTS_PARTITION_MONTHS meses, alineados a enero)."""
+    months = max(int(settings.EVENTS_PARTITION_MONTHS), 1)
+    month_index = (day.year * 12 + day.month - 1) // months * months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _add_months(day: date, months: int) -> date:
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_bounds(day: date) -> Tuple[date, date]:
+    start = _period_start(day)
+    return start, _add_months(start, max(int(settings.EVENTS_PARTITION_MONTHS), 1))
+
+
+def partition_name(start: date) -> str:
+    # Mismo formato que las particiones creadas antes a mano (events_y2025m05)
+    return f"{EVENTS_TABLE}_y{start.year:04d}m{start.month:02d}"
+
+
+def _is_partitioned(conn: Connection) -> bool:
+    return bool(conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+        {"table": EVENTS_TABLE},
+    ).scalar())
+
+
+def _default_partition(conn: Connection) -> Optional[str]:
+    return conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:table) AND pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT'
+    """), {"table": EVENTS_TABLE}).scalar()
+
+
+def _insertable_columns(conn: Connection) -> List[str]:
+    # Las columnas generadas (token_address_lc) no admiten INSERT explícito.
+    rows = conn.execute(text("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = to_regclass(:table) AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+        ORDER BY attnum
+    """), {"table": EVENTS_TABLE})
+    return [f'"{row.attname}"' for row in rows]
+
+
+def _create_partition(conn: Connection, name: str, start: date, end: date, default_partition: Optional[str]) -> bool:
+    """Crea la partición [start, end) si no existe. Devuelve True si la creó."""
+    if conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar():
+        return False
+
+    # Límites en UTC explícito: created_at es timestamptz y no deben depender del TimeZone de la sesión.
+    range_params = {
+        "start": datetime(start.year, start.month, start.day, tzinfo=timezone.utc),
+        "end": datetime(end.year, end.month, end.day, tzinfo=timezone.utc),
+    }
+    bounds = f"FOR VALUES FROM ('{range_params['start'].isoformat()}') TO ('{range_params['end'].isoformat()}')"
+    rows_in_default = default_partition and conn.execute(
+        text(f'SELECT EXISTS (SELECT 1 FROM "{default_partition}" WHERE created_at >= :start AND created_at < :end)'),
+        range_params,
+    ).scalar()
+
+    if not rows_in_default:
+        conn.execute(text(f'CREATE TABLE "{name}" PARTITION OF {EVENTS_TABLE} {bounds}'))
+        return True
+
+    # Postgres no deja crear una partición cuyo rango ya tiene filas en la DEFAULT: se crea aparte,
+    # se mueven las filas y se adjunta (ATTACH crea los índices de la tabla padre en la partición).
+    columns = ", ".join(_insertable_columns(conn))
+    conn.execute(text(f'CREATE TABLE "{name}" (LIKE {EVENTS_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)'))
+    moved = conn.execute(text(
+        f'INSERT INTO "{name}" ({columns}) SELECT {columns} FROM "{default_partition}" '
+        f'WHERE created_at >= :start AND created_at < :end'
+    ), range_params).rowcount
+    conn.execute(text(f'DELETE FROM "{default_partition}" WHERE created_at >= :start AND created_at < :end'), range_params)
+    conn.execute(text(f'ALTER TABLE {EVENTS_TABLE} ATTACH PARTITION "{name}" {bounds}'))
+    logger.info(f"🧩 [PARTITIONS] {moved} evento(s) movido(s) de {default_partition} a {name}.")
+    return True
+
+
+def ensure_partitions(months_ahead: Optional[int] = None) -> List[str]:
+    """
+    Crea la partición DEFAULT (si falta) y las del periodo actual hasta `months_ahead` meses vista.
+    Cada partición se crea en su propia transacción. Devuelve los nombres de las creadas.
+    """
+    months_ahead = settings.MONTHS_AHEAD if months_ahead is None else months_ahead
+    today = datetime.now(timezone.utc).date()
+
+    with engine.begin() as conn:
+        if not _is_partitioned(conn):
+            logger.warning(f"⚠️ [PARTITIONS] La tabla '{EVENTS_TABLE}' no existe o no está particionada; no se crean particiones.")
+            return []
+        default_partition = _default_partition(conn)
+        if default_partition is None:
+            conn.execute(text(f'CREATE TABLE "{DEFAULT_PARTITION}" PARTITION OF {EVENTS_TABLE} DEFAULT'))
+            default_partition = DEFAULT_PARTITION
+            logger.info(f"🧩 [PARTITIONS] Partición de respaldo {DEFAULT_PARTITION} creada.")
+
+    created = []
+    start, _ = partition_bounds(today)
+    last_start = _period_start(_add_months(today, months_ahead))
+    while start <= last_start:
+        end = _add_months(start, max(int(settings.EVENTS_PARTITION_MONTHS), 1))
+        name = partition_name(start)
+        try:
+            with engine.begin() as conn:
+                if _create_partition(conn, name, start, end, default_partition):
+                    created.append(name)
+                    logger.info(f"🧩 [PARTITIONS] Partición {name} creada para [{start}, {end}).")
+        except Exception as e_partition:
+            logger.error(f"❌ [PARTITIONS] No se pudo crear la partición {name}: {e_partition!r}")
+        start = end
+
+    if created:
+        with engine.begin() as conn:
+            for name in created:
+                conn.execute(text(f'ANALYZE "{name}"'))
+    return created
+
+
+def _parse_bound_value(value: str) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def list_partitions(conn: Connection) -> List[Dict[str, Any]]:
+    """
+    Particiones de events con su rango ya parseado (start/end en UTC; None en la DEFAULT o si el
+    rango usa MINVALUE/MAXVALUE), filas estimadas y tamaño. Las de rango van primero, por fecha.
+    """
+    rows = conn.execute(text("""
+        SELECT c.relname AS name,
+               pg_get_expr(c.relpartbound, c.oid) AS bound,
+               GREATEST(c.reltuples, 0)::bigint AS estimated_rows,
+               pg_total_relation_size(c.oid) AS total_bytes
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:table)
+    """), {"table": EVENTS_TABLE}).mappings().all()
+
+    partitions = []
+    for row in rows:
+        match = _RANGE_BOUND_RE.search(row["bound"] or "")
+        partitions.append({
+            "name": row["name"],
+            "bound": row["bound"],
+            "is_default": row["bound"] == "DEFAULT",
+            "start": _parse_bound_value(match.group(1)) if match else None,
+            "end": _parse_bound_value(match.group(2)) if match else None,
+            "estimated_rows": row["estimated_rows"],
+            "total_bytes": row["total_bytes"],
+        })
+    far_future = datetime.max.replace(tzinfo=timezone.utc)
+    return sorted(partitions, key=lambda p: (p["is_default"], p["start"] or far_future, p["name"]))
+
+
+def detach_partition(conn: Connection, name: str) -> None:
+    """Saca la partición de events: deja de recibir inserts (su rango cae en la DEFAULT) y se puede archivar y borrar."""
+    conn.execute(text(f'ALTER TABLE {EVENTS_TABLE} DETACH PARTITION "{name}"'))
+
+
+def attach_partition(conn: Connection, name: str, start: datetime, end: datetime) -> None:
+    conn.execute(text(
+        f"ALTER TABLE {EVENTS_TABLE} ATTACH PARTITION \"{name}\" "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+
+
+def get_partition_layout() -> List[Dict[str, Any]]:
+    """Particiones de events con su rango, filas estimadas y tamaño en disco, ordenadas por rango."""
+    with engine.connect() as conn:
+        return list_partitions(conn)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    ensure_partitions()
+    for partition in get_partition_layout():
+        logger.info(f"   {partition['name']}: {partition['bound']} (~{partition['estimated_rows']} filas, {partition['total_bytes']} bytes)")
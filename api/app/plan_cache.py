@@ -0,0 +1,75 @@
+# api/app/plan_cache.py
+#
+# Tabla de planes en memoria, compartida por todo el proceso. User.watcher_limit la consulta
+# sin abrir sesiones; crud la recarga tras cada create/update/delete de planes y, para ver los
+# cambios hechos desde otros procesos, se recarga sola cada PLAN_CACHE_TTL_SECONDS.
+
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+FREE_PLAN_NAME = "Free"
+# Si la recarga falla se reintenta antes que con el TTL normal, sirviendo mientras los datos anteriores.
+_RETRY_AFTER_FAILURE_SECONDS = 30
+
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_limits_by_id: Dict[int, int] = {}
+_limits_by_name: Dict[str, int] = {}
+_next_refresh_at = 0.0
+
+
+def refresh(db: Optional[Session] = None) -> None:
+    """Recarga la tabla de planes con `db` o, si no se pasa, con una sesión propia."""
+    global _limits_by_id, _limits_by_name, _next_refresh_at
+    from .models import Plan
+
+    if db is not None:
+        rows = db.query(Plan.id, Plan.name, Plan.watcher_limit).all()
+    else:
+        with Session(engine) as session:
+            rows = session.query(Plan.id, Plan.name, Plan.watcher_limit).all()
+
+    with _lock:
+        _limits_by_id = {row.id: row.watcher_limit for row in rows}
+        _limits_by_name = {row.name: row.watcher_limit for row in rows}
+        _next_refresh_at = time.monotonic() + settings.PLAN_CACHE_TTL_SECONDS
+
+
+def _ensure_fresh() -> None:
+    global _next_refresh_at
+    if time.monotonic() < _next_refresh_at:
+        return
+    # Solo un hilo recarga; el resto sigue con la tabla actual.
+    if not _refresh_lock.acquire(blocking=False):
+        return
+    try:
+        if time.monotonic() < _next_refresh_at:
+            return
+        refresh()
+    except Exception as e:
+        logger.warning(f"⚠️ [PLAN_CACHE] No se pudo recargar la tabla de planes: {e!r}")
+        with _lock:
+            _next_refresh_at = time.monotonic() + _RETRY_AFTER_FAILURE_SECONDS
+    finally:
+        _refresh_lock.release()
+
+
+def get_watcher_limit(plan_id: int) -> Optional[int]:
+    _ensure_fresh()
+    with _lock:
+        return _limits_by_id.get(plan_id)
+
+
+def get_free_plan_watcher_limit() -> int:
+    _ensure_fresh()
+    with _lock:
+        return _limits_by_name.get(FREE_PLAN_NAME, settings.DEFAULT_WATCHER_LIMIT)
@@ -0,0 +1,294 @@
+# api/app/poller.py
+#
+# Proceso dedicado de sondeo: python -m api.app.poller
+# Ejecuta poll_and_notify en bucle, fuera de los workers de Gunicorn, con un planificador que
+# reparte los contratos en el tiempo, aplica backoff a los que fallan y expone /health y /metrics.
+# Se programa por contrato y no por watcher: todos los watchers de un token vencen juntos, así que
+# cada contrato se descarga una sola vez por intervalo (ver poll_and_notify).
+
+import json
+import logging
+import math
+import random
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+
+from . import crud, partitions
+from .config import settings
+from .database import SessionLocal
+from .watcher import poll_and_notify
+from .clients import coingecko_client, http_client
+
+logger = logging.getLogger(__name__)
+
+
+class TokenSchedule:
+    """
+    Próximo vencimiento (reloj monotónico) y fallos consecutivos de cada contrato.
+    Los vencimientos llevan jitter para que los contratos no coincidan todos en el mismo tick,
+    y avanzan a partir del vencimiento anterior (no del final del ciclo) para no acumular deriva.
+    """
+
+    def __init__(self, interval: float, jitter_ratio: float, backoff_max: float):
+        self.interval = max(float(interval), 1.0)
+        self.jitter_ratio = max(float(jitter_ratio), 0.0)
+        self.backoff_max = max(float(backoff_max), self.interval)
+        self.next_due: Dict[Hashable, float] = {}
+        self.failures: Dict[Hashable, int] = {}
+
+    def _jitter(self) -> float:
+        return random.uniform(-1.0, 1.0) * self.interval * self.jitter_ratio
+
+    def sync(self, active_tokens: Iterable[Hashable], now: float) -> None:
+        """Da de alta los contratos nuevos (repartidos en el primer intervalo) y olvida los que ya no tienen watchers."""
+        active = set(active_tokens)
+        for token in list(self.next_due):
+            if token not in active:
+                self.next_due.pop(token, None)
+                self.failures.pop(token, None)
+        for token in active:
+            if token not in self.next_due:
+                self.next_due[token] = now + random.uniform(0.0, self.interval)
+
+    def due(self, now: float) -> List[Hashable]:
+        return sorted(token for token, due_at in self.next_due.items() if due_at <= now)
+
+    def record_success(self, token: Hashable, now: float) -> None:
+        self.failures.pop(token, None)
+        next_due = self.next_due.get(token, now) + self.interval
+        if next_due < now:
+            # El ciclo se alargó más de un intervalo: se reprograma desde ahora en lugar de encadenar retrasos.
+            next_due = now
+        self.next_due[token] = next_due + self._jitter()
+
+    def record_failure(self, token: Hashable, now: float) -> float:
+        failures = self.failures.get(token, 0) + 1
+        self.failures[token] = failures
+        delay = self.interval * (2 ** min(failures, 16)) * (1.0 + random.uniform(0.0, self.jitter_ratio))
+        delay = min(delay, self.backoff_max)
+        self.next_due[token] = now + delay
+        return delay
+
+    def backing_off(self) -> int:
+        return len(self.failures)
+
+
+class PollerMetrics:
+    """Contadores del proceso, leídos por el servidor de /health y /metrics desde otro hilo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.last_tick_at: Optional[float] = None
+        self.last_cycle_at: Optional[float] = None
+        self.last_cycle_duration = 0.0
+        self.cycles_total = 0
+        self.cycle_errors_total = 0
+        self.watchers_polled_total = 0
+        self.watcher_failures_total = 0
+        self.events_created_total = 0
+        self.watchers_scheduled = 0
+        self.watchers_backing_off = 0
+
+    def record_tick(self, scheduled: int, backing_off: int) -> None:
+        with self._lock:
+            self.last_tick_at = time.time()
+            self.watchers_scheduled = scheduled
+            self.watchers_backing_off = backing_off
+
+    def record_cycle(self, duration: float, polled: int, failed: int, events_created: int, error: bool = False) -> None:
+        with self._lock:
+            self.last_cycle_at = time.time()
+            self.last_cycle_duration = duration
+            self.cycles_total += 1
+            self.cycle_errors_total += int(error)
+            self.watchers_polled_total += polled
+            self.watcher_failures_total += failed
+            self.events_created_total += events_created
+
+    def health(self) -> Dict[str, Any]:
+        stale_after = max(10 * settings.POLL_INTERVAL, 60)
+        with self._lock:
+            reference = self.last_tick_at or self.started_at
+            healthy = time.time() - reference <= stale_after
+            return {
+                "status": "ok" if healthy else "stale",
+                "last_tick_at": self.last_tick_at,
+                "last_cycle_at": self.last_cycle_at,
+                "watchers_scheduled": self.watchers_scheduled,
+                "watchers_backing_off": self.watchers_backing_off,
+            }
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            values = [
+                ("tokenwatcher_poller_cycles_total", "counter", self.cycles_total),
+                ("tokenwatcher_poller_cycle_errors_total", "counter", self.cycle_errors_total),
+                ("tokenwatcher_poller_watchers_polled_total", "counter", self.watchers_polled_total),
+                ("tokenwatcher_poller_watcher_failures_total", "counter", self.watcher_failures_total),
+                ("tokenwatcher_poller_events_created_total", "counter", self.events_created_total),
+                ("tokenwatcher_poller_last_cycle_duration_seconds", "gauge", self.last_cycle_duration),
+                ("tokenwatcher_poller_last_cycle_timestamp_seconds", "gauge", self.last_cycle_at or 0),
+                ("tokenwatcher_poller_watchers_scheduled", "gauge", self.watchers_scheduled),
+                ("tokenwatcher_poller_watchers_backing_off", "gauge", self.watchers_backing_off),
+            ]
+        cache_stats = coingecko_client.get_cache_stats()
+        values += [
+            ("tokenwatcher_coingecko_cache_hits_total", "counter", cache_stats["hits"]),
+            ("tokenwatcher_coingecko_cache_misses_total", "counter", cache_stats["misses"]),
+            ("tokenwatcher_coingecko_cache_coalesced_total", "counter", cache_stats["coalesced"]),
+            ("tokenwatcher_coingecko_cache_size", "gauge", cache_stats["size"]),
+        ]
+        lines = []
+        for name, metric_type, value in values:
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name} {value}")
+
+        histogram_name = "tokenwatcher_http_request_duration_seconds"
+        lines.append(f"# TYPE {histogram_name} histogram")
+        for host, host_stats in http_client.get_latency_stats().items():
+            for upper_bound, cumulative_count in host_stats["buckets"].items():
+                lines.append(f'{histogram_name}_bucket{{host="{host}",le="{upper_bound}"}} {cumulative_count}')
+            lines.append(f'{histogram_name}_sum{{host="{host}"}} {host_stats["sum_seconds"]}')
+            lines.append(f'{histogram_name}_count{{host="{host}"}} {host_stats["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+def _make_health_handler(metrics: PollerMetrics):
+    class HealthHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/health":
+                payload = metrics.health()
+                body = json.dumps(payload).encode()
+                status_code = 200 if payload["status"] == "ok" else 503
+                content_type = "application/json"
+            elif self.path == "/metrics":
+                body = metrics.render_prometheus().encode()
+                status_code = 200
+                content_type = "text/plain; version=0.0.4"
+            else:
+                body, status_code, content_type = b"not found", 404, "text/plain"
+            self.send_response(status_code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return HealthHandler
+
+
+def start_health_server(metrics: PollerMetrics, port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("0.0.0.0", port), _make_health_handler(metrics))
+    threading.Thread(target=server.serve_forever, name="poller-health", daemon=True).start()
+    logger.info(f"🩺 [POLLER] /health y /metrics escuchando en el puerto {port}.")
+    return server
+
+
+def run_tick(schedule: TokenSchedule, metrics: PollerMetrics) -> None:
+    """Un tick del planificador: sondea en un único ciclo todos los watchers de los contratos vencidos."""
+    db = SessionLocal()
+    watchers_by_token: Dict[str, List[int]] = {}
+    due_tokens: List[Hashable] = []
+    due_ids: List[int] = []
+    cycle_started = time.monotonic()
+    try:
+        watchers_by_token = crud.get_active_watcher_ids_by_token(db)
+        schedule.sync(watchers_by_token, time.monotonic())
+        due_tokens = schedule.due(time.monotonic())
+        if not due_tokens:
+            return
+
+        due_ids = sorted(watcher_id for token in due_tokens for watcher_id in watchers_by_token[token])
+        logger.info(f"⏱️ [POLLER] {len(due_tokens)} contrato(s) vencido(s) en este tick ({len(due_ids)} watcher(s)).")
+        summary = poll_and_notify(
+            db=db,
+            get_active_watchers_func=lambda: crud.get_active_watchers_by_ids(db, due_ids),
+        )
+
+        # Un contrato entra en backoff si falló alguno de sus watchers (normalmente fallan todos:
+        # comparten la descarga de Etherscan).
+        failed_ids = set(summary.get("failed_watcher_ids", []))
+        now = time.monotonic()
+        for token in due_tokens:
+            if failed_ids.intersection(watchers_by_token[token]):
+                delay = schedule.record_failure(token, now)
+                logger.warning(f"  ⚠️ [POLLER_BACKOFF] Contrato {token} falló ({schedule.failures[token]} seguido(s)); reintento en {delay:.0f}s.")
+            else:
+                schedule.record_success(token, now)
+        metrics.record_cycle(time.monotonic() - cycle_started, len(due_ids), len(failed_ids), summary.get("events_created", 0))
+
+    except Exception as e_tick:
+        logger.exception(f"❌ [POLLER_ERROR] Error en el ciclo de sondeo: {e_tick!r}")
+        now = time.monotonic()
+        for token in due_tokens:
+            schedule.record_failure(token, now)
+        metrics.record_cycle(time.monotonic() - cycle_started, len(due_ids), len(due_ids), 0, error=True)
+    finally:
+        db.close()
+        metrics.record_tick(
+            sum(len(watchers_by_token.get(token, [])) for token in schedule.next_due),
+            sum(len(watchers_by_token.get(token, [])) for token in schedule.failures),
+        )
+
+
+def _maintain_partitions(stop_event: threading.Event) -> None:
+    """Crea las particiones de events que vayan haciendo falta (el poller es quien inserta eventos)."""
+    while not stop_event.is_set():
+        try:
+            created = partitions.ensure_partitions()
+            if created:
+                logger.info(f"🧩 [POLLER] Particiones creadas: {', '.join(created)}.")
+        except Exception as e_partitions:
+            logger.exception(f"❌ [POLLER] Error al mantener las particiones de events: {e_partitions!r}")
+        stop_event.wait(settings.EVENTS_PARTITION_CHECK_SECONDS)
+
+
+def run_forever(stop_event: threading.Event, metrics: PollerMetrics) -> None:
+    """
+    Bucle del planificador. Los ticks están anclados al instante de arranque (start + k * tick),
+    así que el tiempo de cada ciclo no desplaza los siguientes; si un ciclo se alarga se saltan
+    los ticks perdidos en lugar de encadenarlos.
+    """
+    schedule = TokenSchedule(settings.POLL_INTERVAL, settings.POLL_JITTER_RATIO, settings.POLL_BACKOFF_MAX_SECONDS)
+    tick = max(float(settings.POLL_SCHEDULER_TICK_SECONDS), 0.5)
+    started = time.monotonic()
+    tick_number = 0
+
+    while not stop_event.is_set():
+        run_tick(schedule, metrics)
+        tick_number = max(tick_number + 1, math.ceil((time.monotonic() - started) / tick))
+        stop_event.wait(max(0.0, started + tick_number * tick - time.monotonic()))
+
+
+def main() -> None:
+    stop_event = threading.Event()
+
+    def _request_stop(signum, frame):
+        logger.info(f"🛑 [POLLER] Señal {signum} recibida. Terminando tras el ciclo en curso...")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    metrics = PollerMetrics()
+    health_server = start_health_server(metrics, settings.POLLER_HEALTH_PORT)
+    threading.Thread(target=_maintain_partitions, args=(stop_event,), name="poller-partitions", daemon=True).start()
+    logger.info(
+        f"▶ [POLLER] Iniciando poller: intervalo {settings.POLL_INTERVAL}s, tick {settings.POLL_SCHEDULER_TICK_SECONDS}s, "
+        f"jitter {settings.POLL_JITTER_RATIO:.0%}, backoff máx. {settings.POLL_BACKOFF_MAX_SECONDS}s."
+    )
+    try:
+        run_forever(stop_event, metrics)
+    finally:
+        health_server.shutdown()
+        logger.info("▶ [POLLER] Poller detenido.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# api/app/price_history.py
+
+import bisect
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import crud
+from .cache import TTLCache
+from .config import settings
+from .clients import coingecko_client
+
+logger = logging.getLogger(__name__)
+
+PricePoint = Tuple[int, float]
+
+# Granularidad con la que CoinGecko devuelve market_chart/range según la antigüedad y la longitud del rango.
+_FIVE_MINUTES = 300
+_HOURLY = 3600
+_DAILY = 86400
+
+# Tokens para los que CoinGecko devolvió una serie vacía (o falló): se recuerda durante
+# COINGECKO_CACHE_NEGATIVE_TTL_SECONDS para no repetir la misma petición en cada ciclo.
+# Las series con datos no se guardan aquí (ttl=0): ya quedan en token_price_points.
+_empty_series_cache = TTLCache(
+    maxsize=settings.COINGECKO_CACHE_MAX_ENTRIES,
+    ttl=0,
+    negative_ttl=settings.COINGECKO_CACHE_NEGATIVE_TTL_SECONDS,
+)
+
+
+def _expected_granularity(from_ts: int, to_ts: int, now: int) -> int:
+    span = to_ts - from_ts
+    if span <= _DAILY and from_ts >= now - _DAILY:
+        return _FIVE_MINUTES
+    if span <= 90 * _DAILY:
+        return _HOURLY
+    return _DAILY
+
+
+def _covers(points: List[PricePoint], from_ts: int, to_ts: int, max_gap: int) -> bool:
+    """True si la serie abarca [from_ts, to_ts] sin huecos mayores que max_gap."""
+    if not points or points[0][0] > from_ts or points[-1][0] < to_ts:
+        return False
+    return all(b[0] - a[0] <= max_gap for a, b in zip(points, points[1:]))
+
+
+def _interpolate(points: List[PricePoint], timestamp: int, max_gap: int) -> Optional[float]:
+    timestamps = [ts for ts, _ in points]
+    i = bisect.bisect_left(timestamps, timestamp)
+    if i < len(points) and points[i][0] == timestamp:
+        return points[i][1]
+    if 0 < i < len(points):
+        (t0, p0), (t1, p1) = points[i - 1], points[i]
+        if t1 - t0 <= max_gap:
+            return p0 + (p1 - p0) * (timestamp - t0) / (t1 - t0)
+        return None
+    # Fuera de la serie: solo se acepta el punto más cercano si está dentro del hueco tolerado.
+    nearest = points[0] if i == 0 else points[-1]
+    return nearest[1] if abs(nearest[0] - timestamp) <= max_gap else None
+
+
+def load_price_series(db: Session, token_address: str, from_ts: int, to_ts: int, platform: str = "ethereum") -> List[PricePoint]:
+    """
+    Devuelve la serie de precios del token que cubre [from_ts, to_ts]. Se lee de la tabla
+    token_price_points y solo si no cubre el rango se descarga una única serie de CoinGecko
+    (market_chart/range), que se guarda para los siguientes ciclos.
+    """
+    now = int(time.time())
+    padding = settings.PRICE_SERIES_PADDING_SECONDS
+    max_gap = 2 * _expected_granularity(from_ts, to_ts, now)
+
+    points = crud.get_price_points(db, token_address, from_ts - padding, to_ts + padding, platform=platform)
+    if _covers(points, from_ts, to_ts, max_gap):
+        return points
+
+    fetched = _empty_series_cache.get_or_load(
+        (platform, token_address.lower()),
+        lambda: coingecko_client.get_price_series_usd(token_address, from_ts - padding, min(to_ts + padding, now), platform=platform) or None,
+    )
+    if not fetched:
+        return points
+    crud.save_price_points(db, token_address, fetched, platform=platform)
+    return crud.get_price_points(db, token_address, from_ts - padding, to_ts + padding, platform=platform)
+
+
+def get_usd_prices_at(db: Session, token_address: str, timestamps: Iterable[int], platform: str = "ethereum") -> Dict[int, float]:
+    """
+    Precio USD del token en cada timestamp, interpolado linealmente sobre la serie local.
+    Los timestamps que no se pueden valorar (sin datos cerca) no aparecen en el resultado.
+    """
+    wanted = sorted(set(timestamps))
+    if not wanted:
+        return {}
+    from_ts, to_ts = wanted[0], wanted[-1]
+    points = load_price_series(db, token_address, from_ts, to_ts, platform=platform)
+    if not points:
+        return {}
+
+    max_gap = 2 * _expected_granularity(from_ts, to_ts, int(time.time()))
+    prices: Dict[int, float] = {}
+    for timestamp in wanted:
+        price = _interpolate(points, timestamp, max_gap)
+        if price is not None:
+            prices[timestamp] = price
+    return prices
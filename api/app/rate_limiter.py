@@ -1,8 +1,165 @@
 # api/app/rate_limiter.py
 
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Tuple
+
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
+from .config import settings
+
 # El limiter vive en su propio módulo para evitar importaciones circulares.
 # Tanto main.py como auth.py lo importarán desde aquí.
-limiter = Limiter(key_func=get_remote_address)
\ No newline at end of file
+limiter = Limiter(key_func=get_remote_address)
+
+
+class DestinationThrottled(Exception):
+    """
+    Un envío sin espera (wait=False) encontró su destino limitado: bucket vacío o 429 con Retry-After.
+    retry_after indica cuándo volver a intentarlo y delivered_events cuántos eventos del principio
+    del lote sí se entregaron antes del límite (envíos en varias partes, como Discord o Telegram).
+    """
+
+    def __init__(self, kind: str, retry_after: float, delivered_events: int = 0):
+        super().__init__(f"Destino '{kind}' limitado; reintento en {retry_after:.2f}s.")
+        self.kind = kind
+        self.retry_after = max(0.0, float(retry_after))
+        self.delivered_events = delivered_events
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe para repartir un presupuesto de peticiones
+    entre todos los hilos que llaman a un mismo proveedor externo.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = float(rate)
+        self.capacity = max(float(capacity), 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated_at
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Bloquea hasta que haya `tokens` disponibles y los consume.
+        Devuelve el tiempo total esperado (en segundos).
+        """
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    wait_for = self._blocked_until - now
+                elif self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                else:
+                    wait_for = (tokens - self._tokens) / self.rate
+            time.sleep(wait_for)
+            waited += wait_for
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        Versión sin espera de acquire: consume `tokens` y devuelve 0.0 si están disponibles; si no,
+        no consume nada y devuelve los segundos que faltan para que lo estén.
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._blocked_until:
+                return self._blocked_until - now + tokens / self.rate
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def block_for(self, seconds: float) -> None:
+        """
+        Pausa el bucket durante `seconds` (p. ej. el Retry-After de un 429) y vacía los tokens,
+        de modo que tras la pausa se reanuda al ritmo normal y no con una ráfaga.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._blocked_until = max(self._blocked_until, now + max(0.0, seconds))
+            self._tokens = 0.0
+            self._updated_at = self._blocked_until
+
+
+# --- Presupuestos globales por proveedor (compartidos por todos los hilos del proceso) ---
+etherscan_budget = TokenBucket(
+    rate=settings.ETHERSCAN_REQUESTS_PER_SECOND,
+    capacity=settings.ETHERSCAN_REQUESTS_PER_SECOND,
+)
+coingecko_budget = TokenBucket(
+    rate=settings.COINGECKO_REQUESTS_PER_MINUTE / 60.0,
+    capacity=max(1, settings.COINGECKO_REQUESTS_PER_MINUTE // 6),
+)
+
+
+# --- Límites por destino de notificación: (peticiones por segundo, ráfaga) ---
+# Valores documentados por cada plataforma; los 429 con Retry-After se aplican además vía penalize().
+DESTINATION_LIMITS: Dict[str, Tuple[float, float]] = {
+    "slack_webhook": (1.0, 1),            # Slack: 1 mensaje por segundo por webhook
+    "discord_webhook": (30 / 60.0, 5),    # Discord: 5 peticiones / 2 s por webhook, 30 / min por canal
+    "telegram_chat": (1.0, 1),            # Telegram: ~1 mensaje por segundo por chat privado
+    "telegram_group": (20 / 60.0, 3),     # Telegram: 20 mensajes / min por grupo o canal
+    "telegram_bot": (30.0, 30),           # Telegram: ~30 mensajes por segundo por bot
+    "resend_api": (2.0, 2),               # Resend: 2 peticiones por segundo por API key
+    "email_domain": (1.0, 5),             # Ritmo prudente por dominio receptor
+}
+
+
+class KeyedRateLimiter:
+    """
+    Un TokenBucket por destino (webhook, chat, dominio...), compartido por todos los watchers
+    y hilos del proceso. Los buckets inactivos se descartan por LRU al superar max_keys.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]], max_keys: int = 10000):
+        self.limits = limits
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Tuple[str, Hashable], TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, kind: str, key: Hashable) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get((kind, key))
+            if bucket is None:
+                rate, capacity = self.limits[kind]
+                bucket = TokenBucket(rate=rate, capacity=capacity)
+                self._buckets[(kind, key)] = bucket
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end((kind, key))
+            return bucket
+
+    def acquire(self, kind: str, key: Hashable, tokens: float = 1.0) -> float:
+        """Espera turno para enviar a `key` según el límite de `kind`. Devuelve lo esperado (s)."""
+        return self._bucket(kind, key).acquire(tokens)
+
+    def try_acquire(self, kind: str, key: Hashable, tokens: float = 1.0) -> float:
+        """Como acquire, pero sin esperar: 0.0 si hay turno o los segundos que faltan (sin consumir)."""
+        return self._bucket(kind, key).try_acquire(tokens)
+
+    def penalize(self, kind: str, key: Hashable, retry_after_seconds: float) -> None:
+        """Bloquea el destino durante retry_after_seconds (Retry-After de un 429 o backoff tras un error)."""
+        self._bucket(kind, key).block_for(retry_after_seconds)
+
+
+notification_limiter = KeyedRateLimiter(DESTINATION_LIMITS)
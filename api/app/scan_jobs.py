@@ -0,0 +1,84 @@
+# api/app/scan_jobs.py
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .config import settings
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Los escaneos manuales se ejecutan aquí y no en el hilo de la petición HTTP.
+_executor = ThreadPoolExecutor(max_workers=max(1, settings.SCAN_JOB_MAX_WORKERS), thread_name_prefix="scan-job")
+
+
+def enqueue_scan_job(db: Session, user_id: int) -> Tuple[models.ScanJob, bool]:
+    """
+    Encola un escaneo de los watchers activos del usuario. Si ya tiene uno en cola o en curso
+    se devuelve ese mismo job (el booleano indica si se creó uno nuevo).
+    """
+    job, created = crud.get_or_create_scan_job(db, user_id, settings.SCAN_JOB_STALE_SECONDS)
+    if created:
+        logger.info(f"🧾 [SCAN_JOB] Job {job.id} encolado para el usuario {user_id}.")
+        _executor.submit(_run_scan_job, job.id, user_id)
+    else:
+        logger.info(f"🧾 [SCAN_JOB] Usuario {user_id} ya tiene el job {job.id} ({job.status}); se reutiliza.")
+    return job, created
+
+
+def _run_scan_job(job_id: int, user_id: int) -> None:
+    from .watcher import poll_and_notify
+
+    # Una sesión para el escaneo y otra para el estado del job, que se confirma por separado.
+    scan_db = SessionLocal()
+    status_db = SessionLocal()
+    try:
+        crud.update_scan_job(status_db, job_id, status="running", started_at=datetime.now(timezone.utc))
+
+        def _on_progress(summary: Dict[str, Any]) -> None:
+            crud.update_scan_job(
+                status_db, job_id,
+                watchers_total=summary["watchers"],
+                tokens_total=summary["tokens"],
+                tokens_done=summary["tokens_done"],
+                events_found=summary["events_created"],
+                errors=len(summary["failed_watcher_ids"]),
+            )
+
+        summary = poll_and_notify(
+            db=scan_db,
+            get_active_watchers_func=lambda: crud.get_active_watchers_for_user(scan_db, user_id=user_id),
+            on_progress=_on_progress,
+        )
+        errors = len(summary["failed_watcher_ids"])
+        crud.update_scan_job(
+            status_db, job_id,
+            status="succeeded",
+            watchers_total=summary["watchers"],
+            tokens_total=summary["tokens"],
+            tokens_done=summary["tokens_done"],
+            events_found=summary["events_created"],
+            errors=errors,
+            error_message=f"{errors} watcher(s) could not be fully scanned." if errors else None,
+            finished_at=datetime.now(timezone.utc),
+        )
+        logger.info(f"✅ [SCAN_JOB] Job {job_id} terminado: {summary['events_created']} evento(s), {errors} error(es).")
+    except Exception as e_job:
+        logger.exception(f"❌ [SCAN_JOB_ERROR] Job {job_id} falló: {e_job!r}")
+        try:
+            crud.update_scan_job(
+                status_db, job_id,
+                status="failed",
+                error_message=str(e_job)[:500],
+                finished_at=datetime.now(timezone.utc),
+            )
+        except Exception:
+            logger.exception(f"❌ [SCAN_JOB_ERROR] No se pudo marcar el job {job_id} como fallido.")
+    finally:
+        scan_db.close()
+        status_db.close()
@@ -62,21 +62,24 @@ class TokenEventBase(OrmBase):
     to_address: str
     amount: float
     transaction_hash: str
+    log_index: Optional[int] = None
     block_number: int
     usd_value: Optional[float] = None
     token_name: Optional[str] = None
     token_symbol: Optional[str] = None
 
 class TokenEventCreate(TokenEventBase):
-    pass
+    log_index: int = 0
+    created_at: Optional[datetime] = None
 
 class TokenEventRead(TokenEventBase):
     id: int
     created_at: datetime
 
 class PaginatedTokenEventResponse(OrmBase):
-    total_events: int
+    total_events: Optional[int] = None
     events: List[TokenEventRead]
+    next_cursor: Optional[str] = None
 
 # --- SCHEMAS DE TRANSPORT ---
 class TransportBase(OrmBase):
@@ -105,6 +108,7 @@ class WatcherBase(OrmBase):
 class WatcherCreate(WatcherBase):
     transport_type: Literal["slack", "discord", "email", "telegram"]
     transport_target: str
+    digest_window_seconds: Optional[int] = None
     send_test_notification: bool = False
 
 class WatcherUpdatePayload(BaseModel):
@@ -113,6 +117,7 @@ class WatcherUpdatePayload(BaseModel):
     is_active: Optional[bool] = None
     transport_type: Optional[Literal["slack", "discord", "email", "telegram"]] = None
     transport_target: Optional[str] = None
+    digest_window_seconds: Optional[int] = None
     send_test_notification: bool = False
 
 class WatcherRead(WatcherBase):
@@ -122,6 +127,20 @@ class WatcherRead(WatcherBase):
     updated_at: datetime
     transports: List[TransportRead] = []
 
+# --- SCHEMAS DE SCAN JOBS ---
+class ScanJobRead(OrmBase):
+    id: int
+    status: str
+    watchers_total: int
+    tokens_total: int
+    tokens_done: int
+    events_found: int
+    errors: int
+    error_message: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 # --- SCHEMAS DE USUARIO ---
 class UserBase(OrmBase):
     email: EmailStr
@@ -3,142 +3,486 @@ import time
 import requests
 import json
 import logging
-from typing import Callable, List, Dict, Any, Optional
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
 from web3 import Web3
 
-from . import schemas, crud, notifier
+from . import schemas, crud, price_history
 from .config import settings
-from .models import Watcher as WatcherModel, TokenEvent as EventModel
-from .clients import etherscan_client, coingecko_client
+from .database import SessionLocal
+from .models import Watcher as WatcherModel
+from .clients import etherscan_client, coingecko_client, http_client
+from .rate_limiter import etherscan_budget
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def fetch_transfers(contract_address: str, start_block: int) -> List[Dict[str, Any]]:
-    try:
-        start_block = int(start_block) if start_block is not None else 0
-    except (ValueError, TypeError):
-        logger.error(f"❌ [FETCH_TRANSFERS] start_block inválido: {start_block} para contrato {contract_address}. Usando 0.")
-        start_block = 0
+# (transferencia de Etherscan, monto en unidades del token, log_index, precio USD unitario en su bloque)
+QualifyingTransfer = Tuple[Dict[str, Any], float, int, Optional[float]]
+
+ETHERSCAN_API_URL = "https://api.etherscan.io/api"
+# Etherscan no devuelve más de 10.000 resultados por consulta (page * offset <= 10000).
+ETHERSCAN_MAX_RESULT_WINDOW = 10000
+ETHERSCAN_OPEN_END_BLOCK = 99999999
 
+
+class TransferFetchError(Exception):
+    """Etherscan falló a mitad de un escaneo; lo ya entregado por el generador sigue siendo válido."""
+
+
+def _request_transfer_page(contract_address: str, start_block: int, end_block: int, page: int, page_size: int) -> List[Dict[str, Any]]:
     params = {
         "module": "account", "action": "tokentx", "contractaddress": contract_address,
-        "startblock": str(start_block), "endblock": "latest", "page": 1, "offset": 1000,
+        "startblock": str(start_block), "endblock": str(end_block), "page": page, "offset": page_size,
         "sort": "asc", "apikey": settings.ETHERSCAN_API_KEY,
     }
-    logger.info(f"  📞 [FETCH_TRANSFERS] Consultando Etherscan para {contract_address} desde bloque {start_block}...")
     try:
-        response = requests.get("https://api.etherscan.io/api", params=params, timeout=20)
+        response = http_client.get(ETHERSCAN_API_URL, params=params, timeout=20, budget=etherscan_budget)
         response.raise_for_status()
         data = response.json()
-        if data.get("status") == "1":
-            return data.get("result", [])
-        return []
     except requests.exceptions.RequestException as e:
-        logger.error(f"  ❌ [FETCH_TRANSFERS_ERROR] Fallo en la solicitud a Etherscan API para {contract_address}: {e}")
+        raise TransferFetchError(f"Fallo en la solicitud a Etherscan API para {contract_address}: {e}") from e
+    except json.JSONDecodeError as e:
+        raise TransferFetchError(f"Error al decodificar JSON de Etherscan para {contract_address}.") from e
+
+    if data.get("status") == "1":
+        return data.get("result", [])
+    # status "0" con "No transactions found" es simplemente una ventana vacía
+    if isinstance(data.get("result"), list) and not data["result"]:
         return []
-    except json.JSONDecodeError:
-        logger.error(f"  ❌ [FETCH_TRANSFERS_ERROR] Error al decodificar JSON de Etherscan para {contract_address}.")
+    raise TransferFetchError(f"Etherscan respondió '{data.get('message')}' para {contract_address}: {data.get('result')}")
+
+
+def _fetch_transfer_window(contract_address: str, start_block: int, end_block: int) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre todas las páginas de una ventana de bloques. Si la ventana supera el máximo de
+    resultados que Etherscan permite paginar, se reanuda desde el último bloque visto; las
+    transferencias de ese bloque que ya se entregaron se saltan para no duplicarlas.
+    """
+    page_size = max(1, min(settings.ETHERSCAN_PAGE_SIZE, ETHERSCAN_MAX_RESULT_WINDOW))
+    max_pages = max(1, ETHERSCAN_MAX_RESULT_WINDOW // page_size)
+    window_start = start_block
+    page = 1
+    skip_in_start_block = 0
+    current_block, current_block_count = None, 0
+
+    while True:
+        transfers = _request_transfer_page(contract_address, window_start, end_block, page, page_size)
+        page_is_full = len(transfers) >= page_size
+        must_resume = page_is_full and page >= max_pages
+
+        to_emit = transfers
+        if must_resume:
+            last_block = int(transfers[-1].get("blockNumber", window_start))
+            if last_block > window_start:
+                # El último bloque puede estar incompleto: se pedirá entero al reanudar.
+                to_emit = [tx for tx in transfers if int(tx.get("blockNumber", window_start)) < last_block]
+                resume_block = last_block
+            else:
+                logger.warning(
+                    f"  ⚠️ [FETCH_TRANSFERS] El bloque {window_start} de {contract_address} tiene más de "
+                    f"{ETHERSCAN_MAX_RESULT_WINDOW} transferencias; se procesan solo las primeras."
+                )
+                resume_block = window_start + 1
+
+        for tx in to_emit:
+            tx_block = int(tx.get("blockNumber", window_start))
+            if skip_in_start_block and tx_block == window_start:
+                skip_in_start_block -= 1
+                continue
+            if tx_block != current_block:
+                current_block, current_block_count = tx_block, 0
+            current_block_count += 1
+            yield tx
+
+        if not page_is_full:
+            return
+        if not must_resume:
+            page += 1
+            continue
+
+        skip_in_start_block = current_block_count if current_block == resume_block else 0
+        window_start = resume_block
+        page = 1
+        if window_start > end_block:
+            return
+
+
+def fetch_transfers(contract_address: str, start_block: int, end_block: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Generador de transferencias ERC-20 del contrato entre start_block y end_block (inclusive),
+    en orden ascendente. Recorre ventanas de settings.MAX_BLOCK_RANGE bloques y pagina cada una
+    hasta agotarla, así la memoria no crece con el tamaño del backfill.
+    Si no se conoce end_block se usa una única ventana abierta hasta el último bloque.
+    Lanza TransferFetchError si Etherscan falla a mitad del recorrido.
+    """
+    try:
+        start_block = int(start_block) if start_block is not None else 0
+    except (ValueError, TypeError):
+        logger.error(f"❌ [FETCH_TRANSFERS] start_block inválido: {start_block} para contrato {contract_address}. Usando 0.")
+        start_block = 0
+
+    if end_block is None:
+        logger.info(f"  📞 [FETCH_TRANSFERS] Consultando Etherscan para {contract_address} desde bloque {start_block} (sin límite superior)...")
+        yield from _fetch_transfer_window(contract_address, start_block, ETHERSCAN_OPEN_END_BLOCK)
+        return
+
+    block_range = max(1, settings.MAX_BLOCK_RANGE)
+    logger.info(f"  📞 [FETCH_TRANSFERS] Consultando Etherscan para {contract_address} en bloques [{start_block}, {end_block}]...")
+    for window_start in range(start_block, end_block + 1, block_range):
+        window_end = min(window_start + block_range - 1, end_block)
+        yield from _fetch_transfer_window(contract_address, window_start, window_end)
+
+
+def _snapshot_watcher(watcher_instance: WatcherModel, start_block: int) -> SimpleNamespace:
+    """
+    Copia en memoria los datos del watcher que necesitan los hilos de trabajo,
+    para que nunca toquen la sesión de SQLAlchemy (que no es thread-safe).
+    """
+    return SimpleNamespace(
+        id=watcher_instance.id,
+        owner_id=watcher_instance.owner_id,
+        name=watcher_instance.name,
+        token_address=watcher_instance.token_address,
+        threshold=watcher_instance.threshold,
+        start_block=start_block,
+        transports=[
+            SimpleNamespace(id=t.id, type=t.type, config=t.config)
+            for t in watcher_instance.transports
+        ],
+    )
+
+
+def _normalize_token_address(token_address: str) -> str:
+    try:
+        return Web3.to_checksum_address(token_address)
+    except Exception:
+        return token_address
+
+
+def _resolve_token_price(token_address: str, batch_prices_future: Optional["Future[Dict[str, Dict[str, Any]]]"]) -> Optional[float]:
+    """
+    Precio actual del token: primero el resultado de la consulta en bloque del ciclo y,
+    si CoinGecko no lo incluyó, la consulta individual (cacheada) como respaldo.
+    """
+    market_data = None
+    if batch_prices_future is not None:
+        try:
+            market_data = batch_prices_future.result().get(token_address.lower())
+        except Exception as e_batch:
+            logger.warning(f"    ⚠️ [PRICE_FETCH] Falló la consulta de precios en bloque: {e_batch!r}")
+    if market_data is None:
+        market_data = coingecko_client.get_token_market_data(token_address)
+    return market_data.get("price") if market_data else None
+
+
+def _transfer_timestamp(tx_data: Dict[str, Any]) -> Optional[int]:
+    try:
+        return int(tx_data["timeStamp"])
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+def _historical_unit_prices(token_address: str, timestamps: List[int]) -> Dict[int, float]:
+    """
+    Precio USD del token en el momento de cada transferencia antigua, interpolado sobre la serie
+    local token_price_points (una descarga de market_chart/range por token y ventana como mucho).
+    Usa su propia sesión de base de datos porque se ejecuta en un hilo del pool.
+    """
+    cutoff = int(time.time()) - settings.PRICE_SPOT_MAX_AGE_SECONDS
+    historical = [ts for ts in timestamps if ts < cutoff]
+    if not historical:
+        return {}
+    try:
+        with SessionLocal() as price_db:
+            return price_history.get_usd_prices_at(price_db, token_address, historical)
+    except Exception as e_history:
+        logger.exception(f"    ❌ [PRICE_HISTORY] Error al valorar transferencias históricas de {token_address}: {e_history!r}")
+        return {}
+
+
+def _fetch_token_activity(
+    token_address: str,
+    watcher_group: List[SimpleNamespace],
+    chain_head: Optional[int],
+    batch_prices_future: Optional["Future[Dict[str, Dict[str, Any]]]"] = None,
+) -> Tuple[Dict[int, List[QualifyingTransfer]], Optional[int], bool]:
+    """
+    Parte de red del ciclo (se ejecuta en el pool). Descarga UNA sola vez las transferencias del
+    contrato, desde el cursor más bajo del grupo, y aplica en memoria el umbral y el start_block
+    de cada watcher. Solo se retienen las transferencias que superan algún umbral, así que el
+    consumo de memoria no depende del volumen total del contrato.
+    Cada transferencia se valora al precio de su bloque (timeStamp de Etherscan): las recientes al
+    precio actual y las antiguas (backfill) interpolando la serie histórica local.
+    Devuelve {watcher_id: [(tx, amount, log_index, unit_price), ...]}, el último bloque escaneado
+    por completo (None si no se puede garantizar ninguno) y si Etherscan falló durante el escaneo.
+    """
+    group_start_block = min(w.start_block for w in watcher_group)
+    matches: Dict[int, List[QualifyingTransfer]] = {w.id: [] for w in watcher_group}
+    last_seen_block: Optional[int] = None
+    scanned_through_block: Optional[int] = None
+    fetch_failed = False
+    # Etherscan (tokentx) no siempre incluye logIndex: se usa el ordinal de la transferencia dentro
+    # de su transacción, estable porque el flujo del contrato siempre empieza en un límite de bloque.
+    tx_ordinals: Dict[str, int] = {}
+
+    try:
+        for tx_data in fetch_transfers(token_address, start_block=group_start_block, end_block=chain_head):
+            try:
+                amount_transferred = float(tx_data.get("value", "0")) / (10**int(tx_data.get("tokenDecimal", "18")))
+                tx_block = int(tx_data.get("blockNumber", "0"))
+            except (ValueError, TypeError):
+                logger.warning(f"      ⚠️ [TX_PARSE] Transferencia con datos inválidos ignorada: {tx_data.get('hash', 'N/A')}")
+                continue
+            if tx_block != last_seen_block:
+                tx_ordinals = {}
+            last_seen_block = tx_block
+
+            tx_hash = tx_data.get("hash", "")
+            ordinal = tx_ordinals.get(tx_hash, 0)
+            tx_ordinals[tx_hash] = ordinal + 1
+            log_index = int(tx_data["logIndex"]) if str(tx_data.get("logIndex", "")).isdigit() else ordinal
+
+            for watcher_obj in watcher_group:
+                if tx_block >= watcher_obj.start_block and amount_transferred >= watcher_obj.threshold:
+                    matches[watcher_obj.id].append((tx_data, amount_transferred, log_index, None))
+        scanned_through_block = chain_head if chain_head is not None else last_seen_block
+    except TransferFetchError as e_fetch:
+        logger.error(f"  ❌ [FETCH_TRANSFERS_ERROR] {e_fetch}")
+        fetch_failed = True
+        # El último bloque visto puede haber quedado a medias: se descarta y se reintenta en el próximo ciclo.
+        if last_seen_block is not None:
+            scanned_through_block = last_seen_block - 1
+            for watcher_id, watcher_matches in matches.items():
+                matches[watcher_id] = [m for m in watcher_matches if int(m[0].get("blockNumber", "0")) < last_seen_block]
+
+    if not any(matches.values()):
+        return matches, scanned_through_block, fetch_failed
+
+    timestamps = {_transfer_timestamp(m[0]) for watcher_matches in matches.values() for m in watcher_matches}
+    historical_prices = _historical_unit_prices(token_address, [ts for ts in timestamps if ts is not None])
+    current_price = _resolve_token_price(token_address, batch_prices_future)
+    if current_price is None:
+        logger.warning(f"    ⚠️ [PRICE_FETCH] No se pudo obtener el precio actual para {token_address}. Las transferencias sin precio histórico se procesarán sin valor USD.")
+
+    for watcher_id, watcher_matches in matches.items():
+        matches[watcher_id] = [
+            (tx_data, amount, log_index, historical_prices.get(_transfer_timestamp(tx_data), current_price))
+            for tx_data, amount, log_index, _ in watcher_matches
+        ]
+    return matches, scanned_through_block, fetch_failed
+
+
+def _build_event_payloads(
+    watcher_obj: SimpleNamespace,
+    qualifying_transfers: List[QualifyingTransfer],
+) -> Tuple[List[schemas.TokenEventCreate], Optional[int]]:
+    """
+    Convierte las transferencias que superan el umbral en payloads de evento.
+    Devuelve también el bloque de la primera transferencia que no se pudo procesar, si la hubo.
+    """
+    event_payloads: List[schemas.TokenEventCreate] = []
+    first_failed_block: Optional[int] = None
+    for tx_data, amount_transferred, log_index, unit_price in qualifying_transfers:
+        try:
+            logger.info(f"      ❗ [THRESHOLD_MET] Watcher ID={watcher_obj.id}: monto {amount_transferred:.4f} >= umbral {watcher_obj.threshold}.")
+
+            usd_value = (amount_transferred * unit_price) if unit_price is not None else None
+            checksum_address = Web3.to_checksum_address(tx_data.get("contractAddress", watcher_obj.token_address))
+            # created_at es el timestamp del bloque y forma parte de la clave de deduplicación: sin él
+            # la transferencia cuenta como fallida y el cursor no la pasa, se reintenta en el siguiente ciclo.
+            block_timestamp = _transfer_timestamp(tx_data)
+            if block_timestamp is None:
+                raise ValueError(f"Transferencia sin timeStamp válido en el bloque {tx_data.get('blockNumber')}")
+
+            event_payloads.append(schemas.TokenEventCreate(
+                watcher_id=watcher_obj.id,
+                token_address_observed=checksum_address,
+                from_address=tx_data.get("from", "").lower(),
+                to_address=tx_data.get("to", "").lower(),
+                amount=amount_transferred,
+                transaction_hash=tx_data.get("hash", "N/A"),
+                log_index=log_index,
+                block_number=int(tx_data.get("blockNumber", "0")),
+                usd_value=usd_value,
+                token_name=tx_data.get("tokenName"),
+                token_symbol=tx_data.get("tokenSymbol"),
+                created_at=datetime.fromtimestamp(block_timestamp, tz=timezone.utc),
+            ))
+        except Exception as e_tx_proc:
+            logger.exception(f"      ❌ [TX_PROCESS_ERROR] Error general al procesar tx {tx_data.get('hash', 'N/A')}: {e_tx_proc!r}")
+            if first_failed_block is None:
+                first_failed_block = int(tx_data.get("blockNumber", "0"))
+    return event_payloads, first_failed_block
+
+
+def _store_watcher_scan(
+    db: Session,
+    watcher_obj: SimpleNamespace,
+    event_payloads: List[schemas.TokenEventCreate],
+    scanned_through_block: Optional[int],
+    first_failed_block: Optional[int],
+) -> Optional[List[schemas.TokenEventRead]]:
+    """
+    Parte de base de datos del ciclo (solo en el hilo principal). En una única transacción:
+    inserta en bloque los eventos del watcher (ON CONFLICT DO NOTHING), encola en notification_outbox
+    las notificaciones de los eventos nuevos y avanza su cursor hasta el último bloque escaneado,
+    sin pasar nunca de una transferencia que no se pudo procesar.
+    Devuelve solo los eventos nuevos, ya serializados, o None si la transacción falló.
+    """
+    if scanned_through_block is not None and first_failed_block is not None:
+        scanned_through_block = min(scanned_through_block, first_failed_block - 1)
+    advance_cursor = scanned_through_block is not None and scanned_through_block >= watcher_obj.start_block
+    if not event_payloads and not advance_cursor:
         return []
 
+    try:
+        created_events = crud.create_events_bulk(db, event_payloads, commit=False)
+        # Se serializa antes del commit, que expiraría los objetos ORM.
+        new_events = [schemas.TokenEventRead.model_validate(e) for e in created_events]
+        crud.enqueue_notifications(db, watcher_obj, new_events)
+        if advance_cursor:
+            crud.advance_watcher_cursor(db, watcher_obj.id, scanned_through_block)
+        db.commit()
+    except Exception as e_store:
+        db.rollback()
+        logger.exception(f"    ❌ [STORE_ERROR] No se pudieron guardar los eventos/cursor del Watcher ID={watcher_obj.id}: {e_store!r}")
+        return None
+
+    if event_payloads:
+        logger.info(
+            f"      ✅ [EVENTS_CREATED] Watcher ID={watcher_obj.id}: {len(new_events)} evento(s) nuevo(s) "
+            f"de {len(event_payloads)} transferencia(s) (el resto ya existía)."
+        )
+    return new_events
+
+
+def _report_progress(summary: Dict[str, Any], on_progress: Optional[Callable[[Dict[str, Any]], None]]) -> None:
+    summary["tokens_done"] += 1
+    if on_progress is None:
+        return
+    try:
+        on_progress(summary)
+    except Exception as e_progress:
+        logger.warning(f"    ⚠️ [POLL_PROGRESS] Error al reportar el progreso: {e_progress!r}")
+
 
 def poll_and_notify(
     db: Session,
     get_active_watchers_func: Callable[[], List[WatcherModel]],
-    create_event_func: Callable[[schemas.TokenEventCreate], Optional[EventModel]],
-):
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Ciclo de sondeo concurrente:
+      1. (hilo principal) se lee el start_block de cada watcher (tabla watcher_cursors) y se agrupan los watchers
+         por contrato (checksum), de modo que cada contrato se descarga una sola vez por ciclo.
+      2. (pool) Etherscan para todos los contratos a la vez y, en paralelo, una consulta en bloque a
+         CoinGecko (simple/token_price) con los precios de todos los contratos del ciclo, respetando
+         el presupuesto global de cada proveedor (ver rate_limiter.py). Cada watcher aplica su umbral
+         en memoria y las transferencias antiguas se valoran con la serie histórica (price_history.py).
+      3. (hilo principal) a medida que terminan las descargas se insertan en bloque los eventos de
+         cada watcher y, en la misma transacción, se avanza su cursor hasta el último bloque
+         escaneado aunque no haya habido eventos.
+      4. las notificaciones quedan en notification_outbox (misma transacción que los eventos) y las
+         entrega notification_worker.py; el ciclo no espera a ningún webhook.
+    Devuelve un resumen del ciclo; failed_watcher_ids lista los watchers cuyo escaneo falló
+    (proveedor o base de datos), para que el planificador (poller.py) les aplique backoff.
+    Si se pasa on_progress, se llama con el resumen parcial cada vez que termina un contrato.
+    """
     logger.info("🔄 [POLL_CYCLE] Iniciando ciclo de sondeo y notificación...")
     active_watchers = get_active_watchers_func()
+    summary: Dict[str, Any] = {
+        "watchers": len(active_watchers),
+        "tokens": 0,
+        "tokens_done": 0,
+        "events_created": 0,
+        "failed_watcher_ids": [],
+    }
 
     if not active_watchers:
         logger.info("ℹ️ [POLL_INFO] No hay watchers activos para procesar.")
-        return
-    logger.info(f"ℹ️ [POLL_INFO] Procesando {len(active_watchers)} watcher(s) activo(s)...")
+        return summary
+
+    chain_head = etherscan_client.get_latest_block_number()
+    if chain_head is None:
+        logger.warning("⚠️ [POLL_INFO] No se pudo obtener el último bloque; se consultará sin límite superior.")
 
+    start_blocks = crud.get_watcher_start_blocks(db, [w.id for w in active_watchers])
+
+    watchers_by_token: Dict[str, List[SimpleNamespace]] = {}
     for watcher_instance in active_watchers:
-        logger.info(f"  ▶️ [WATCHER_PROC] Procesando Watcher ID={watcher_instance.id}, Nombre='{watcher_instance.name}'")
+        logger.info(f"  ▶️ [WATCHER_PROC] Preparando Watcher ID={watcher_instance.id}, Nombre='{watcher_instance.name}'")
 
         # Cargar explícitamente los transportes para este watcher
         db.refresh(watcher_instance, attribute_names=['transports'])
 
-        latest_event = db.query(EventModel).filter(EventModel.watcher_id == watcher_instance.id).order_by(desc(EventModel.block_number)).first()
-        start_block_for_watcher = latest_event.block_number + 1 if latest_event else settings.START_BLOCK
+        start_block_for_watcher = start_blocks.get(watcher_instance.id)
+        if start_block_for_watcher is None:
+            # Watcher nuevo: sin START_BLOCK explícito solo interesa la actividad a partir de ahora.
+            start_block_for_watcher = settings.START_BLOCK or chain_head
+            if start_block_for_watcher is None:
+                logger.warning(f"    ⚠️ [START_BLOCK] Watcher ID={watcher_instance.id} sin cursor y sin último bloque conocido. Se omite este ciclo.")
+                summary["failed_watcher_ids"].append(watcher_instance.id)
+                continue
         logger.info(f"    🔍 [START_BLOCK] Para Watcher ID={watcher_instance.id}, comenzando desde el bloque: {start_block_for_watcher}")
 
-        transactions = fetch_transfers(watcher_instance.token_address, start_block=start_block_for_watcher)
-        
-        if not transactions:
-            continue
+        token_key = _normalize_token_address(watcher_instance.token_address)
+        watchers_by_token.setdefault(token_key, []).append(_snapshot_watcher(watcher_instance, start_block_for_watcher))
 
-        current_price_data = coingecko_client.get_token_market_data(watcher_instance.token_address)
-        current_price = current_price_data.get("price") if current_price_data else None
-        if current_price is None:
-            logger.warning(f"    ⚠️ [PRICE_FETCH] No se pudo obtener el precio actual para {watcher_instance.name}. Se procesarán eventos sin valor USD.")
+    summary["tokens"] = len(watchers_by_token)
+    logger.info(
+        f"ℹ️ [POLL_INFO] Procesando {len(active_watchers)} watcher(s) activo(s) sobre {len(watchers_by_token)} contrato(s) "
+        f"con hasta {settings.POLL_MAX_WORKERS} hilo(s)..."
+    )
 
-        newly_created_events_for_this_watcher: List[EventModel] = []
-        for tx_data in transactions:
-            try:
-                amount_transferred = float(tx_data.get("value", "0")) / (10**int(tx_data.get("tokenDecimal", "18")))
-                
-                if amount_transferred >= watcher_instance.threshold:
-                    logger.info(f"      ❗ [THRESHOLD_MET] Monto {amount_transferred:.4f} >= umbral {watcher_instance.threshold}. Creando evento...")
-                    
-                    usd_value = (amount_transferred * current_price) if current_price is not None else None
-                    checksum_address = Web3.to_checksum_address(tx_data.get("contractAddress", watcher_instance.token_address))
-
-                    event_payload_schema = schemas.TokenEventCreate(
-                        watcher_id=watcher_instance.id,
-                        token_address_observed=checksum_address,
-                        from_address=tx_data.get("from", "").lower(),
-                        to_address=tx_data.get("to", "").lower(),
-                        amount=amount_transferred,
-                        transaction_hash=tx_data.get("hash", "N/A"),
-                        block_number=int(tx_data.get("blockNumber", "0")),
-                        usd_value=usd_value,
-                        token_name=tx_data.get("tokenName"),
-                        token_symbol=tx_data.get("tokenSymbol")
-                    )
-
-                    created_event = create_event_func(event_payload_schema)
-                    if created_event:
-                        logger.info(f"      ✅ [EVENT_CREATED/EXISTED] Evento ID={created_event.id} procesado.")
-                        newly_created_events_for_this_watcher.append(created_event)
-
-            except Exception as e_tx_proc:
-                logger.exception(f"      ❌ [TX_PROCESS_ERROR] Error general al procesar tx {tx_data.get('hash', 'N/A')}: {e_tx_proc!r}")
-
-        # === BLOQUE DE NOTIFICACIÓN REFACTORIZADO ===
-        if newly_created_events_for_this_watcher:
-            logger.info(f"  🔔 [NOTIFICATION_DISPATCH] {len(newly_created_events_for_this_watcher)} nuevo(s) evento(s) para Watcher ID={watcher_instance.id}. Despachando al notificador central...")
+    with ThreadPoolExecutor(max_workers=max(1, settings.POLL_MAX_WORKERS), thread_name_prefix="poll") as fetch_pool:
+
+        # Se encola primero para que ya esté en curso cuando algún contrato necesite su precio.
+        batch_prices_future = fetch_pool.submit(coingecko_client.get_token_prices, list(watchers_by_token))
+
+        future_to_token = {
+            fetch_pool.submit(_fetch_token_activity, token_address, watcher_group, chain_head, batch_prices_future): token_address
+            for token_address, watcher_group in watchers_by_token.items()
+        }
+
+        for future in as_completed(future_to_token):
+            token_address = future_to_token[future]
             try:
-                # ÚNICA Y LIMPIA LLAMADA A NUESTRO NUEVO DISPATCHER EN NOTIFIER.PY
-                notifier.send_notifications_for_event_batch(
-                    watcher_obj=watcher_instance,
-                    events_list=newly_created_events_for_this_watcher
-                )
-            except Exception as e_dispatch:
-                logger.exception(f"    ❌ [DISPATCH_ERROR] Error inesperado en el dispatcher para Watcher ID={watcher_instance.id}: {e_dispatch!r}")
-        # ============================================
+                matches, scanned_through_block, fetch_failed = future.result()
+            except Exception as e_fetch:
+                logger.exception(f"    ❌ [FETCH_ERROR] Error al obtener datos para el contrato {token_address}: {e_fetch!r}")
+                summary["failed_watcher_ids"].extend(w.id for w in watchers_by_token[token_address])
+                _report_progress(summary, on_progress)
+                continue
+
+            for watcher_obj in watchers_by_token[token_address]:
+                event_payloads, first_failed_block = _build_event_payloads(watcher_obj, matches.get(watcher_obj.id, []))
+                new_events = _store_watcher_scan(db, watcher_obj, event_payloads, scanned_through_block, first_failed_block)
+                if fetch_failed or new_events is None:
+                    summary["failed_watcher_ids"].append(watcher_obj.id)
+                if new_events:
+                    summary["events_created"] += len(new_events)
+
+            _report_progress(summary, on_progress)
 
     logger.info("🔄 [POLL_CYCLE] Ciclo de sondeo y notificación finalizado.")
+    return summary
 
 
 if __name__ == "__main__":
-    from .database import SessionLocal
     
     db_session = SessionLocal()
     logger.info("■■■■■■■■■■■■■■■■■■■■■■■■■■■■")
     logger.info("▶ [WATCHER_SCRIPT_RUN] Iniciando TokenWatcher Poller (ejecución directa)...")
     try:
         get_watchers_for_run = lambda: crud.get_active_watchers(db_session)
-        create_event_for_run = lambda data_payload: crud.create_event(db_session, data_payload)
 
         poll_and_notify(
             db=db_session,
             get_active_watchers_func=get_watchers_for_run,
-            create_event_func=create_event_for_run
         )
     except Exception as e_main:
         logger.exception(f"❌ [WATCHER_SCRIPT_FATAL] Excepción no manejada: {e_main!r}")
@@ -4,7 +4,12 @@ set -e
 # 1) Inicializa la base de datos (tablas)
 python create_tables.py
 
-# 2) Arranca Gunicorn con Uvicorn
+# 2) Si se pasa un comando (p. ej. el servicio poller de docker-compose), se ejecuta ese proceso
+if [ "$#" -gt 0 ]; then
+  exec "$@"
+fi
+
+# 3) Arranca Gunicorn con Uvicorn
 exec gunicorn \
   -k uvicorn.workers.UvicornWorker \
   api.app.main:app \
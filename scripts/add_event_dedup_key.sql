@@ -0,0 +1,20 @@
+-- scripts/add_event_dedup_key.sql
+--
+-- Clave única de deduplicación para crud.create_events_bulk (INSERT ... ON CONFLICT DO NOTHING).
+-- En una tabla particionada cualquier UNIQUE debe incluir la clave de partición (created_at),
+-- por eso el poller guarda en created_at el timestamp del bloque, que es determinista.
+-- Los eventos existentes ya estaban deduplicados por (watcher_id, transaction_hash): reciben log_index = 0.
+-- Ejecutar una vez: psql "$DATABASE_URL" -f scripts/add_event_dedup_key.sql
+
+ALTER TABLE events ADD COLUMN IF NOT EXISTS log_index INTEGER NOT NULL DEFAULT 0;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_constraint WHERE conname = 'uq_events_watcher_tx_log'
+  ) THEN
+    ALTER TABLE events
+      ADD CONSTRAINT uq_events_watcher_tx_log
+      UNIQUE (watcher_id, transaction_hash, log_index, created_at);
+  END IF;
+END $$;
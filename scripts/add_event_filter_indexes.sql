@@ -0,0 +1,30 @@
+-- scripts/add_event_filter_indexes.sql
+--
+-- Índices para los filtros de /events/ (crud.build_owner_events_query) en bases ya creadas;
+-- en una base nueva los crea Base.metadata.create_all a partir de models.py.
+--   * token_address_lc: copia generada en minúsculas de token_address_observed (igualdad por btree,
+--     subcadena por GIN trigram: el filtro por fragmento mantiene la semántica ILIKE '%...%').
+--   * from_address / to_address: se normalizan a minúsculas, que es como las guarda el poller.
+--   * (watcher_id, created_at, id): eventos de un watcher por rango de fechas y paginación keyset.
+--   * GIN trigram sobre token_symbol para la búsqueda por subcadena (ILIKE '%...%').
+-- Sobre una tabla particionada los índices se propagan a todas las particiones (no admite CONCURRENTLY).
+-- Ejecutar una vez: psql "$DATABASE_URL" -f scripts/add_event_filter_indexes.sql
+-- Comprobar los planes después: python scripts/check_event_query_plans.py
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE events
+  ADD COLUMN IF NOT EXISTS token_address_lc VARCHAR
+  GENERATED ALWAYS AS (lower(token_address_observed)) STORED;
+
+UPDATE events SET from_address = lower(from_address) WHERE from_address <> lower(from_address);
+UPDATE events SET to_address = lower(to_address) WHERE to_address <> lower(to_address);
+
+CREATE INDEX IF NOT EXISTS ix_events_watcher_created ON events (watcher_id, created_at, id);
+CREATE INDEX IF NOT EXISTS ix_events_token_address_lc ON events (token_address_lc varchar_pattern_ops);
+CREATE INDEX IF NOT EXISTS ix_events_token_address_lc_trgm ON events USING gin (token_address_lc gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_events_token_symbol_trgm ON events USING gin (token_symbol gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_watchers_owner_id ON watchers (owner_id);
+
+ANALYZE events;
+ANALYZE watchers;
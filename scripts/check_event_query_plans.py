@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# scripts/check_event_query_plans.py
+#
+# Prueba de regresión de planes: ejecuta EXPLAIN sobre las combinaciones habituales de filtros de
+# /events/ (crud.build_owner_events_query) y falla si alguna lee events o watchers con Seq Scan.
+# Se usa la configuración por defecto del planificador, así que se comprueba el plan que Postgres
+# elige de verdad con las estadísticas de la base: hay que ejecutarlo contra datos representativos.
+# Con --seed se crean en una base vacía (muchos usuarios con pocos watchers cada uno, como en
+# producción) y se ejecuta ANALYZE antes de comprobar; es lo que hace la CI (.github/workflows/ci.yml).
+#
+# Uso: python scripts/check_event_query_plans.py [--seed] [owner_id]   (sale con código 1 si hay regresiones)
+
+import os
+import sys
+import json
+import argparse
+from datetime import datetime, timedelta, timezone
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from sqlalchemy import desc, text
+
+from api.app import crud, models, partitions
+from api.app.database import SessionLocal, engine
+
+CHECKED_RELATIONS = ("events", "watchers")
+SEED_EMAIL_DOMAIN = "plan-check.tokenwatcher.test"
+SEED_USERS = int(os.getenv("PLAN_CHECK_SEED_USERS", "2000"))
+SEED_WATCHERS_PER_USER = int(os.getenv("PLAN_CHECK_SEED_WATCHERS_PER_USER", "3"))
+SEED_TOKENS = int(os.getenv("PLAN_CHECK_SEED_TOKENS", "200"))
+SEED_EVENTS = int(os.getenv("PLAN_CHECK_SEED_EVENTS", "300000"))
+
+def seed_representative_data():
+    """
+    Rellena una base de datos vacía con una distribución parecida a la real: muchos usuarios con
+    pocos watchers, eventos repartidos en 60 días, direcciones y símbolos variados. Se niega a
+    ejecutarse si hay usuarios que no son de la semilla (nunca contra una base con datos reales).
+    """
+    models.Base.metadata.create_all(bind=engine)
+    partitions.ensure_partitions()
+    with engine.begin() as conn:
+        foreign_users = conn.execute(
+            text("SELECT count(*) FROM users WHERE email NOT LIKE :pattern"), {"pattern": f"%@{SEED_EMAIL_DOMAIN}"}
+        ).scalar()
+        if foreign_users:
+            print(f"❌ [QUERY_PLANS] --seed solo se ejecuta en una base vacía ({foreign_users} usuarios existentes).")
+            sys.exit(2)
+        if conn.execute(text("SELECT EXISTS (SELECT 1 FROM events)")).scalar():
+            print("ℹ️  [QUERY_PLANS] La base ya tiene datos de la semilla; se reutilizan.")
+        else:
+            print(f"▶️  [QUERY_PLANS] Sembrando {SEED_USERS} usuarios, {SEED_USERS * SEED_WATCHERS_PER_USER} watchers y {SEED_EVENTS} eventos...")
+            conn.execute(text(
+                "INSERT INTO users (email, hashed_password, is_active) "
+                "SELECT 'user' || g || '@' || :domain, 'x', true FROM generate_series(1, :users) g"
+            ), {"domain": SEED_EMAIL_DOMAIN, "users": SEED_USERS})
+            conn.execute(text(
+                "INSERT INTO watchers (owner_id, name, token_address, threshold, is_active) "
+                "SELECT u.id, 'watcher ' || w, '0x' || substr(md5('token' || ((u.id * 7 + w) % :tokens)), 1, 40), 1000, w % 5 <> 0 "
+                "FROM users u CROSS JOIN generate_series(1, :per_user) w"
+            ), {"tokens": SEED_TOKENS, "per_user": SEED_WATCHERS_PER_USER})
+            conn.execute(text(
+                "WITH ids AS (SELECT array_agg(id ORDER BY id) AS a FROM watchers) "
+                "INSERT INTO events (watcher_id, token_address_observed, from_address, to_address, amount, "
+                "                    transaction_hash, log_index, block_number, usd_value, token_name, token_symbol, created_at) "
+                "SELECT w.id, w.token_address, "
+                "       '0x' || substr(md5('from' || (g % 50000)), 1, 40), '0x' || substr(md5('to' || (g % 50000)), 1, 40), "
+                "       round((random() * 1000000)::numeric, 6), '0x' || md5('tx' || g) || md5('log' || g), 0, 20000000 + g, "
+                "       round((random() * 1000000)::numeric, 4), 'Token', upper(substr(md5(w.token_address), 1, 4)), "
+                "       now() - random() * interval '60 days' "
+                "FROM generate_series(1, :events) g "
+                "CROSS JOIN ids "
+                "JOIN watchers w ON w.id = ids.a[1 + (g * 7919) % array_length(ids.a, 1)]"
+            ), {"events": SEED_EVENTS})
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        for table in ("users", "watchers", "events"):
+            conn.execute(text(f"ANALYZE {table}"))
+
+def _filter_cases(sample: models.TokenEvent | None):
+    now = datetime.now(timezone.utc)
+    token = sample.token_address_observed if sample else "0x" + "0" * 40
+    from_address = sample.from_address if sample else "0x" + "1" * 40
+    to_address = sample.to_address if sample else "0x" + "2" * 40
+    symbol = (sample.token_symbol or "USDT") if sample else "USDT"
+    watcher_id = sample.watcher_id if sample else 0
+    return {
+        "sin filtros": {},
+        "watcher": {"watcher_id": watcher_id},
+        "watcher + fechas": {"watcher_id": watcher_id, "start_date": now - timedelta(days=7), "end_date": now},
+        "fechas": {"start_date": now - timedelta(days=7), "end_date": now},
+        "token (dirección completa)": {"token_address": token},
+        "token (fragmento)": {"token_address": token[2:12]},
+        "símbolo": {"token_symbol": symbol[:3]},
+        "from": {"from_address": from_address},
+        "to": {"to_address": to_address},
+        "solo watchers activos + fechas": {"active_watchers_only": True, "start_date": now - timedelta(days=30)},
+    }
+
+def _seq_scans(plan_node, found):
+    relation = plan_node.get("Relation Name", "")
+    if plan_node.get("Node Type") == "Seq Scan" and relation.startswith(CHECKED_RELATIONS):
+        found.append(relation)
+    for child in plan_node.get("Plans", []):
+        _seq_scans(child, found)
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Comprueba que los filtros de /events/ usan índices.")
+    parser.add_argument("owner_id", nargs="?", type=int, help="Usuario cuyos filtros se comprueban (por defecto, el primero).")
+    parser.add_argument("--seed", action="store_true", help="Sembrar datos representativos en una base vacía antes de comprobar.")
+    args = parser.parse_args()
+    if args.seed:
+        seed_representative_data()
+
+    db = SessionLocal()
+    failures = 0
+    try:
+        if args.owner_id is not None:
+            owner_id = args.owner_id
+        else:
+            owner_id = db.query(models.Watcher.owner_id).order_by(models.Watcher.owner_id).limit(1).scalar() or 0
+        sample = (
+            db.query(models.TokenEvent)
+              .join(models.Watcher, models.TokenEvent.watcher_id == models.Watcher.id)
+              .filter(models.Watcher.owner_id == owner_id)
+              .order_by(desc(models.TokenEvent.created_at))
+              .first()
+        )
+        print(f"▶️  [QUERY_PLANS] Comprobando planes de /events/ para owner_id={owner_id}...")
+
+        dbapi_connection = db.connection().connection
+        for name, filters in _filter_cases(sample).items():
+            query = crud.build_owner_events_query(db, owner_id, **filters)\
+                        .order_by(desc(models.TokenEvent.created_at), desc(models.TokenEvent.id))\
+                        .limit(100)
+            compiled = query.statement.compile(dialect=db.bind.dialect)
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute("EXPLAIN (FORMAT JSON) " + compiled.string, compiled.params)
+                plan = cursor.fetchone()[0]
+            finally:
+                cursor.close()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            seq_scans = _seq_scans(plan[0]["Plan"], [])
+            if seq_scans:
+                failures += 1
+                print(f"    ❌ [QUERY_PLANS] {name}: Seq Scan sobre {', '.join(sorted(set(seq_scans)))}")
+            else:
+                print(f"    ✅ [QUERY_PLANS] {name}")
+    finally:
+        db.rollback()
+        db.close()
+
+    if failures:
+        print(f"❌ [QUERY_PLANS] {failures} combinación(es) de filtros en las que el planificador elige Seq Scan.")
+        sys.exit(1)
+    print("✅ [QUERY_PLANS] Todas las combinaciones usan índices.")
+
+if __name__ == "__main__":
+    main()
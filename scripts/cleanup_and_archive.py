@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
+#
+# Archiva en S3 los eventos más antiguos que EVENT_RETENTION_DAYS y los elimina de Postgres
+# partición a partición (ver api/app/partitions.py):
+#   * Particiones completamente caducadas: se separan de events (DETACH), se archivan y se borran
+#     con DROP TABLE. Sin DELETE fila a fila ni VACUUM posterior.
+#   * Partición frontera (contiene el corte) y DEFAULT: se archivan sus filas caducadas y se
+#     borran en lotes de ARCHIVE_DELETE_CHUNK_SIZE, con VACUUM ANALYZE solo de esa partición.
+# Las filas se leen con un cursor de servidor y se suben como NDJSON gzip (o Parquet por mes y
+# token con ARCHIVE_FORMAT=parquet) por multipart upload (api/app/archive.py), con memoria
+# constante. Antes de borrar las filas de cada partición, sus objetos se añaden al manifest de la
+# ejecución y se indexan para /events/: si algo falla, no se borra nada.
 import os
 import sys
-import json
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 # ---- Permite importar tu paquete api/ desde este script ----
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
@@ -11,14 +21,12 @@ if ROOT_DIR not in sys.path:
     sys.path.insert(0, ROOT_DIR)
 # --------------------------------------------------------------
 
-import boto3
 import psycopg2
 from sqlalchemy import text
-# from sqlalchemy.orm import Session # No se usa Session directamente aquí, sino SessionLocal
 
-# CAMBIO: Importar SessionLocal desde database y settings desde config
-from api.app.database import SessionLocal
-from api.app.config import settings # Para S3_BUCKET, AWS_REGION, DATABASE_URL si no usas os.getenv directamente
+from api.app.database import SessionLocal, engine
+from api.app.config import settings # Para S3_BUCKET, AWS_REGION, S3_ENDPOINT_URL, DATABASE_URL
+from api.app import archive, cold_storage, partitions
 
 # Logging
 logger = logging.getLogger("cleanup_and_archive")
@@ -28,119 +36,147 @@ logging.basicConfig(
     handlers=[logging.StreamHandler(sys.stdout)] # Asegurar que los logs vayan a stdout para Render
 )
 
-def main():
-    logger.info("🚀 Iniciando script de limpieza y archivado de eventos...")
+EVENTS_TABLE_NAME = partitions.EVENTS_TABLE
+DELETE_CHUNK_SIZE = int(os.getenv("ARCHIVE_DELETE_CHUNK_SIZE", "5000"))
 
-    # 1) Lee variables de entorno (usando el objeto settings o directamente os.getenv)
-    # Usar el objeto settings es más consistente si ya lo tienes configurado.
-    DATABASE_URL = settings.DATABASE_URL
-    S3_BUCKET    = settings.S3_BUCKET
-    AWS_REGION   = settings.AWS_REGION
-    # AWS_ACCESS_KEY_ID y AWS_SECRET_ACCESS_KEY son leídos automáticamente por boto3 del entorno.
+ARCHIVED_KEYS_TABLE = "archived_event_keys"
 
-    if not DATABASE_URL or not S3_BUCKET:
-        logger.error("❌ Faltan variables de entorno críticas: DATABASE_URL y/o S3_BUCKET. Terminando script.")
-        sys.exit(1)
+def _stream_rows(sql: str, params=None, conn=None):
+    """
+    Filas como dicts desde un cursor de servidor: nunca hay más de ARCHIVE_FETCH_SIZE en memoria.
+    Con `conn` se lee en esa conexión (p. ej. para ver sus tablas temporales).
+    """
+    statement = text(sql).execution_options(stream_results=True, max_row_buffer=settings.ARCHIVE_FETCH_SIZE)
+    if conn is not None:
+        for row in conn.execute(statement, params or {}):
+            yield dict(row._mapping)
+        return
+    with engine.connect() as own_conn:
+        for row in own_conn.execute(statement, params or {}):
+            yield dict(row._mapping)
+
+class ArchivePublisher:
+    """
+    Manifest de la ejecución, publicado partición a partición antes de borrar sus filas: se reescribe
+    con todo lo archivado hasta ahora y se indexan los objetos nuevos en archived_event_objects.
+    Así un fallo a mitad de ejecución nunca deja filas borradas sin manifest ni índice.
+    """
 
-    # CAMBIO: Usar el nombre de columna correcto 'created_at'
-    # El número de días para el corte de eventos.
-    # ---- MODIFICACIÓN AQUÍ: Cambiamos el default de 1 a 7 ----
-    DAYS_TO_KEEP = int(os.getenv("EVENT_RETENTION_DAYS", "7")) # Mantener 7 días por defecto
-    # ---- FIN DE LA MODIFICACIÓN ----
-    cutoff_date = datetime.utcnow() - timedelta(days=DAYS_TO_KEEP)
-    logger.info(f"🗓️  Archivando y purgando eventos más antiguos que: {cutoff_date.isoformat()} UTC (política de {DAYS_TO_KEEP} días)")
+    def __init__(self, s3_client, bucket: str, run_id: str, cutoff_date: datetime):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.run_id = run_id
+        self.cutoff_date = cutoff_date
+        self.entries = []
 
+    def publish(self, entries) -> None:
+        archive.write_manifest(self.s3_client, self.bucket, self.run_id, self.entries + entries, self.cutoff_date)
+        try:
+            with SessionLocal() as db:
+                indexed = cold_storage.index_archive_entries(db, self.run_id, entries)
+        except Exception:
+            # Las filas no se van a borrar: el manifest vuelve a lo ya publicado para no apuntar a ellas.
+            archive.write_manifest(self.s3_client, self.bucket, self.run_id, self.entries, self.cutoff_date)
+            raise
+        self.entries.extend(entries)
+        logger.info(f"🧾 {indexed} objeto(s) archivado(s) indexado(s) para consultas.")
 
-    # Nombre de la tabla de eventos (debe coincidir con models.Event.__tablename__)
-    EVENTS_TABLE_NAME = "events"
+def archive_and_drop_partition(s3_client, bucket: str, run_id: str, partition, fmt: str, publisher: ArchivePublisher):
+    """
+    Archiva una partición entera y la elimina. Se separa de events antes de leerla, así ningún
+    insert tardío cae en ella mientras se archiva (iría a la DEFAULT). El DROP solo se hace con
+    el manifest escrito e indexado; si algo falla antes, se vuelve a adjuntar. Devuelve las
+    entradas de manifest (vacío si no tenía filas).
+    """
+    name = partition["name"]
+    with engine.begin() as conn:
+        partitions.detach_partition(conn, name)
+    logger.info(f"✂️  Partición {name} separada de '{EVENTS_TABLE_NAME}'.")
 
-    events_to_archive = []
-    # 2) Abre sesión y lee filas antiguas
     try:
-        with SessionLocal() as session: # Usar SessionLocal del módulo database
-            logger.info(f"ℹ️  Consultando eventos antiguos en la tabla '{EVENTS_TABLE_NAME}'...")
-            # Usar columna 'created_at'
-            result_proxy = session.execute(
-                text(f"SELECT * FROM {EVENTS_TABLE_NAME} WHERE created_at < :cutoff_date ORDER BY created_at ASC"),
-                {"cutoff_date": cutoff_date}
+        entries = archive.write_archive(
+            s3_client, bucket, run_id, name,
+            _stream_rows(f'SELECT * FROM "{name}" ORDER BY {archive.archive_order_by(fmt)}'), fmt,
+        )
+        if entries:
+            publisher.publish(entries)
+    except Exception:
+        logger.error(f"❌ Error archivando {name}; se vuelve a adjuntar a '{EVENTS_TABLE_NAME}'.")
+        try:
+            with engine.begin() as conn:
+                partitions.attach_partition(conn, name, partition["start"], partition["end"])
+        except Exception as e_attach:
+            # P. ej. la DEFAULT ya ha recibido filas de ese rango: la tabla queda separada con sus filas intactas.
+            logger.critical(
+                f"🚨 No se pudo volver a adjuntar {name} [{partition['start']}, {partition['end']}) a "
+                f"'{EVENTS_TABLE_NAME}': la tabla \"{name}\" queda huérfana, sin borrar y fuera de las "
+                f"consultas. Hay que revisarla y adjuntarla o archivarla a mano. Error: {e_attach!r}"
             )
-            # Convertir las filas a diccionarios
-            events_to_archive = [dict(row._mapping) for row in result_proxy]
-
-            if not events_to_archive:
-                logger.info("✅ No hay eventos antiguos para archivar y purgar esta vez.")
-                return # Salir si no hay nada que hacer
-
-            logger.info(f"📄 Encontrados {len(events_to_archive)} eventos para archivar.")
-
-            # 3) Serializa y sube a S3
-            s3_file_key = f"archived_events/{datetime.utcnow().strftime('%Y-%m-%d_%H-%M-%S')}_event_archive.json"
-            
-            logger.info(f"📦 Subiendo {len(events_to_archive)} eventos a S3: s3://{S3_BUCKET}/{s3_file_key}")
-            s3_client = boto3.client("s3", region_name=AWS_REGION)
-            
-            def datetime_converter(o):
-                if isinstance(o, datetime):
-                    return o.isoformat()
-            
-            s3_client.put_object(
-                Bucket=S3_BUCKET,
-                Key=s3_file_key,
-                Body=json.dumps(events_to_archive, default=datetime_converter, indent=2), # Añadido indent=2 para legibilidad en S3
-                ContentType="application/json"
+        raise
+
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE "{name}"'))
+    logger.info(f"🗑️  Partición {name} eliminada ({sum(e['rows'] for e in entries)} eventos archivados).")
+    return entries
+
+def archive_and_trim_partition(s3_client, bucket: str, run_id: str, name: str, cutoff_date: datetime, fmt: str,
+                               publisher: ArchivePublisher):
+    """
+    Archiva las filas caducadas de una partición que sigue en uso y después las borra por lotes.
+    Las claves (id, created_at) de lo que se archiva se fijan antes de leer en una tabla temporal,
+    y el borrado hace join con ella: un evento con created_at antiguo insertado después (backfill)
+    no se borra sin archivar, queda para la siguiente ejecución. Como en el DROP, el borrado empieza
+    con el manifest ya escrito e indexado. Devuelve las entradas de manifest (vacío si no había filas).
+    """
+    with engine.connect() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {ARCHIVED_KEYS_TABLE}"))
+        conn.execute(text(
+            f'CREATE TEMP TABLE {ARCHIVED_KEYS_TABLE} AS '
+            f'SELECT id, created_at FROM "{name}" WHERE created_at < :cutoff_date'
+        ), {"cutoff_date": cutoff_date})
+        conn.commit()
+        try:
+            entries = archive.write_archive(
+                s3_client, bucket, run_id, name,
+                _stream_rows(
+                    f'SELECT "{name}".* FROM "{name}" JOIN {ARCHIVED_KEYS_TABLE} USING (id, created_at) '
+                    f'ORDER BY {archive.archive_order_by(fmt)}',
+                    conn=conn,
+                ),
+                fmt,
             )
-            logger.info(f"✅ Upload a S3 completado: {s3_file_key}")
-
-            # 4) Borra de la BD (solo si la subida a S3 fue exitosa)
-            logger.info(f"🗑️  Eliminando {len(events_to_archive)} eventos archivados de la tabla '{EVENTS_TABLE_NAME}' en la base de datos...")
-            event_ids_to_delete = [event['id'] for event in events_to_archive] # Asumimos que todos los eventos tienen 'id'
-            
-            # Necesitamos también las 'created_at' para la clave primaria compuesta
-            # Creamos una lista de tuplas (id, created_at)
-            # Nota: Asegúrate que los objetos 'event' en 'events_to_archive' tengan 'created_at' como objeto datetime
-            # o como string ISO formateado si la consulta SQL los devuelve así.
-            # El json.dumps con default=datetime_converter lo maneja para S3, pero aquí lo necesitamos para la query.
-            # Si `event['created_at']` ya es un string ISO, está bien. Si es datetime, también.
-            
-            # Para borrar de forma segura con PK compuesta, es mejor iterar o usar una condición más compleja
-            # o borrar por una lista de IDs si 'id' es suficientemente único para este propósito de borrado.
-            # Dado que usamos `PrimaryKeyConstraint('id', 'created_at')`, borrar solo por 'id' puede ser ambiguo
-            # si los IDs no son globalmente únicos a través de particiones.
-            # Sin embargo, si `id` es un SERIAL y siempre incrementa, debería ser seguro.
-            # Vamos a mantener el borrado por IDs por simplicidad, asumiendo que son los IDs correctos de los eventos archivados.
-
-            if event_ids_to_delete:
-                # Construir la condición para borrar por la clave primaria compuesta (id, created_at)
-                # Esto es más seguro si la tabla está particionada y los IDs no son únicos globalmente.
-                # Sin embargo, si los IDs de `events_to_archive` son los correctos, podemos usarlos.
-                # La forma más simple si los IDs son de la tabla principal y únicos para esos eventos:
-                placeholders = ", ".join([f":id_{i}" for i in range(len(event_ids_to_delete))])
-                delete_statement = text(f"DELETE FROM {EVENTS_TABLE_NAME} WHERE id IN ({placeholders})")
-                
-                params_for_delete = {f"id_{i}": event_id for i, event_id in enumerate(event_ids_to_delete)}
-
-                # O si quieres ser más preciso con la PK compuesta, necesitarías los created_at también:
-                # conditions = " OR ".join([f"(id = :id_{i} AND created_at = :created_at_{i})" for i in range(len(events_to_archive))])
-                # delete_statement = text(f"DELETE FROM {EVENTS_TABLE_NAME} WHERE {conditions}")
-                # params_for_delete = {}
-                # for i, event_item in enumerate(events_to_archive):
-                #     params_for_delete[f"id_{i}"] = event_item['id']
-                #     params_for_delete[f"created_at_{i}"] = event_item['created_at'] # Asegurarse que esto sea un datetime o string compatible con la DB
-
-                session.execute(delete_statement, params_for_delete)
-                session.commit()
-                logger.info(f"✅ {len(event_ids_to_delete)} eventos antiguos eliminados de la base de datos.")
-            else:
-                logger.info("ℹ️ No se encontraron IDs para eliminar.")
+            conn.commit()
+            if not entries:
+                return entries
+            publisher.publish(entries)
 
-    except Exception as e:
-        logger.error(f"❌ Error durante el proceso de selección o borrado de eventos / subida a S3: {e}", exc_info=True)
-        # No salimos con sys.exit(1) aquí para permitir que VACUUM intente ejecutarse si es un error no crítico de S3
-        # Pero si el error fue en la consulta o borrado de BD, VACUUM podría no ser ideal.
-        # Considera la granularidad del manejo de errores. Por ahora, lo logueamos.
+            archived = sum(entry["rows"] for entry in entries)
+            logger.info(f"🗑️  Eliminando {archived} eventos archivados de {name} en lotes de {DELETE_CHUNK_SIZE}...")
+            # Cada lote saca sus claves de la tabla temporal y borra exactamente esas filas.
+            delete_statement = text(
+                f'WITH batch AS ('
+                f'  DELETE FROM {ARCHIVED_KEYS_TABLE} WHERE ctid = ANY(ARRAY('
+                f'    SELECT ctid FROM {ARCHIVED_KEYS_TABLE} LIMIT :chunk_size'
+                f'  )) RETURNING id, created_at'
+                f') '
+                f'DELETE FROM "{name}" AS e USING batch WHERE e.id = batch.id AND e.created_at = batch.created_at'
+            )
+            pending_statement = text(f"SELECT EXISTS (SELECT 1 FROM {ARCHIVED_KEYS_TABLE})")
+            deleted_total = 0
+            while conn.execute(pending_statement).scalar():
+                deleted_total += conn.execute(delete_statement, {"chunk_size": DELETE_CHUNK_SIZE}).rowcount
+                conn.commit()
+        finally:
+            conn.rollback()
+            conn.execute(text(f"DROP TABLE IF EXISTS {ARCHIVED_KEYS_TABLE}"))
+            conn.commit()
+    logger.info(f"✅ {deleted_total} eventos antiguos eliminados de {name}.")
+    return entries
 
-    # 5) VACUUM ANALYZE fuera de transacción y usando psycopg2 directamente para autocommit
-    logger.info(f"🧹 Ejecutando VACUUM ANALYZE en la tabla '{EVENTS_TABLE_NAME}'...")
+def vacuum_analyze(table_names) -> None:
+    """VACUUM ANALYZE fuera de transacción (psycopg2 en autocommit), solo de las tablas indicadas."""
+    if not table_names:
+        return
     db_conn_for_vacuum = None # Para asegurar que se cierra
     try:
         conn_string = settings.DATABASE_URL
@@ -150,16 +186,73 @@ def main():
         db_conn_for_vacuum = psycopg2.connect(conn_string)
         db_conn_for_vacuum.autocommit = True
         with db_conn_for_vacuum.cursor() as cur:
-            cur.execute(f"VACUUM ANALYZE {EVENTS_TABLE_NAME};")
-            logger.info(f"✅ VACUUM ANALYZE en '{EVENTS_TABLE_NAME}' completado.")
+            for table_name in table_names:
+                logger.info(f"🧹 Ejecutando VACUUM ANALYZE en '{table_name}'...")
+                cur.execute(f'VACUUM ANALYZE "{table_name}";')
+        logger.info("✅ VACUUM ANALYZE completado.")
     except Exception as e:
         logger.error(f"❌ Error durante VACUUM ANALYZE: {e}", exc_info=True)
     finally:
         if db_conn_for_vacuum:
             db_conn_for_vacuum.close()
-            logger.info("ℹ️ Conexión de Psycopg2 (para VACUUM) cerrada.")
-    
-    logger.info("🎉 Script de limpieza y archivado finalizado.")
+
+def main():
+    logger.info("🚀 Iniciando script de limpieza y archivado de eventos...")
+
+    # 1) Configuración. AWS_ACCESS_KEY_ID y AWS_SECRET_ACCESS_KEY los lee boto3 del entorno.
+    DATABASE_URL = settings.DATABASE_URL
+    S3_BUCKET    = settings.S3_BUCKET
+
+    if not DATABASE_URL or not S3_BUCKET:
+        logger.error("❌ Faltan variables de entorno críticas: DATABASE_URL y/o S3_BUCKET. Terminando script.")
+        sys.exit(1)
+
+    DAYS_TO_KEEP = settings.EVENT_RETENTION_DAYS # Mantener 7 días por defecto
+    cutoff_date = datetime.now(timezone.utc) - timedelta(days=DAYS_TO_KEEP)
+    run_id = datetime.now(timezone.utc).strftime('%Y-%m-%d_%H-%M-%S')
+    logger.info(f"🗓️  Archivando y purgando eventos más antiguos que: {cutoff_date.isoformat()} (política de {DAYS_TO_KEEP} días)")
+
+    s3_client = archive.get_s3_client()
+    archive_format = archive.effective_format()
+    logger.info(f"🗄️  Formato de archivo: {archive_format}")
+
+    # 2) Decide qué hacer con cada partición según su rango
+    with engine.connect() as conn:
+        event_partitions = partitions.list_partitions(conn)
+
+    to_drop, to_trim = [], []
+    if not event_partitions:
+        # Tabla sin particiones: solo queda el borrado por lotes sobre la tabla entera.
+        to_trim.append(EVENTS_TABLE_NAME)
+    for partition in event_partitions:
+        if partition["end"] is not None and partition["end"] <= cutoff_date:
+            to_drop.append(partition)
+        elif partition["is_default"] or partition["start"] is None or partition["start"] < cutoff_date:
+            to_trim.append(partition["name"])
+
+    publisher = ArchivePublisher(s3_client, S3_BUCKET, run_id, cutoff_date)
+    trimmed = []
+    for partition in to_drop:
+        try:
+            archive_and_drop_partition(s3_client, S3_BUCKET, run_id, partition, archive_format, publisher)
+        except Exception as e:
+            logger.error(f"❌ Error archivando/eliminando la partición {partition['name']}: {e}", exc_info=True)
+
+    for name in to_trim:
+        try:
+            if archive_and_trim_partition(s3_client, S3_BUCKET, run_id, name, cutoff_date, archive_format, publisher):
+                trimmed.append(name)
+        except Exception as e:
+            logger.error(f"❌ Error archivando/purgando eventos de {name}: {e}", exc_info=True)
+
+    archived_total = sum(entry["rows"] for entry in publisher.entries)
+    if not publisher.entries:
+        logger.info("✅ No hay eventos antiguos para archivar y purgar esta vez.")
+
+    # 3) Mantenimiento solo de las particiones que han tenido DELETE
+    vacuum_analyze(trimmed)
+
+    logger.info(f"🎉 Script de limpieza y archivado finalizado ({archived_total} eventos archivados).")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
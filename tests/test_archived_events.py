@@ -0,0 +1,102 @@
+# tests/test_archived_events.py
+
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from api.app import cold_storage, crud
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _row(event_id, hours):
+    return {
+        "id": event_id, "watcher_id": 1, "token_address_observed": "0xtoken",
+        "from_address": "0xfrom", "to_address": "0xto", "amount": "1", "transaction_hash": f"0x{event_id}",
+        "log_index": 0, "block_number": event_id, "usd_value": None,
+        "created_at": (T0 + timedelta(hours=hours)).isoformat(),
+    }
+
+
+@pytest.fixture
+def archive(monkeypatch):
+    """Tres objetos de un día con 24 eventos cada uno (uno por hora); `archive.read` guarda los descargados."""
+    objects, rows = [], {}
+    for day in range(3):
+        key = f"day{day}"
+        objects.append(SimpleNamespace(
+            key=key, created_at_min=T0 + timedelta(days=day), created_at_max=T0 + timedelta(days=day, hours=23),
+        ))
+        rows[key] = [_row(day * 24 + hour + 1, day * 24 + hour) for hour in range(24)]
+    archive = SimpleNamespace(read=[])
+
+    def find_archived_objects(db, watcher_ids, start, end, token_address, newest_first=True):
+        found = [
+            obj for obj in objects
+            if (start is None or obj.created_at_max >= start) and (end is None or obj.created_at_min < end)
+        ]
+        return sorted(found, key=lambda obj: obj.created_at_max, reverse=newest_first)
+
+    def iter_object_rows(archived_object, watcher_ids, start, end):
+        archive.read.append(archived_object.key)
+        return iter(rows[archived_object.key])
+
+    monkeypatch.setattr(cold_storage, "_archive_scope", lambda *args: ({1}, None, None))
+    monkeypatch.setattr(cold_storage, "find_archived_objects", find_archived_objects)
+    monkeypatch.setattr(cold_storage, "_iter_object_rows", iter_object_rows)
+    return archive
+
+
+def test_first_page_reads_only_the_newest_object(archive):
+    events = cold_storage.seek_archived_events(None, owner_id=1, count=10)
+
+    assert [event.id for event in events] == list(range(72, 62, -1))
+    assert archive.read == ["day2"]
+
+
+def test_cursor_seeks_to_the_objects_at_its_position(archive):
+    cursor_event = SimpleNamespace(created_at=T0 + timedelta(hours=30), id=31)
+    events = cold_storage.seek_archived_events(
+        None, owner_id=1, count=10, after=(cursor_event.created_at, cursor_event.id)
+    )
+
+    assert [event.id for event in events] == list(range(30, 20, -1))
+    # day2 empieza después del cursor y no se descarga; day0 se lee solo para completar la página.
+    assert archive.read == ["day1", "day0"]
+
+
+def test_ascending_seek_starts_at_the_cursor(archive):
+    after = (T0 + timedelta(hours=40), 41)
+    events = cold_storage.seek_archived_events(None, owner_id=1, count=5, descending=False, after=after)
+
+    assert [event.id for event in events] == [42, 43, 44, 45, 46]
+    assert archive.read == ["day1"]
+
+
+def test_default_listing_continues_into_the_archive_when_postgres_runs_out(monkeypatch):
+    hot_page = [SimpleNamespace(id=100)]
+    merged_page = ([SimpleNamespace(id=100), SimpleNamespace(id=72)], "next")
+    calls = []
+    monkeypatch.setattr(crud, "build_owner_events_query", lambda db, owner_id, **filters: "query")
+    monkeypatch.setattr(crud, "_paginate_events", lambda *args: (hot_page, None))
+    monkeypatch.setattr(crud, "_merge_archived_events", lambda *args: calls.append(args) or merged_page)
+
+    data = crud.get_all_events_for_owner(None, owner_id=1, limit=2, include_total=False)
+    assert [event.id for event in data["events"]] == [100, 72]
+    assert data["next_cursor"] == "next"
+    assert len(calls) == 1
+
+    # Con otro orden el archivo no va detrás de Postgres: sin include_archived no se mezcla.
+    data = crud.get_all_events_for_owner(None, owner_id=1, limit=2, include_total=False, sort_by="amount")
+    assert data["events"] == hot_page
+    assert len(calls) == 1
+
+
+def test_full_hot_page_does_not_touch_the_archive(monkeypatch):
+    monkeypatch.setattr(crud, "build_owner_events_query", lambda db, owner_id, **filters: "query")
+    monkeypatch.setattr(crud, "_paginate_events", lambda *args: ([SimpleNamespace(id=2), SimpleNamespace(id=1)], "cursor"))
+    monkeypatch.setattr(crud, "_merge_archived_events", lambda *args: pytest.fail("archive read"))
+
+    data = crud.get_all_events_for_owner(None, owner_id=1, limit=2, include_total=False)
+    assert data["next_cursor"] == "cursor"
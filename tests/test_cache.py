@@ -0,0 +1,135 @@
+# tests/test_cache.py
+
+import threading
+import time
+
+import pytest
+
+from api.app import cache
+from api.app.cache import TTLCache
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _FakeClock()
+    monkeypatch.setattr(cache, "time", fake)
+    return fake
+
+
+def test_values_expire_after_ttl(clock):
+    ttl_cache = TTLCache(maxsize=10, ttl=30)
+    ttl_cache.set("USDT", 1.0)
+
+    clock.now += 29
+    assert ttl_cache.get("USDT") == 1.0
+    clock.now += 1
+    assert ttl_cache.get("USDT") is None
+
+
+def test_none_results_use_the_negative_ttl(clock):
+    ttl_cache = TTLCache(maxsize=10, ttl=300, negative_ttl=10)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return None
+
+    assert ttl_cache.get_or_load("unknown", loader) is None
+    clock.now += 9
+    assert ttl_cache.get_or_load("unknown", loader) is None
+    assert len(calls) == 1
+    clock.now += 1
+    ttl_cache.get_or_load("unknown", loader)
+    assert len(calls) == 2
+
+
+def test_zero_negative_ttl_never_caches_misses(clock):
+    # Configuración de la caché de principals: un usuario recién registrado se ve al instante.
+    ttl_cache = TTLCache(maxsize=10, ttl=60, negative_ttl=0)
+    results = iter([None, "principal"])
+
+    assert ttl_cache.get_or_load("new@tokenwatcher.test", lambda: next(results)) is None
+    assert ttl_cache.get_or_load("new@tokenwatcher.test", lambda: next(results)) == "principal"
+    assert ttl_cache.get_or_load("new@tokenwatcher.test", lambda: "reloaded") == "principal"
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    ttl_cache = TTLCache(maxsize=2, ttl=60)
+    ttl_cache.set("a", 1)
+    ttl_cache.set("b", 2)
+    ttl_cache.get("a")
+    ttl_cache.set("c", 3)
+
+    assert ttl_cache.get("b") is None
+    assert ttl_cache.get("a") == 1
+    assert ttl_cache.stats()["evictions"] == 1
+
+
+def test_invalidate_forces_a_reload(clock):
+    ttl_cache = TTLCache(maxsize=10, ttl=60)
+    ttl_cache.set("user@tokenwatcher.test", "free")
+    ttl_cache.invalidate("user@tokenwatcher.test")
+
+    assert ttl_cache.get_or_load("user@tokenwatcher.test", lambda: "pro") == "pro"
+
+
+def test_concurrent_misses_share_a_single_load():
+    ttl_cache = TTLCache(maxsize=10, ttl=60)
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return 42
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(ttl_cache.get_or_load("ETH", loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while ttl_cache.stats()["coalesced"] < 7:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == [42] * 8
+    assert len(calls) == 1
+    assert ttl_cache.stats()["misses"] == 1
+
+
+def test_loader_errors_reach_every_waiter_and_are_not_cached():
+    ttl_cache = TTLCache(maxsize=10, ttl=60)
+    release = threading.Event()
+
+    def failing_loader():
+        release.wait(5)
+        raise RuntimeError("provider down")
+
+    errors = []
+
+    def worker():
+        try:
+            ttl_cache.get_or_load("ETH", failing_loader)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while ttl_cache.stats()["coalesced"] < 2:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ["provider down"] * 3
+    assert ttl_cache.get_or_load("ETH", lambda: 7) == 7
@@ -0,0 +1,107 @@
+# tests/test_cleanup_archive.py
+
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from scripts import cleanup_and_archive as cleanup
+
+PARTITION = {"name": "events_2024_01", "start": "2024-01-01", "end": "2024-02-01"}
+ENTRY_KEY = "archived_events/run/events_2024_01.ndjson.gz"
+
+
+class _FakeConn:
+    def __init__(self, log):
+        self.log = log
+
+    def execute(self, statement, params=None):
+        self.log.append(("sql", str(statement)))
+
+
+class _FakeEngine:
+    def __init__(self, log):
+        self.log = log
+
+    @contextmanager
+    def begin(self):
+        yield _FakeConn(self.log)
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    """Sustituye base de datos, S3 e índice; `fake.log` guarda el orden de las operaciones."""
+    fake = SimpleNamespace(log=[], index_fails=False, attach_fails=False)
+
+    def write_manifest(s3_client, bucket, run_id, entries, cutoff):
+        fake.log.append(("manifest", [entry["key"] for entry in entries]))
+
+    def index_archive_entries(db, run_id, entries):
+        if fake.index_fails:
+            raise RuntimeError("db down")
+        fake.log.append(("index", [entry["key"] for entry in entries]))
+        return len(entries)
+
+    def attach_partition(conn, name, start, end):
+        if fake.attach_fails:
+            raise RuntimeError("updated partition constraint for default partition would be violated")
+        fake.log.append(("attach", name))
+
+    @contextmanager
+    def session():
+        yield object()
+
+    monkeypatch.setattr(cleanup, "engine", _FakeEngine(fake.log))
+    monkeypatch.setattr(cleanup, "SessionLocal", session)
+    monkeypatch.setattr(cleanup, "_stream_rows", lambda sql, params=None, conn=None: iter(()))
+    monkeypatch.setattr(cleanup.archive, "write_archive", lambda *args: [{"key": ENTRY_KEY, "rows": 3}])
+    monkeypatch.setattr(cleanup.archive, "write_manifest", write_manifest)
+    monkeypatch.setattr(cleanup.cold_storage, "index_archive_entries", index_archive_entries)
+    monkeypatch.setattr(cleanup.partitions, "detach_partition", lambda conn, name: fake.log.append(("detach", name)))
+    monkeypatch.setattr(cleanup.partitions, "attach_partition", attach_partition)
+    return fake
+
+
+def _publisher():
+    return cleanup.ArchivePublisher(None, "bucket", "run", cutoff_date=None)
+
+
+def test_partition_is_dropped_only_after_manifest_and_index(fake):
+    publisher = _publisher()
+    cleanup.archive_and_drop_partition(None, "bucket", "run", PARTITION, "ndjson", publisher)
+
+    assert fake.log == [
+        ("detach", "events_2024_01"),
+        ("manifest", [ENTRY_KEY]),
+        ("index", [ENTRY_KEY]),
+        ("sql", 'DROP TABLE "events_2024_01"'),
+    ]
+    assert [entry["key"] for entry in publisher.entries] == [ENTRY_KEY]
+
+
+def test_index_failure_reattaches_and_rolls_back_the_manifest(fake):
+    fake.index_fails = True
+    publisher = _publisher()
+    publisher.entries.append({"key": "archived_events/run/events_2023_12.ndjson.gz", "rows": 1})
+
+    with pytest.raises(RuntimeError):
+        cleanup.archive_and_drop_partition(None, "bucket", "run", PARTITION, "ndjson", publisher)
+
+    assert ("sql", 'DROP TABLE "events_2024_01"') not in fake.log
+    assert fake.log[-2:] == [
+        ("manifest", ["archived_events/run/events_2023_12.ndjson.gz"]),
+        ("attach", "events_2024_01"),
+    ]
+    assert len(publisher.entries) == 1
+
+
+def test_failed_reattach_names_the_orphaned_table(fake, caplog):
+    fake.index_fails = True
+    fake.attach_fails = True
+
+    with pytest.raises(RuntimeError, match="db down"):
+        cleanup.archive_and_drop_partition(None, "bucket", "run", PARTITION, "ndjson", _publisher())
+
+    orphan_logs = [record for record in caplog.records if record.levelname == "CRITICAL"]
+    assert len(orphan_logs) == 1
+    assert '"events_2024_01" queda huérfana' in orphan_logs[0].getMessage()
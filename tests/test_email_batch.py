@@ -0,0 +1,116 @@
+# tests/test_email_batch.py
+
+from types import SimpleNamespace
+
+import pytest
+
+from api.app import email_utils, rate_limiter
+from api.app.rate_limiter import DESTINATION_LIMITS, KeyedRateLimiter
+
+
+class _FakeBatch:
+    """Sustituye a resend.Batch: responde con los ids indicados (o lanza) por cada llamada."""
+
+    def __init__(self, responses=None):
+        self.responses = list(responses or [])
+        self.chunks = []
+
+    def send(self, chunk):
+        self.chunks.append(list(chunk))
+        if self.responses:
+            response = self.responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        return {"data": [{"id": f"email-{len(self.chunks)}-{index}"} for index in range(len(chunk))]}
+
+
+class _RecordingLimiter:
+    def __init__(self):
+        self.acquired = []
+
+    def acquire(self, kind, key, tokens=1.0):
+        self.acquired.append((kind, key))
+        return 0.0
+
+
+@pytest.fixture
+def resend_batch(monkeypatch):
+    def install(responses=None):
+        fake = _FakeBatch(responses)
+        monkeypatch.setattr(email_utils.resend, "Batch", fake)
+        return fake
+    return install
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    recording = _RecordingLimiter()
+    monkeypatch.setattr(email_utils, "notification_limiter", recording)
+    return recording
+
+
+def _emails(count, domain="example.test"):
+    return [email_utils._build_email_params(f"user{index}@{domain}", "Alert", "<p>x</p>") for index in range(count)]
+
+
+def test_emails_are_sent_in_chunks_of_the_batch_limit(resend_batch, limiter):
+    fake = resend_batch()
+
+    results = email_utils.send_email_batch(_emails(email_utils.RESEND_BATCH_LIMIT * 2 + 5))
+
+    assert [len(chunk) for chunk in fake.chunks] == [email_utils.RESEND_BATCH_LIMIT, email_utils.RESEND_BATCH_LIMIT, 5]
+    assert results == [True] * (email_utils.RESEND_BATCH_LIMIT * 2 + 5)
+
+
+def test_results_map_back_to_each_email_in_order(resend_batch, limiter):
+    resend_batch([{"data": [{"id": "a"}, {}, None, {"id": "d"}]}])
+
+    assert email_utils.send_email_batch(_emails(5)) == [True, False, False, True, False]
+
+
+def test_a_failed_chunk_only_fails_its_own_emails(resend_batch, limiter, monkeypatch):
+    monkeypatch.setattr(email_utils, "RESEND_BATCH_LIMIT", 2)
+    resend_batch([{"data": [{"id": "a"}, {"id": "b"}]}, RuntimeError("502 Bad Gateway"), None])
+
+    assert email_utils.send_email_batch(_emails(6)) == [True, True, False, False, False, False]
+
+
+def test_each_chunk_spends_one_api_key_token(resend_batch, limiter, monkeypatch):
+    monkeypatch.setattr(email_utils, "RESEND_BATCH_LIMIT", 2)
+    resend_batch()
+
+    email_utils.send_email_batch(_emails(2, domain="example.test") + _emails(1, domain="other.test"))
+
+    api_key = email_utils.settings.RESEND_API_KEY
+    assert limiter.acquired == [("resend_api", api_key), ("resend_api", api_key)]
+
+
+def test_full_batch_for_one_domain_does_not_wait_on_the_domain_bucket(resend_batch, monkeypatch):
+    # Con el limitador real: 100 alertas a gmail.com esperarían ~95 s en el bucket email_domain (1/s, ráfaga 5).
+    limiter = KeyedRateLimiter(DESTINATION_LIMITS)
+    waits = []
+    monkeypatch.setattr(email_utils, "notification_limiter", limiter)
+    monkeypatch.setattr(rate_limiter.time, "sleep", waits.append)
+    fake = resend_batch()
+
+    results = email_utils.send_email_batch(_emails(email_utils.RESEND_BATCH_LIMIT, domain="gmail.com"))
+
+    assert results == [True] * email_utils.RESEND_BATCH_LIMIT
+    assert len(fake.chunks) == 1
+    assert waits == []
+    assert not any(kind == "email_domain" for kind, _ in limiter._buckets)
+
+
+def test_single_sends_keep_the_per_domain_pacing(limiter, monkeypatch):
+    monkeypatch.setattr(email_utils.resend, "Emails", SimpleNamespace(send=lambda params: {"id": "x"}))
+
+    assert email_utils.send_email("someone@Gmail.com", "Welcome", "<p>hi</p>")
+    assert limiter.acquired == [("resend_api", email_utils.settings.RESEND_API_KEY), ("email_domain", "gmail.com")]
+
+
+def test_no_emails_means_no_requests(resend_batch, limiter):
+    fake = resend_batch()
+
+    assert email_utils.send_email_batch([]) == []
+    assert fake.chunks == [] and limiter.acquired == []
@@ -0,0 +1,76 @@
+# tests/test_event_cursor.py
+
+import base64
+from datetime import datetime, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from api.app.crud import decode_event_cursor, encode_event_cursor
+
+CREATED_AT = datetime(2026, 10, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+
+
+def _event(**overrides):
+    fields = {
+        "id": 42,
+        "created_at": CREATED_AT,
+        "amount": Decimal("123456789.123456789012345678"),
+        "usd_value": Decimal("98765.4321"),
+        "block_number": 20_000_123,
+    }
+    fields.update(overrides)
+    return SimpleNamespace(**fields)
+
+
+@pytest.mark.parametrize("sort_by, expected", [
+    ("created_at", CREATED_AT),
+    ("amount", Decimal("123456789.123456789012345678")),
+    ("usd_value", Decimal("98765.4321")),
+    ("block_number", 20_000_123),
+])
+def test_cursor_round_trips_every_sort_key(sort_by, expected):
+    cursor = encode_event_cursor(_event(), sort_by, "desc")
+
+    assert decode_event_cursor(cursor, sort_by, "desc") == (expected, CREATED_AT, 42)
+
+
+def test_missing_usd_value_matches_the_coalesced_sort_key():
+    cursor = encode_event_cursor(_event(usd_value=None), "usd_value", "asc")
+
+    assert decode_event_cursor(cursor, "usd_value", "asc")[0] == Decimal("-1")
+
+
+def test_cursor_is_url_safe_without_padding():
+    for event_id in range(1, 50):
+        cursor = encode_event_cursor(_event(id=event_id), "amount", "desc")
+        assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+
+
+@pytest.mark.parametrize("sort_by, sort_order", [("amount", "desc"), ("created_at", "asc")])
+def test_cursor_from_a_different_sort_is_rejected(sort_by, sort_order):
+    cursor = encode_event_cursor(_event(), "created_at", "desc")
+
+    with pytest.raises(HTTPException) as exc_info:
+        decode_event_cursor(cursor, sort_by, sort_order)
+    assert exc_info.value.status_code == 400
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("cursor, sort_by", [
+    ("", "created_at"),
+    ("not-a-cursor", "created_at"),
+    (_b64(b"[1, 2, 3]"), "created_at"),
+    (_b64(b'{"s": "created_at", "o": "desc"}'), "created_at"),
+    (_b64(b'{"s": "amount", "o": "desc", "v": "abc", "t": "2026-10-01T12:30:15+00:00", "i": 1}'), "amount"),
+    (_b64(b'{"s": "created_at", "o": "desc", "v": "x", "t": "yesterday", "i": 1}'), "created_at"),
+])
+def test_malformed_cursors_are_a_400(cursor, sort_by):
+    with pytest.raises(HTTPException) as exc_info:
+        decode_event_cursor(cursor, sort_by, "desc")
+    assert exc_info.value.status_code == 400
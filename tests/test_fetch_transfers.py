@@ -0,0 +1,93 @@
+# tests/test_fetch_transfers.py
+
+import pytest
+
+from api.app import watcher
+from api.app.watcher import TransferFetchError, fetch_transfers
+
+CONTRACT = "0xdAC17F958D2ee523a2206206994597C13D831ec7"
+
+
+class _FakeEtherscan:
+    """Pagina las transferencias como tokentx (orden ascendente, page * offset <= ventana máxima)."""
+
+    def __init__(self, blocks, fail_on_call=None):
+        self.transfers = [{"blockNumber": str(block), "hash": f"0x{index:02x}"} for index, block in enumerate(blocks)]
+        self.fail_on_call = fail_on_call
+        self.calls = []
+
+    def __call__(self, contract_address, start_block, end_block, page, page_size):
+        self.calls.append((start_block, end_block, page))
+        if self.fail_on_call == len(self.calls):
+            raise TransferFetchError("Etherscan respondió 'NOTOK'")
+        assert page * page_size <= watcher.ETHERSCAN_MAX_RESULT_WINDOW
+        matching = [tx for tx in self.transfers if start_block <= int(tx["blockNumber"]) <= end_block]
+        return matching[(page - 1) * page_size:page * page_size]
+
+
+@pytest.fixture
+def etherscan(monkeypatch):
+    def install(blocks, page_size=2, max_result_window=6, block_range=100, **kwargs):
+        fake = _FakeEtherscan(blocks, **kwargs)
+        monkeypatch.setattr(watcher, "_request_transfer_page", fake)
+        monkeypatch.setattr(watcher, "ETHERSCAN_MAX_RESULT_WINDOW", max_result_window)
+        monkeypatch.setattr(watcher.settings, "ETHERSCAN_PAGE_SIZE", page_size)
+        monkeypatch.setattr(watcher.settings, "MAX_BLOCK_RANGE", block_range)
+        return fake
+    return install
+
+
+def _hashes(transfers):
+    return [tx["hash"] for tx in transfers]
+
+
+def test_scans_bounded_windows_in_order(etherscan):
+    fake = etherscan([5, 120, 250, 251], page_size=10, max_result_window=100)
+
+    transfers = list(fetch_transfers(CONTRACT, 0, 250))
+
+    assert _hashes(transfers) == ["0x00", "0x01", "0x02"]
+    assert [call[:2] for call in fake.calls] == [(0, 99), (100, 199), (200, 250)]
+
+
+def test_pages_each_window_until_a_short_page(etherscan):
+    fake = etherscan([1, 2, 3, 4, 5])
+
+    assert _hashes(fetch_transfers(CONTRACT, 0, 50)) == ["0x00", "0x01", "0x02", "0x03", "0x04"]
+    assert fake.calls == [(0, 50, 1), (0, 50, 2), (0, 50, 3)]
+
+
+def test_open_ended_scan_uses_a_single_window(etherscan):
+    fake = etherscan([10, 20], page_size=10, max_result_window=100)
+
+    assert _hashes(fetch_transfers(CONTRACT, 10)) == ["0x00", "0x01"]
+    assert fake.calls == [(10, watcher.ETHERSCAN_OPEN_END_BLOCK, 1)]
+
+
+def test_resumes_past_the_result_window_without_duplicates(etherscan):
+    # Bloque 3 con cinco transferencias repartidas entre el final de la primera pasada y la reanudación.
+    blocks = [1, 2, 3, 3, 3, 3, 3, 4]
+    fake = etherscan(blocks)
+
+    transfers = list(fetch_transfers(CONTRACT, 0, 50))
+
+    assert _hashes(transfers) == [f"0x{index:02x}" for index in range(len(blocks))]
+    assert (3, 50, 1) in fake.calls and (4, 50, 1) in fake.calls
+
+
+def test_block_larger_than_the_result_window_is_truncated(etherscan):
+    etherscan([7] * 8 + [8])
+
+    transfers = list(fetch_transfers(CONTRACT, 0, 50))
+
+    assert [tx["blockNumber"] for tx in transfers] == ["7"] * 6 + ["8"]
+    assert len(set(_hashes(transfers))) == len(transfers)
+
+
+def test_failure_mid_scan_keeps_what_was_already_yielded(etherscan):
+    etherscan([5, 150], page_size=10, max_result_window=100, fail_on_call=2)
+    scan = fetch_transfers(CONTRACT, 0, 199)
+
+    assert next(scan)["hash"] == "0x00"
+    with pytest.raises(TransferFetchError):
+        next(scan)
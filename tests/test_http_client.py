@@ -0,0 +1,89 @@
+# tests/test_http_client.py
+
+import pytest
+import requests
+
+from api.app.clients import http_client
+
+
+class _CountingBudget:
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self, tokens=1.0):
+        self.acquired += 1
+        return 0.0
+
+
+class _FakeSession:
+    """Devuelve (o lanza) los resultados indicados, uno por intento."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        response = requests.Response()
+        response.status_code = outcome
+        return response
+
+
+@pytest.fixture(autouse=True)
+def _no_sleep(monkeypatch):
+    monkeypatch.setattr(http_client.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(http_client.settings, "HTTP_MAX_RETRIES", 2)
+
+
+def test_every_retry_consumes_a_budget_token(monkeypatch):
+    session = _FakeSession([503, 502, 200])
+    monkeypatch.setattr(http_client, "_budgeted_session", session)
+    budget = _CountingBudget()
+
+    response = http_client.get("https://api.etherscan.test/api", budget=budget)
+
+    assert response.status_code == 200
+    assert session.calls == 3
+    assert budget.acquired == 3
+
+
+def test_gives_up_after_max_retries_and_returns_last_response(monkeypatch):
+    session = _FakeSession([503, 503, 503, 200])
+    monkeypatch.setattr(http_client, "_budgeted_session", session)
+    budget = _CountingBudget()
+
+    response = http_client.get("https://api.etherscan.test/api", budget=budget)
+
+    assert response.status_code == 503
+    assert session.calls == 3
+    assert budget.acquired == 3
+
+
+def test_read_errors_are_retried_for_get(monkeypatch):
+    session = _FakeSession([requests.exceptions.ReadTimeout(), 200])
+    monkeypatch.setattr(http_client, "_budgeted_session", session)
+    budget = _CountingBudget()
+
+    assert http_client.get("https://api.coingecko.test/api", budget=budget).status_code == 200
+    assert budget.acquired == 2
+
+
+def test_post_is_not_retried_on_read_errors(monkeypatch):
+    session = _FakeSession([requests.exceptions.ReadTimeout(), 200])
+    monkeypatch.setattr(http_client, "_budgeted_session", session)
+    budget = _CountingBudget()
+
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        http_client.post("https://api.telegram.test/send", budget=budget)
+    assert session.calls == 1
+
+
+def test_retry_after_header_is_respected():
+    response = requests.Response()
+    response.status_code = 503
+    response.headers["Retry-After"] = "7"
+    assert http_client._retry_delay(1, response) == 7.0
+    assert http_client._retry_delay(3) == http_client.RETRY_BACKOFF_FACTOR * 4
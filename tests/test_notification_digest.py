@@ -0,0 +1,87 @@
+# tests/test_notification_digest.py
+
+from datetime import datetime, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+from api.app import notifier
+from api.app.notification_worker import coalesce_digests
+
+DIGEST_CONFIG = {"url": "https://hooks.slack.test/shared", "digest_window_seconds": 300}
+
+
+def _item(item_id, owner_id, watcher_name, config=DIGEST_CONFIG, block_number=1, token_address="0xabc"):
+    return {
+        "id": item_id,
+        "watcher_id": item_id,
+        "transport_type": "slack",
+        "transport_config": dict(config),
+        "attempts": 0,
+        "payload": {
+            "watcher": {"id": item_id, "name": watcher_name, "token_address": token_address, "owner_id": owner_id},
+            "events": [{"block_number": block_number, "log_index": 0}],
+        },
+    }
+
+
+def test_same_owner_same_destination_is_merged():
+    merged = coalesce_digests([_item(1, 10, "USDT", block_number=2), _item(2, 10, "USDC", block_number=1)])
+    assert len(merged) == 1
+    assert merged[0]["ids"] == [1, 2]
+    assert merged[0]["payload"]["watcher"]["name"] == "USDT, USDC"
+    assert [event["block_number"] for event in merged[0]["payload"]["events"]] == [1, 2]
+
+
+def test_different_owners_sharing_a_destination_are_not_merged():
+    merged = coalesce_digests([_item(1, 10, "USDT"), _item(2, 20, "Mine")])
+    assert len(merged) == 2
+    assert [item["ids"] for item in merged] == [[1], [2]]
+    assert [item["payload"]["watcher"]["name"] for item in merged] == ["USDT", "Mine"]
+
+
+def test_rows_without_owner_are_never_merged():
+    merged = coalesce_digests([_item(1, None, "USDT"), _item(2, None, "USDC")])
+    assert [item["ids"] for item in merged] == [[1], [2]]
+
+
+def test_rows_without_digest_window_are_sent_individually():
+    config = {"url": "https://hooks.slack.test/shared"}
+    merged = coalesce_digests([_item(1, 10, "USDT", config=config), _item(2, 10, "USDC", config=config)])
+    assert [item["ids"] for item in merged] == [[1], [2]]
+
+
+def test_single_token_digest_keeps_the_watcher_token():
+    merged = coalesce_digests([_item(1, 10, "Whales", token_address="0xABC"), _item(2, 10, "Sharks", token_address="0xabc")])
+    assert merged[0]["payload"]["watcher"]["token_address"] == "0xABC"
+
+
+def test_multi_token_digest_drops_the_watcher_token():
+    merged = coalesce_digests([
+        _item(1, 10, "USDT", token_address="0xusdt"),
+        _item(2, 10, "USDC", token_address="0xusdc"),
+        _item(3, 10, "USDT again", token_address="0xusdt"),
+    ])
+    assert merged[0]["payload"]["watcher"]["token_address"] is None
+
+
+def _event(token_address_observed):
+    return SimpleNamespace(
+        token_address_observed=token_address_observed, amount=Decimal("1500000"), block_number=1,
+        transaction_hash="0x" + "ab" * 32, created_at=datetime(2026, 10, 1, tzinfo=timezone.utc),
+    )
+
+
+def test_multi_token_digest_shows_each_events_own_token(monkeypatch):
+    sent = []
+    monkeypatch.setattr(notifier, "_post_webhook", lambda kind, url, payload, label, watcher_id, wait=True: sent.append(payload) or True)
+    watcher = SimpleNamespace(id=1, name="USDT, USDC", token_address=None)
+    events = [_event("0xusdt"), _event("0xusdc")]
+
+    notifier.notify_slack_blockkit("https://hooks.slack.test/shared", watcher, events)
+    notifier.notify_discord_embed("https://discord.test/api/webhooks/shared", watcher, events)
+
+    slack_fields = [block["fields"][0]["text"] for block in sent[0]["blocks"] if block["type"] == "section"]
+    assert slack_fields == ["*Token Address:*\n`0xusdt`", "*Token Address:*\n`0xusdc`"]
+    discord_fields = [embed["fields"][0] for embed in sent[1]["embeds"]]
+    assert [(field["name"], field["value"]) for field in discord_fields] == [("Token Address", "`0xusdt`"), ("Token Address", "`0xusdc`")]
+    assert "Actual Token (Event)" not in str(sent)
@@ -0,0 +1,163 @@
+# tests/test_notification_throttling.py
+
+from types import SimpleNamespace
+
+import pytest
+
+from api.app import notification_worker, notifier, rate_limiter
+from api.app.clients import http_client, telegram_client
+from api.app.rate_limiter import DESTINATION_LIMITS, DestinationThrottled, KeyedRateLimiter
+
+SLACK_A = "https://hooks.slack.test/a"
+SLACK_B = "https://hooks.slack.test/b"
+
+
+def _response(status_code=200, body=None, headers=None):
+    return SimpleNamespace(
+        status_code=status_code, headers=headers or {}, json=lambda: body or {"ok": True}, raise_for_status=lambda: None,
+    )
+
+
+class _FakeClock:
+    def __init__(self, allow_sleep=False):
+        self.now = 1000.0
+        self.allow_sleep = allow_sleep
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if not self.allow_sleep:
+            raise AssertionError(f"el worker durmió {seconds:.2f}s")
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _install_limiter(monkeypatch, clock):
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    fresh = KeyedRateLimiter(DESTINATION_LIMITS)
+    monkeypatch.setattr(notifier, "notification_limiter", fresh)
+    monkeypatch.setattr(telegram_client, "notification_limiter", fresh)
+    return fresh
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """Limitador real con los límites de producción; cualquier espera hace fallar el test."""
+    return _install_limiter(monkeypatch, _FakeClock())
+
+
+@pytest.fixture
+def posts(monkeypatch):
+    sent = []
+
+    def fake_post(url, json=None, **kwargs):
+        sent.append((url, json))
+        return _response()
+    monkeypatch.setattr(http_client, "post", fake_post)
+    return sent
+
+
+class _FakeOutbox:
+    """Sustituye a las funciones de outbox de crud y registra qué se hace con cada fila."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.sent, self.failed, self.deferred = [], [], []
+
+    def claim_outbox_batch(self, db, transport_type, limit, lease_seconds):
+        return self.rows
+
+    def mark_outbox_sent(self, db, outbox_id):
+        self.sent.append(outbox_id)
+
+    def mark_outbox_failed(self, db, outbox_id, error, retry_in_seconds):
+        self.failed.append(outbox_id)
+
+    def defer_outbox(self, db, outbox_id, retry_in_seconds, payload=None):
+        self.deferred.append((outbox_id, retry_in_seconds, payload))
+
+
+def _event(event_id):
+    return {
+        "id": event_id, "watcher_id": 1, "token_address_observed": "0xabc", "from_address": "0x1", "to_address": "0x2",
+        "amount": 1500000.0, "transaction_hash": f"0x{event_id:064x}", "log_index": 0, "block_number": 100 + event_id,
+        "usd_value": 1500000.0, "token_name": "Tether", "token_symbol": "USDT", "created_at": "2026-10-01T12:00:00+00:00",
+    }
+
+
+def _row(outbox_id, transport_type, config, event_count=1):
+    return {
+        "id": outbox_id, "watcher_id": 1, "transport_type": transport_type, "transport_config": config, "attempts": 1,
+        "payload": {
+            "watcher": {"id": 1, "name": "USDT whales", "token_address": "0xabc", "owner_id": 10},
+            "events": [_event(outbox_id * 100 + index) for index in range(event_count)],
+        },
+    }
+
+
+def test_try_acquire_never_waits_and_only_consumes_when_available(limiter):
+    assert limiter.try_acquire("slack_webhook", SLACK_A) == 0.0
+    assert limiter.try_acquire("slack_webhook", SLACK_A) > 0
+    limiter.penalize("slack_webhook", SLACK_B, 30)
+    assert limiter.try_acquire("slack_webhook", SLACK_B) == pytest.approx(31.0)
+
+
+def test_non_blocking_webhook_raises_instead_of_sleeping(limiter, posts):
+    limiter.penalize("slack_webhook", SLACK_A, 30)
+
+    with pytest.raises(DestinationThrottled) as exc_info:
+        notifier._post_webhook("slack_webhook", SLACK_A, {"text": "x"}, "Slack", 1, wait=False)
+    assert exc_info.value.retry_after == pytest.approx(31.0)
+    assert posts == []
+
+
+def test_non_blocking_webhook_429_penalizes_and_raises(limiter, monkeypatch):
+    monkeypatch.setattr(http_client, "post", lambda url, **kwargs: _response(429, headers={"Retry-After": "12"}))
+
+    with pytest.raises(DestinationThrottled) as exc_info:
+        notifier._post_webhook("discord_webhook", SLACK_A, {}, "Discord", 1, wait=False)
+    assert exc_info.value.retry_after == 12.0
+    assert limiter.try_acquire("discord_webhook", SLACK_A) > 11
+
+
+def test_throttled_destination_does_not_hold_up_the_others(limiter, posts, monkeypatch):
+    limiter.penalize("slack_webhook", SLACK_A, 30)
+    outbox = _FakeOutbox([_row(1, "slack", {"url": SLACK_A}), _row(2, "slack", {"url": SLACK_A}), _row(3, "slack", {"url": SLACK_B})])
+    monkeypatch.setattr(notification_worker, "crud", outbox)
+
+    notification_worker.process_batch(db=None, transport_type="slack")
+
+    assert [url for url, _ in posts] == [SLACK_B]
+    assert outbox.sent == [3]
+    assert [(outbox_id, payload) for outbox_id, _, payload in outbox.deferred] == [(1, None), (2, None)]
+    assert all(delay == pytest.approx(31.0) for _, delay, _ in outbox.deferred)
+    assert outbox.failed == []
+
+
+def test_partially_sent_telegram_alert_keeps_only_the_pending_events(limiter, posts, monkeypatch):
+    # 60 eventos no caben en un mensaje y el chat privado admite uno por segundo: la primera parte
+    # sale, la segunda encuentra el bucket vacío y la fila se reprograma con los eventos restantes.
+    row = _row(1, "telegram", {"bot_token": "123:abc", "chat_id": "42"}, event_count=60)
+    outbox = _FakeOutbox([row])
+    monkeypatch.setattr(notification_worker, "crud", outbox)
+
+    notification_worker.process_batch(db=None, transport_type="telegram")
+
+    assert len(posts) == 1
+    first_part_events = posts[0][1]["text"].count("View Transaction on Etherscan")
+    [(outbox_id, delay, payload)] = outbox.deferred
+    assert outbox_id == 1 and 0 < delay <= 1.0
+    assert [event["id"] for event in payload["events"]] == [event["id"] for event in row["payload"]["events"][first_part_events:]]
+    assert outbox.sent == [] and outbox.failed == []
+
+
+def test_blocking_mode_is_kept_for_synchronous_callers(monkeypatch, posts):
+    clock = _FakeClock(allow_sleep=True)
+    blocking_limiter = _install_limiter(monkeypatch, clock)
+    blocking_limiter.penalize("slack_webhook", SLACK_A, 5)
+
+    assert notifier._post_webhook("slack_webhook", SLACK_A, {"text": "x"}, "Slack", 1)
+    assert sum(clock.sleeps) == pytest.approx(6.0)
+    assert len(posts) == 1
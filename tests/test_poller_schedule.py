@@ -0,0 +1,145 @@
+# tests/test_poller_schedule.py
+
+import pytest
+
+from api.app import poller
+from api.app.poller import TokenSchedule
+
+
+@pytest.fixture
+def no_jitter(monkeypatch):
+    # uniform(a, b) -> a: sin jitter en record_success/record_failure y alta de contratos en `now`.
+    monkeypatch.setattr(poller.random, "uniform", lambda low, high: low if low >= 0 else 0.0)
+
+
+def test_new_tokens_are_spread_over_the_first_interval():
+    schedule = TokenSchedule(interval=60, jitter_ratio=0.1, backoff_max=600)
+    schedule.sync(range(200), now=1000.0)
+
+    due_times = list(schedule.next_due.values())
+    assert all(1000.0 <= due_at <= 1060.0 for due_at in due_times)
+    assert len(set(round(due_at) for due_at in due_times)) > 10
+
+
+def test_sync_forgets_tokens_without_active_watchers(no_jitter):
+    schedule = TokenSchedule(interval=60, jitter_ratio=0.1, backoff_max=600)
+    schedule.sync([1, 2], now=1000.0)
+    schedule.record_failure(2, now=1000.0)
+    schedule.sync([1], now=1001.0)
+
+    assert list(schedule.next_due) == [1]
+    assert schedule.backing_off() == 0
+
+
+def test_success_advances_from_previous_due_time_without_drift(no_jitter):
+    schedule = TokenSchedule(interval=60, jitter_ratio=0.1, backoff_max=600)
+    schedule.sync([1], now=1000.0)
+
+    schedule.record_success(1, now=1005.0)  # el ciclo terminó 5 s tarde
+    assert schedule.next_due[1] == 1060.0
+    assert schedule.due(1059.0) == []
+    assert schedule.due(1060.0) == [1]
+
+
+def test_overrun_cycle_reschedules_from_now(no_jitter):
+    schedule = TokenSchedule(interval=60, jitter_ratio=0.1, backoff_max=600)
+    schedule.sync([1], now=1000.0)
+
+    schedule.record_success(1, now=1200.0)
+    assert schedule.next_due[1] == 1200.0
+
+
+def test_success_jitter_stays_within_ratio():
+    schedule = TokenSchedule(interval=60, jitter_ratio=0.1, backoff_max=600)
+    schedule.sync([1], now=1000.0)
+    for _ in range(100):
+        previous = schedule.next_due[1]
+        schedule.record_success(1, now=previous)
+        assert previous + 54.0 <= schedule.next_due[1] <= previous + 66.0
+
+
+def test_failures_back_off_exponentially_up_to_the_cap(no_jitter):
+    schedule = TokenSchedule(interval=60, jitter_ratio=0.1, backoff_max=600)
+    schedule.sync([1], now=1000.0)
+
+    delays = [schedule.record_failure(1, now=1000.0) for _ in range(5)]
+    assert delays == [120.0, 240.0, 480.0, 600.0, 600.0]
+    assert schedule.next_due[1] == 1600.0
+    assert schedule.backing_off() == 1
+
+
+def test_backoff_jitter_only_lengthens_the_delay():
+    schedule = TokenSchedule(interval=60, jitter_ratio=0.25, backoff_max=10_000)
+    for _ in range(50):
+        schedule.failures.clear()
+        assert 120.0 <= schedule.record_failure(1, now=0.0) <= 150.0
+
+
+def test_success_after_failures_resets_backoff(no_jitter):
+    schedule = TokenSchedule(interval=60, jitter_ratio=0.1, backoff_max=600)
+    schedule.sync([1], now=1000.0)
+    schedule.record_failure(1, now=1000.0)
+    schedule.record_failure(1, now=1000.0)
+
+    schedule.record_success(1, now=1240.0)
+    assert schedule.backing_off() == 0
+    assert schedule.record_failure(1, now=1300.0) == 120.0
+
+
+def test_backoff_cap_is_never_below_the_interval():
+    schedule = TokenSchedule(interval=300, jitter_ratio=0.0, backoff_max=60)
+    assert schedule.backoff_max == 300.0
+    assert schedule.record_failure(1, now=0.0) == 300.0
+
+
+class _FakeDb:
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_tick(monkeypatch, no_jitter):
+    """run_tick con crud y poll_and_notify falsos; devuelve los ids de watchers sondeados en cada ciclo."""
+    clock = {"now": 1000.0}
+    state = {"groups": {"0xaaa": [1, 3], "0xbbb": [2]}, "failed": [], "cycles": []}
+
+    def fake_poll_and_notify(db, get_active_watchers_func):
+        state["cycles"].append(sorted(get_active_watchers_func()))
+        return {"failed_watcher_ids": list(state["failed"]), "events_created": 0}
+
+    monkeypatch.setattr(poller, "SessionLocal", _FakeDb)
+    monkeypatch.setattr(poller.time, "monotonic", lambda: clock["now"])
+    monkeypatch.setattr(poller.crud, "get_active_watcher_ids_by_token", lambda db: state["groups"])
+    monkeypatch.setattr(poller.crud, "get_active_watchers_by_ids", lambda db, ids: list(ids))
+    monkeypatch.setattr(poller, "poll_and_notify", fake_poll_and_notify)
+    return clock, state
+
+
+def test_watchers_of_one_token_are_polled_together_once_per_interval(fake_tick):
+    clock, state = fake_tick
+    schedule = poller.TokenSchedule(interval=60, jitter_ratio=0.1, backoff_max=600)
+    metrics = poller.PollerMetrics()
+
+    for tick in range(int(120 / 5) + 1):
+        clock["now"] = 1000.0 + tick * 5
+        poller.run_tick(schedule, metrics)
+
+    # Sin jitter ambos contratos vencen en t=1000, 1060 y 1120: un ciclo por intervalo con todos sus watchers.
+    assert state["cycles"] == [[1, 2, 3], [1, 2, 3], [1, 2, 3]]
+    assert metrics.watchers_scheduled == 3
+
+
+def test_failed_watcher_backs_off_its_whole_token(fake_tick):
+    clock, state = fake_tick
+    schedule = poller.TokenSchedule(interval=60, jitter_ratio=0.1, backoff_max=600)
+    metrics = poller.PollerMetrics()
+
+    state["failed"] = [3]
+    poller.run_tick(schedule, metrics)
+    assert schedule.next_due == {"0xaaa": 1120.0, "0xbbb": 1060.0}
+    assert metrics.watchers_backing_off == 2
+
+    state["failed"] = []
+    clock["now"] = 1060.0
+    poller.run_tick(schedule, metrics)
+    assert state["cycles"][-1] == [2]
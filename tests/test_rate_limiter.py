@@ -0,0 +1,94 @@
+# tests/test_rate_limiter.py
+
+import pytest
+
+from api.app import rate_limiter
+from api.app.rate_limiter import KeyedRateLimiter, TokenBucket
+
+
+class _FakeClock:
+    """Sustituye a time en rate_limiter: sleep avanza el reloj en lugar de esperar."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", fake)
+    return fake
+
+
+def test_burst_up_to_capacity_then_paced_at_rate(clock):
+    bucket = TokenBucket(rate=2.0, capacity=3)
+
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert clock.now == pytest.approx(1001.0)
+
+
+def test_tokens_refill_while_idle_but_not_above_capacity(clock):
+    bucket = TokenBucket(rate=1.0, capacity=2)
+    bucket.acquire()
+    bucket.acquire()
+
+    clock.now += 60
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(1.0)
+
+
+def test_zero_rate_never_blocks(clock):
+    bucket = TokenBucket(rate=0, capacity=1)
+    assert [bucket.acquire() for _ in range(5)] == [0.0] * 5
+    assert clock.sleeps == []
+
+
+def test_block_for_pauses_and_resumes_without_burst(clock):
+    bucket = TokenBucket(rate=1.0, capacity=5)
+    bucket.block_for(10)
+
+    assert bucket.acquire() == pytest.approx(11.0)
+    assert clock.now == pytest.approx(1011.0)
+    assert bucket.acquire() == pytest.approx(1.0)
+
+
+def test_keyed_limiter_keeps_one_bucket_per_destination(clock):
+    limiter = KeyedRateLimiter({"slack_webhook": (1.0, 1)})
+
+    assert limiter.acquire("slack_webhook", "https://hooks.slack.test/a") == 0.0
+    assert limiter.acquire("slack_webhook", "https://hooks.slack.test/b") == 0.0
+    assert limiter.acquire("slack_webhook", "https://hooks.slack.test/a") == pytest.approx(1.0)
+
+
+def test_keyed_limiter_penalize_only_affects_that_destination(clock):
+    limiter = KeyedRateLimiter({"telegram_chat": (1.0, 1)})
+    limiter.penalize("telegram_chat", 42, 30)
+
+    assert limiter.acquire("telegram_chat", 7) == 0.0
+    assert limiter.acquire("telegram_chat", 42) == pytest.approx(31.0)
+
+
+def test_keyed_limiter_evicts_least_recently_used_buckets(clock):
+    limiter = KeyedRateLimiter({"email_domain": (1.0, 1)}, max_keys=2)
+    limiter.acquire("email_domain", "a.test")
+    limiter.acquire("email_domain", "b.test")
+    limiter.acquire("email_domain", "a.test")  # a.test pasa a ser el más reciente
+    limiter.acquire("email_domain", "c.test")
+
+    assert list(limiter._buckets) == [("email_domain", "a.test"), ("email_domain", "c.test")]
+
+
+def test_unknown_destination_kind_is_rejected(clock):
+    with pytest.raises(KeyError):
+        KeyedRateLimiter({}).acquire("pager", "x")
@@ -0,0 +1,87 @@
+# tests/test_telegram_messages.py
+
+from decimal import Decimal
+from types import SimpleNamespace
+
+from api.app.notifier import TELEGRAM_MAX_MESSAGE_LENGTH, render_telegram_messages
+
+
+def _utf16_length(text):
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _event(index, symbol="USDT"):
+    return SimpleNamespace(
+        amount=Decimal("1250000.5") + index,
+        token_symbol=symbol,
+        usd_value=Decimal("1250000.5") + index,
+        from_address=f"0x{index:040x}",
+        to_address=f"0x{index + 1:040x}",
+        transaction_hash=f"0x{index:064x}",
+    )
+
+
+def _hashes_in_order(messages, count):
+    text = "".join(messages)
+    positions = [text.find(f"0x{index:064x}") for index in range(count)]
+    assert all(position >= 0 for position in positions)
+    return positions == sorted(positions)
+
+
+def test_single_event_is_one_message():
+    messages = render_telegram_messages("USDT whales", [_event(0)])
+    assert len(messages) == 1
+    assert "A significant transfer has been detected" in messages[0]
+
+
+def test_events_that_fit_share_one_message_without_part_suffix():
+    messages = render_telegram_messages("USDT whales", [_event(index) for index in range(5)])
+    assert len(messages) == 1
+    assert "5 significant transfers have been detected" in messages[0]
+    assert "\\(1/1\\)" not in messages[0]
+    assert _hashes_in_order(messages, 5)
+
+
+def test_large_batches_are_split_within_the_limit():
+    events = [_event(index) for index in range(60)]
+    messages = render_telegram_messages("USDT whales", events)
+
+    assert len(messages) > 1
+    assert all(_utf16_length(message) <= TELEGRAM_MAX_MESSAGE_LENGTH for message in messages)
+    for part, message in enumerate(messages, start=1):
+        assert f"\\({part}/{len(messages)}\\)" in message
+    assert sum(message.count("View Transaction on Etherscan") for message in messages) == 60
+    assert _hashes_in_order(messages, 60)
+
+
+def test_each_part_header_counts_its_own_events():
+    messages = render_telegram_messages("USDT whales", [_event(index) for index in range(60)])
+
+    first = 1
+    for message in messages:
+        last = first + message.count("View Transaction on Etherscan") - 1
+        assert f"Significant transfers {first}–{last} of 60:" in message
+        first = last + 1
+    assert first == 61
+    assert not any("60 significant transfers" in message for message in messages)
+
+
+def test_split_fills_each_message_before_starting_the_next():
+    messages = render_telegram_messages("USDT whales", [_event(index) for index in range(60)])
+    per_message = [message.count("View Transaction on Etherscan") for message in messages]
+
+    assert all(count == per_message[0] for count in per_message[:-1])
+    assert per_message[-1] <= per_message[0]
+    # Un evento más no habría cabido en el primer mensaje.
+    entry_length = _utf16_length(messages[0]) // per_message[0]
+    assert _utf16_length(messages[0]) + entry_length > TELEGRAM_MAX_MESSAGE_LENGTH - 100
+
+
+def test_limit_is_measured_in_utf16_units():
+    # Los emoji fuera del BMP cuentan como 2 unidades UTF-16 aunque len() los cuente como 1.
+    events = [_event(index, symbol="🚀🚀🚀🚀🚀🚀🚀🚀") for index in range(60)]
+    messages = render_telegram_messages("🐋 whales 🐋", events)
+
+    assert all(_utf16_length(message) <= TELEGRAM_MAX_MESSAGE_LENGTH for message in messages)
+    assert any(_utf16_length(message) > len(message) for message in messages)
+    assert sum(message.count("View Transaction on Etherscan") for message in messages) == 60
@@ -0,0 +1,140 @@
+# tests/test_watcher_cursor.py
+
+from types import SimpleNamespace
+
+import pytest
+
+from api.app import watcher
+from api.app.watcher import TransferFetchError
+
+TOKEN = "0xdac17f958d2ee523a2206206994597c13d831ec7"
+
+
+def _tx(block, tokens, tx_hash=None):
+    return {
+        "blockNumber": str(block), "value": str(tokens * 10**6), "tokenDecimal": "6",
+        "hash": tx_hash or f"0x{block:064x}", "timeStamp": "1760000000",
+    }
+
+
+def _watcher(watcher_id, start_block, threshold=100):
+    return SimpleNamespace(id=watcher_id, start_block=start_block, threshold=threshold)
+
+
+@pytest.fixture
+def transfers(monkeypatch):
+    """Sustituye fetch_transfers por una lista fija; un TransferFetchError en la lista se lanza al llegar a él."""
+    def install(items):
+        def fake_fetch_transfers(token_address, start_block, end_block=None):
+            for item in items:
+                if isinstance(item, Exception):
+                    raise item
+                if int(item["blockNumber"]) >= start_block:
+                    yield item
+        monkeypatch.setattr(watcher, "fetch_transfers", fake_fetch_transfers)
+    monkeypatch.setattr(watcher, "_historical_unit_prices", lambda token_address, timestamps: {})
+    monkeypatch.setattr(watcher, "_resolve_token_price", lambda token_address, future: 1.0)
+    return install
+
+
+def _blocks(watcher_matches):
+    return [int(tx["blockNumber"]) for tx, _, _, _ in watcher_matches]
+
+
+def test_complete_scan_reaches_the_chain_head(transfers):
+    transfers([_tx(100, 500), _tx(101, 50)])
+
+    matches, scanned_through, failed = watcher._fetch_token_activity(TOKEN, [_watcher(1, 100)], chain_head=120)
+
+    assert (scanned_through, failed) == (120, False)
+    assert _blocks(matches[1]) == [100]
+
+
+def test_open_ended_scan_stops_at_the_last_seen_block(transfers):
+    transfers([_tx(100, 500), _tx(104, 500)])
+
+    _, scanned_through, _ = watcher._fetch_token_activity(TOKEN, [_watcher(1, 100)], chain_head=None)
+
+    assert scanned_through == 104
+
+
+def test_failed_scan_drops_the_possibly_incomplete_last_block(transfers):
+    transfers([_tx(100, 500), _tx(101, 500), _tx(102, 500), TransferFetchError("NOTOK")])
+
+    matches, scanned_through, failed = watcher._fetch_token_activity(TOKEN, [_watcher(1, 100)], chain_head=120)
+
+    assert (scanned_through, failed) == (101, True)
+    assert _blocks(matches[1]) == [100, 101]
+
+
+def test_shared_scan_applies_each_watchers_start_block_and_threshold(transfers):
+    transfers([_tx(100, 500), _tx(102, 500), _tx(103, 150)])
+    group = [_watcher(1, 100, threshold=100), _watcher(2, 102, threshold=200)]
+
+    matches, _, _ = watcher._fetch_token_activity(TOKEN, group, chain_head=110)
+
+    assert _blocks(matches[1]) == [100, 102, 103]
+    assert _blocks(matches[2]) == [102]
+
+
+def test_missing_log_index_uses_the_ordinal_within_the_transaction(transfers):
+    transfers([_tx(100, 500, "0xaa"), _tx(100, 500, "0xaa"), _tx(100, 500, "0xbb")])
+
+    matches, _, _ = watcher._fetch_token_activity(TOKEN, [_watcher(1, 100)], chain_head=110)
+
+    assert [log_index for _, _, log_index, _ in matches[1]] == [0, 1, 0]
+
+
+class _FakeSession:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def store(monkeypatch):
+    advanced = []
+    monkeypatch.setattr(watcher.crud, "create_events_bulk", lambda db, payloads, commit=False: [])
+    monkeypatch.setattr(watcher.crud, "enqueue_notifications", lambda db, watcher_obj, events: None)
+    monkeypatch.setattr(watcher.crud, "advance_watcher_cursor", lambda db, watcher_id, block: advanced.append((watcher_id, block)))
+    return advanced
+
+
+def test_cursor_advances_to_the_scanned_block(store):
+    db = _FakeSession()
+
+    assert watcher._store_watcher_scan(db, _watcher(1, 100), [], 150, None) == []
+    assert store == [(1, 150)]
+    assert db.commits == 1
+
+
+def test_cursor_stops_before_the_first_failed_transfer(store):
+    watcher._store_watcher_scan(_FakeSession(), _watcher(1, 100), [], 150, 120)
+
+    assert store == [(1, 119)]
+
+
+@pytest.mark.parametrize("scanned_through, first_failed", [(None, None), (99, None), (150, 100)])
+def test_cursor_never_moves_behind_the_start_block(store, scanned_through, first_failed):
+    db = _FakeSession()
+
+    assert watcher._store_watcher_scan(db, _watcher(1, 100), [], scanned_through, first_failed) == []
+    assert store == []
+    assert db.commits == 0
+
+
+def test_store_failure_rolls_back_events_and_cursor(store, monkeypatch):
+    def failing_bulk(db, payloads, commit=False):
+        raise RuntimeError("deadlock detected")
+    monkeypatch.setattr(watcher.crud, "create_events_bulk", failing_bulk)
+    db = _FakeSession()
+
+    assert watcher._store_watcher_scan(db, _watcher(1, 100), [object()], 150, None) is None
+    assert (db.commits, db.rollbacks) == (0, 1)
+    assert store == []